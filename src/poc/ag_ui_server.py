@@ -2,10 +2,14 @@ from fastapi import FastAPI
 from typing import List,TypedDict,Any,Optional,Dict
 from typing_extensions import NotRequired
 from .agents.supervisor import MyAgent,ChatState  # Import your agent definition
+from .agents.metrics import metrics
+from .agents.store_adapter import CachedStore
 # from .patched_langgraph_agent import PatchedLangGraphAgent as LangGraphAgent,add_langgraph_fastapi_endpoint
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
+from collections import OrderedDict
 from ag_ui.core import RunAgentInput, EventType
 from ag_ui.core.types import UserMessage
 from ag_ui.core.events import (
@@ -21,10 +25,14 @@ from langgraph.types import Command
 from fastapi import Request
 from fastapi import FastAPI, Request, Query
 from pydantic import  Field
+import asyncio
 import json
+import os
 import uuid
 import traceback
 from  .lg_ag_ui import LangGraphToAgUi
+from .run_coordinator import RunCoordinator,ThreadBusyError
+from .run_manager import RunManager,BackgroundRun
 import pickle 
 import tempfile
 from langchain_core import messages
@@ -36,6 +44,8 @@ class CommandType(TypedDict):
 class ForwardProps(TypedDict):
     command: NotRequired[Optional[CommandType]]=None
     user_id: str
+    run_policy: NotRequired[Optional[str]] # queue | reject | cancel, overrides RUN_POLICY for this run
+    last_known_message_id: NotRequired[Optional[str]] # delta mode: `messages` only holds the messages after this id (null for a new thread)
 class RunAgentInputExtended(RunAgentInput):
     forwarded_props: ForwardProps=Field(..., alias="forwardedProps")
 
@@ -49,6 +59,8 @@ async def lifespan(app: FastAPI):
         await my_agent_instance.init()
 
     app.state.my_agent = my_agent_instance
+    app.state.run_coordinator = RunCoordinator()
+    app.state.run_manager = RunManager()
     
     # agent = LangGraphAgent(
     #     name="fds_documentation_explorer",
@@ -70,6 +82,7 @@ async def lifespan(app: FastAPI):
     
     # Shutdown logic here
     print("🔒 Application shutdown cleanup")
+    await app.state.run_manager.close()
     if my_agent_instance:
         await my_agent_instance.close()
 
@@ -83,38 +96,209 @@ app.add_middleware(
     allow_headers=["*"],       # Allow all headers
 )
 
-def add_missing_ids(config:RunnableConfig,agent:MyAgent):
-    state=agent.get_state(config)
-    for msg in state["messages"]:
-        msg.id = msg.id or str(uuid.uuid4()) # !!! this is must ag-ui to work, every message must have an id
-    agent.set_state(config, state)
+state_cache:"OrderedDict[tuple,tuple[str,Any]]"=OrderedDict() # (thread_id, after, limit) -> (etag, encoded state)
+STATE_CACHE_SIZE=int(os.environ.get("STATE_CACHE_SIZE","256"))
+
+def page_messages(chat_messages:List[messages.BaseMessage], after:Optional[str], limit:Optional[int]) -> List[messages.BaseMessage]:
+    """Messages after the given message id (all of them when the id is not found)"""
+    start=0
+    if after:
+        for index in range(len(chat_messages)-1,-1,-1):
+            if chat_messages[index].id == after:
+                start=index+1
+                break
+    return chat_messages[start:start+limit] if limit is not None else chat_messages[start:]
 
 @app.get("/health")
 def health():
     """Health check."""
     return {"status": "ok"}
 
+@app.get("/metrics")
+def get_metrics():
+    """In-process metrics (plan cache, prompt cache, run coordination...)."""
+    snapshot=metrics.snapshot()
+    agent:MyAgent=app.state.my_agent
+    if agent.memory_worker:
+        snapshot["memory_worker"]=agent.memory_worker.stats()
+    if agent.memory_sweeper:
+        snapshot["memory_sweeper"]=agent.memory_sweeper.stats()
+    if isinstance(agent.store,CachedStore):
+        snapshot["store"]=agent.store.stats()
+    return snapshot
+
 @app.get("/state")
-def state(request: Request, thread_id: Optional[str] = Query(None, description="Thread ID for the conversation")) -> ChatState:
-    """State check."""
+async def state(
+    request: Request,
+    thread_id: Optional[str] = Query(None, description="Thread ID for the conversation"),
+    after: Optional[str] = Query(None, description="Return only the messages after this message id"),
+    limit: Optional[int] = Query(None, ge=1, description="Max number of messages (and messages_history) returned"),
+) -> ChatState:
+    """
+    Read only state of the thread, cursor paginated with `after`/`limit`.
+    The ETag is the latest checkpoint id + transcript cursor, an unchanged thread is answered with 304 (If-None-Match)
+    or from the in-process cache without loading the checkpoint.
+    """
     agent:MyAgent=app.state.my_agent
     if thread_id is None:
         raise ValueError("thread_id query parameter is required")
     config = {"configurable": {"thread_id": thread_id}}
-    add_missing_ids(config,agent)
-    return agent.get_state(config)
+    etag=f'"{await agent.astate_version(config)}"'
+    if request.headers.get("if-none-match") == etag:
+        metrics.incr("state.not_modified")
+        return Response(status_code=304, headers={"ETag": etag})
+
+    cache_key=(thread_id,after,limit)
+    cached=state_cache.get(cache_key)
+    if cached and cached[0] == etag:
+        state_cache.move_to_end(cache_key)
+        metrics.incr("state.cache_hits")
+        return JSONResponse(cached[1], headers={"ETag": etag})
+
+    chat_state=dict(await agent.aread_state(config))
+    all_messages=chat_state.get("messages",[])
+    chat_state["messages"]=page_messages(all_messages,after,limit)
+    chat_state["messages_history"]=await agent.aget_messages_history_page(config,after,limit) # kept in the transcript store, not in the graph state
+    chat_state["page"]={
+        "messages_total":len(all_messages),
+        "messages_after":chat_state["messages"][-1].id if chat_state["messages"] else after,
+        "messages_history_after":chat_state["messages_history"][-1].id if chat_state["messages_history"] else after,
+    }
+    encoded=jsonable_encoder(chat_state)
+    state_cache[cache_key]=(etag,encoded)
+    state_cache.move_to_end(cache_key)
+    while len(state_cache) > STATE_CACHE_SIZE:
+        state_cache.popitem(last=False)
+    metrics.incr("state.cache_misses")
+    return JSONResponse(encoded, headers={"ETag": etag})
 
 @app.get("/state_history")
-def state_history(request: Request, thread_id: Optional[str] = Query(None, description="Thread ID for the conversation")):
-    """State check."""
+async def state_history(
+    request: Request,
+    thread_id: Optional[str] = Query(None, description="Thread ID for the conversation"),
+    before: Optional[str] = Query(None, description="Return only the checkpoints older than this checkpoint id"),
+    limit: int = Query(20, ge=1, le=200, description="Max number of checkpoints returned"),
+    checkpoint_id: Optional[str] = Query(None, description="Return the full values of this single checkpoint"),
+):
+    """
+    Checkpoint history of the thread as a paginated projection (ids, step, node, next, created_at, message count, sizes).
+    Pass `checkpoint_id` to fetch the full snapshot of a single checkpoint.
+    """
     agent:MyAgent=app.state.my_agent
     if thread_id is None:
         raise ValueError("thread_id query parameter is required")
-    config = {"configurable": {"thread_id": thread_id}}
-    return agent.graph.get_state_history(config)
+    if checkpoint_id:
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_id": checkpoint_id}}
+        snapshot=await agent.graph.aget_state(config)
+        return JSONResponse(jsonable_encoder({
+            "checkpoint_id": checkpoint_id,
+            "values": snapshot.values,
+            "next": snapshot.next,
+            "metadata": snapshot.metadata,
+            "created_at": snapshot.created_at,
+            "parent_checkpoint_id": (snapshot.parent_config or {}).get("configurable",{}).get("checkpoint_id"),
+        }))
+    items=await asyncio.to_thread(agent.checkpointer.list_checkpoint_summaries, thread_id, before=before, limit=limit)
+    return {
+        "items": items,
+        "next_before": items[-1]["checkpoint_id"] if len(items) == limit else None,
+    }
+
+class LlmCallTracker:
+    """Keeps the in-flight chat model calls of a run (from its events), to account for what a cancellation saved"""
+
+    def __init__(self):
+        self.pending:set=set()
+
+    def on_event(self, event:Dict[str,Any]):
+        if event.get("event") == "on_chat_model_start":
+            self.pending.add(event.get("run_id"))
+        elif event.get("event") == "on_chat_model_end":
+            self.pending.discard(event.get("run_id"))
+            usage=getattr(event.get("data",{}).get("output"),"usage_metadata",None)
+            if usage:
+                metrics.incr("llm.calls")
+                metrics.incr("llm.output_tokens",usage.get("output_tokens",0))
+
+    def record_cancellation(self, run_id:str):
+        # input tokens of the in-flight calls are already billed, what is saved is (an estimate of) their output
+        saved_tokens=len(self.pending)*metrics.ratio("llm.output_tokens","llm.calls")
+        metrics.incr("runs.cancelled")
+        metrics.incr("runs.cancelled_llm_calls",len(self.pending))
+        metrics.incr("runs.cancelled_tokens_saved",saved_tokens)
+        print(f"----- run {run_id} cancelled with {len(self.pending)} LLM calls in flight, ~{saved_tokens:.0f} output tokens saved")
+
+async def cancel_on_disconnect(request: Request, task: asyncio.Task, interval: float = 0.5):
+    """Cancel the subscriber task as soon as the SSE client is gone (the run itself is cancelled once it has no subscriber left)"""
+    while not task.done():
+        if await request.is_disconnected():
+            print("----- client disconnected, closing its stream")
+            task.cancel()
+            return
+        await asyncio.sleep(interval)
+
+def delta_messages(input_data: RunAgentInputExtended) -> List[messages.BaseMessage]:
+    """Delta mode: the user messages sent after last_known_message_id, with the ids given by the client"""
+    human_msgs=[]
+    for m in input_data.messages:
+        if m.role != "user":
+            continue # assistant/tool messages are server authored, they are already in the checkpoint
+        human_msgs.append(HumanMessage(content=m.content,id=m.id or str(uuid.uuid4())))
+    return human_msgs
+
+async def check_delta_base(my_agent: MyAgent, thread_id: str, last_known_message_id: Optional[str]) -> Optional[JSONResponse]:
+    """
+    The delta must apply on top of the last message of the thread transcript, otherwise the client is told to resync
+    (fetch /state?after=<its last known id>) instead of the server diffing the whole transcript.
+    """
+    last_message_id=await asyncio.to_thread(my_agent.transcript_store.last_message_id, thread_id)
+    if last_message_id == last_known_message_id:
+        return None
+    known=bool(last_known_message_id) and await asyncio.to_thread(my_agent.transcript_store.seq_of, thread_id, last_known_message_id) is not None
+    metrics.incr("ingest.delta_mismatch")
+    return JSONResponse(
+        status_code=409,
+        content={
+            "error": "stale_client" if known else "unknown_message_id",
+            "thread_id": thread_id,
+            "last_message_id": last_message_id,
+            "resync_after": last_known_message_id if known else None,
+        },
+    )
+
+def last_event_id(request: Request) -> int:
+    try:
+        return int(request.headers.get("last-event-id") or 0)
+    except ValueError:
+        return 0
+
+def stream_run(request: Request, run: BackgroundRun, after_seq: int, media_type: str) -> StreamingResponse:
+    """Stream (replay + live) the events of a background run to this client"""
+    run_manager:RunManager = request.app.state.run_manager
+
+    async def subscriber():
+        disconnect_watcher = asyncio.create_task(cancel_on_disconnect(request, asyncio.current_task()))
+        try:
+            async for data in run_manager.stream(run, after_seq):
+                yield data
+        finally:
+            disconnect_watcher.cancel()
+
+    return StreamingResponse(subscriber(), media_type=media_type)
+
+@app.get("/ag-ui/runs/{run_id}/events")
+async def run_events(request: Request, run_id: str, after: Optional[int] = Query(None, description="Replay the events after this event id (same as Last-Event-ID)")):
+    """Reconnect to a background run, the missed events are replayed then the live ones are streamed"""
+    run_manager:RunManager = request.app.state.run_manager
+    run=run_manager.get(run_id)
+    if run is None:
+        return JSONResponse(status_code=404, content={"error": "run_not_found", "run_id": run_id})
+    encoder = EventEncoder(accept=request.headers.get("accept"))
+    return stream_run(request, run, after if after is not None else last_event_id(request), encoder.get_content_type())
 
 async def handle_agent_events(request: Request, my_agent: MyAgent, payload: ChatState | Command, config: RunnableConfig, encoder: EventEncoder):
     print("----- Starting handle_agent_events -----", payload, json.dumps(config, indent=2, default=str))
+    llm_calls = LlmCallTracker()
     try:
         events_object = []
         event_transformer = LangGraphToAgUi()
@@ -122,6 +306,7 @@ async def handle_agent_events(request: Request, my_agent: MyAgent, payload: Chat
             # print(f"---event type: {type(event)}")
             # print(f"---events: {json.dumps(event, default=str)}")
             events_object.append(event)  
+            llm_calls.on_event(event)
             __event=event         
 
             if event.get("data",{}).get("input",{}) and isinstance(event.get("data",{}).get("input"),Command):
@@ -154,6 +339,10 @@ async def handle_agent_events(request: Request, my_agent: MyAgent, payload: Chat
             if end_event:
                 yield end_event
 
+    except asyncio.CancelledError:
+        # the graph stops at its last committed checkpoint, the thread can be resumed by the next run
+        llm_calls.record_cancellation(config.get("run_id"))
+        raise
     except Exception as e:
         print(f"Error in handle_agent_events: {e}", e)
         traceback.print_exc()
@@ -187,41 +376,92 @@ async def endpoint(input_data: RunAgentInputExtended, request: Request):
         "recursion_limit": 25
     }
 
+    run_manager:RunManager = request.app.state.run_manager
+    # reserved synchronously (no await before), a concurrent duplicate attaches to this reservation
+    # a resume (same run_id + forwarded_props.command) is a new run, keyed by its resume payload
+    run,created=run_manager.reserve_submission(input_data.run_id, input_data.thread_id, input_data.forwarded_props.get("command"))
+    if not created:
+        # same run_id submitted again (reconnect, retry on a 502, double click): never execute it twice
+        if run.thread_id != input_data.thread_id:
+            return JSONResponse(
+                status_code=409,
+                content={"error": "run_id_conflict", "run_id": input_data.run_id, "thread_id": run.thread_id},
+            )
+        metrics.incr("runs.duplicate_replayed" if run.done else "runs.duplicate_attached")
+        print(f"----- run {input_data.run_id} already {run.status}, attaching instead of executing again")
+        return stream_run(request, run, last_event_id(request), encoder.get_content_type())
+
+    run_coordinator:RunCoordinator = request.app.state.run_coordinator
+    run_policy=input_data.forwarded_props.get("run_policy")
+    if (run_policy or run_coordinator.policy) == "reject" and run_coordinator.is_busy(input_data.thread_id):
+        metrics.incr("run_coordinator.rejected")
+        await run_manager.release(run)
+        return JSONResponse(
+            status_code=409,
+            content={"error": "thread_busy", "thread_id": input_data.thread_id, "active_run_id": run_coordinator.active_run_id(input_data.thread_id)},
+        )
+
+    delta_mode="last_known_message_id" in input_data.forwarded_props
+    if delta_mode and not input_data.forwarded_props.get("command"):
+        try:
+            mismatch=await check_delta_base(my_agent, input_data.thread_id, input_data.forwarded_props.get("last_known_message_id"))
+        except Exception:
+            await run_manager.release(run)
+            raise
+        if mismatch:
+            await run_manager.release(run)
+            return mismatch
+
     async def gen():
         try:
-            yield encoder.encode(RunStartedEvent(
-                type=EventType.RUN_STARTED,
-                thread_id=input_data.thread_id,
-                run_id=input_data.run_id
-            ))
+            async with run_coordinator.run(input_data.thread_id, input_data.run_id, run_policy):
+                yield encoder.encode(RunStartedEvent(
+                    type=EventType.RUN_STARTED,
+                    thread_id=input_data.thread_id,
+                    run_id=input_data.run_id
+                ))
             
-            user_msgs: List[UserMessage] = input_data.messages
-            human_msgs = [HumanMessage(content=m.content,id=str(uuid.uuid4())) for m in user_msgs]
+                # repair once at write time (older checkpoints), /state never writes
+                await my_agent.arepair_missing_ids(config)
 
-            command: Command = None
-            state: ChatState = ChatState(
-                messages=human_msgs,
-            )
+                if delta_mode:
+                    human_msgs = delta_messages(input_data)
+                    metrics.incr("ingest.delta_messages",len(human_msgs))
+                else:
+                    user_msgs: List[UserMessage] = input_data.messages
+                    human_msgs = [HumanMessage(content=m.content,id=str(uuid.uuid4())) for m in user_msgs]
 
-            if input_data.forwarded_props.get("command"):
-                command = Command(
-                    resume=input_data.forwarded_props["command"].get("resume",""),
+                command: Command = None
+                state: ChatState = ChatState(
+                    messages=human_msgs,
                 )
 
-            async for event_data in handle_agent_events(request, my_agent, command if command else state, config, encoder):
-                try:
-                    yield encoder.encode(event_data)
-                except Exception as e:
-                    print(f"Error encoding event: {e}", e)
-                    traceback.print_exc()
-                    yield f"data: {event_data.model_dump_json(by_alias=True, exclude_none=True,fallback=lambda x: str(x))}\n\n"
-
-            yield encoder.encode(RunFinishedEvent(
-                type=EventType.RUN_FINISHED,
-                thread_id=input_data.thread_id,
-                run_id=input_data.run_id
-            ))
+                if input_data.forwarded_props.get("command"):
+                    command = Command(
+                        resume=input_data.forwarded_props["command"].get("resume",""),
+                    )
+
+                async for event_data in handle_agent_events(request, my_agent, command if command else state, config, encoder):
+                    try:
+                        yield encoder.encode(event_data)
+                    except Exception as e:
+                        print(f"Error encoding event: {e}", e)
+                        traceback.print_exc()
+                        yield f"data: {event_data.model_dump_json(by_alias=True, exclude_none=True,fallback=lambda x: str(x))}\n\n"
+
+                yield encoder.encode(RunFinishedEvent(
+                    type=EventType.RUN_FINISHED,
+                    thread_id=input_data.thread_id,
+                    run_id=input_data.run_id
+                ))
             
+        except ThreadBusyError as error:
+            yield encoder.encode(RunErrorEvent(
+                type=EventType.RUN_ERROR,
+                message=str(error),
+                code="thread_busy"
+            ))
+
         except Exception as error:
             print(f"Error in agent processing: {error}")
             traceback.print_exc()
@@ -231,5 +471,7 @@ async def endpoint(input_data: RunAgentInputExtended, request: Request):
                 message=str(error)
             ))
 
-    return StreamingResponse(gen(), media_type=encoder.get_content_type())
+    # the run executes in background, independently of this connection
+    run=run_manager.start(run.run_id, input_data.thread_id, gen)
+    return stream_run(request, run, 0, encoder.get_content_type())
 
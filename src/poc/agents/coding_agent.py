@@ -48,6 +48,8 @@ import traceback
 
 from .utils import max_tokens,thinking_params,mcp_sampling_handler,get_aws_modal,create_handoff_tool
 from .state import ChatState,SupervisorNode
+from .tool_selection import ToolSelector
+from .metrics import metrics
 
 class CodingAgent:   
     def __init__(self):
@@ -56,6 +58,7 @@ class CodingAgent:
         self.llm = None
         self.tools = None
         self.tool_node = None
+        self.tool_selector:ToolSelector = None
         self.graph = None
         self.max_tool_calls = 20
         self.client:Client = None
@@ -76,16 +79,16 @@ class CodingAgent:
             if not hasattr(msg, 'id') or msg.id is None:
                 msg.id = str(uuid.uuid4())
         try:
-            response = await self.llm.ainvoke(chat_messages)
+            llm = await self.tool_selector.abind(state.get("active_step"))
+            with metrics.timer(f"agent.{self.name}.llm_seconds"):
+                response = await llm.ainvoke(chat_messages)
         except Exception as e:
             print(f"Error invoking LLM: {e}\n",chat_messages,traceback.print_exc())
             response = messages.AIMessage(content=f"An error occurred while processing your request. Please try again later. {e}",id=str(uuid.uuid4()))
         
-        updated_messages = chat_messages + [response]
-
         return Command(
             update={
-                'messages': updated_messages,
+                'messages': [response],
             },
             goto="route"
         )
@@ -95,12 +98,9 @@ class CodingAgent:
         ai_msg:messages.AIMessage=state["messages"][-1]
         result = await self.tool_node.ainvoke(state)
 
-        # Combine all messages for the updated state
-        all_updated_messages = state['messages'] + result['messages']
-        
         return Command(
             update={
-                'messages': all_updated_messages,
+                'messages': result['messages'],
                 'tool_call_count': state['tool_call_count']+1
             },
             goto="route"
@@ -142,13 +142,11 @@ class CodingAgent:
             else:
                 # User provided new input i.e., its neither yes nor no - this becomes a new human message
                 new_human_message = messages.HumanMessage(content=user_answer, id=str(uuid.uuid4()))
-                updated_messages = state['messages'] + [new_human_message]
-                                
                 
                 # Reset tool count and restart LLM processing
                 return Command(
                     update={
-                        'messages': updated_messages, 
+                        'messages': [new_human_message], 
                         'tool_call_count': 0,
                     },
                     goto="llm"
@@ -183,7 +181,7 @@ class CodingAgent:
         """Initialize the agent with MCP tools and LLM"""
 
         # Initialize LLMs
-        self.base_llm = get_aws_modal()
+        self.base_llm = get_aws_modal(prompt_cache_node=self.name)
 
         mcp_config={
                 "fds": {
@@ -205,6 +203,7 @@ class CodingAgent:
             tool.name=self.name+"_"+tool.name
         self.llm = self.base_llm.bind_tools(self.tools)            
         self.tool_node = ToolNode(self.tools)
+        self.tool_selector = ToolSelector(self.name, self.base_llm, self.tools)
 
         builder = StateGraph(ChatState)
         builder.add_node('llm', self.llm_node)
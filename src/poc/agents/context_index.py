@@ -0,0 +1,110 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict,List,Optional,Tuple
+import numpy as np
+from langchain_core import messages
+from langchain_core.messages.utils import count_tokens_approximately
+from .utils import local_embed
+from .metrics import metrics
+
+
+def text_hash(text:str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def split_sentences(text:str) -> List[str]:
+    return [sentence for sentence in re.split(r"(?<=[.?!])\s+|\n{2,}",text) if sentence.strip()]
+
+
+class ContextIndex:
+    """
+    In-process semantic index used to select the relevant context of a step response.
+    Embeddings (local sentence-transformers model) and token counts are cached by text hash across calls,
+    while the chunks and matrices of a call stay local to it, so concurrent calls never share an index.
+    Chunking follows SemanticChunker's percentile breakpoints and the selection is a vectorized MMR.
+    """
+
+    def __init__(self, cache_size:Optional[int]=None):
+        self.cache_size=cache_size or int(os.environ.get("CONTEXT_EMBED_CACHE_SIZE","20000"))
+        self.embeddings:OrderedDict[str,np.ndarray]=OrderedDict()
+        self.token_counts:Dict[str,int]={}
+        self._lock=threading.Lock()
+
+    def embed(self, texts:List[str]) -> np.ndarray:
+        """Normalized embeddings of the texts, only the texts not seen before are sent to the model"""
+        hashes=[text_hash(text) for text in texts]
+        with self._lock:
+            missing={key:text for key,text in zip(hashes,texts) if key not in self.embeddings}
+        metrics.incr("context_index.embed_cache_hits",len(texts)-len(missing))
+        metrics.incr("context_index.embed_cache_misses",len(missing))
+        if missing:
+            vectors=local_embed(list(missing.values()))
+            with self._lock:
+                for key,vector in zip(missing,vectors):
+                    self.embeddings[key]=vector
+        with self._lock:
+            matrix=np.vstack([self.embeddings[key] for key in hashes])
+            for key in hashes:
+                self.embeddings.move_to_end(key)
+            while len(self.embeddings) > self.cache_size:
+                evicted,_=self.embeddings.popitem(last=False)
+                self.token_counts.pop(evicted,None)
+        return matrix
+
+    def tokens(self, chunk:str) -> int:
+        key=text_hash(chunk)
+        count=self.token_counts.get(key)
+        if count is None:
+            count=self.token_counts[key]=count_tokens_approximately([messages.HumanMessage(content=chunk)])
+        return count
+
+    def chunk(self, text:str, breakpoint_percentile:float=75.0, min_chunk_size:int=1000) -> List[str]:
+        """Split where the distance between consecutive sentences is above the percentile, chunks of at least min_chunk_size chars"""
+        sentences=split_sentences(text)
+        if len(sentences) < 2:
+            return sentences
+        matrix=self.embed(sentences)
+        distances=1.0-np.einsum("ij,ij->i",matrix[:-1],matrix[1:])
+        threshold=np.percentile(distances,breakpoint_percentile)
+        chunks:List[str]=[]
+        current=[sentences[0]]
+        for sentence,distance in zip(sentences[1:],distances):
+            if distance > threshold and sum(len(part) for part in current) >= min_chunk_size:
+                chunks.append(" ".join(current))
+                current=[]
+            current.append(sentence)
+        chunks.append(" ".join(current))
+        return chunks
+
+    def select(self, query:str, chunks:List[str], token_limit:float, lambda_mult:float=0.5) -> List[str]:
+        """Chunks in maximal marginal relevance order until the token budget is reached"""
+        if not chunks:
+            return []
+        matrix=self.embed(chunks)
+        relevance=matrix@self.embed([query])[0]
+        redundancy=np.full(len(chunks),-np.inf,dtype=np.float32) # max similarity with the selected chunks
+        available=np.ones(len(chunks),dtype=bool)
+        selected:List[str]=[]
+        current_tokens=0
+        while available.any():
+            scores=lambda_mult*relevance-(1-lambda_mult)*np.where(np.isinf(redundancy),0.0,redundancy)
+            best=int(np.argmax(np.where(available,scores,-np.inf)))
+            tokens=self.tokens(chunks[best])
+            if current_tokens+tokens > token_limit:
+                break
+            selected.append(chunks[best])
+            current_tokens+=tokens
+            available[best]=False
+            redundancy=np.maximum(redundancy,matrix@matrix[best])
+        return selected
+
+    def relevant_context(self, query:str, text:str, token_limit:float) -> Tuple[List[str],int]:
+        """(selected chunks, number of chunks) of the text for the query"""
+        with metrics.timer("context_index.select_seconds"):
+            chunks=self.chunk(text)
+            return self.select(query,chunks,token_limit),len(chunks)
+
+
+context_index = ContextIndex()
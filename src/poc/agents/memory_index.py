@@ -0,0 +1,494 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any,AsyncIterator,Dict,List,Optional,Tuple
+from datetime import datetime,timezone
+import numpy as np
+from langgraph.store.base import BaseStore,Item,PutOp,SearchItem
+from .utils import local_embed,local_embed_model_name
+from .metrics import metrics
+
+
+EMBEDDINGS_PREFIX="memory_embeddings" # the vectors live in a sibling namespace, never in the memory values
+EMBEDDING_FIELD="embedding" # fields of the values written before the sibling namespace, still read and stripped
+EMBEDDING_MODEL_FIELD="embedding_model"
+ACCESS_COUNT_FIELD="access_count"
+LAST_RECALLED_FIELD="last_recalled"
+TIMESTAMP_FORMAT="%Y-%m-%dT%H:%M:%SZ"
+
+def memory_text(value:Dict[str,Any]) -> str:
+    """Text of a memory that is embedded (content, context and the user queries it answers)"""
+    user_queries=value.get("user_queries") or []
+    return "\n".join([value.get("content",""),value.get("context","")]+list(user_queries))
+
+def public_value(value:Dict[str,Any]) -> Dict[str,Any]:
+    """Memory value without the stored embedding (what the LLM and the API get)"""
+    return {key:val for key,val in value.items() if key not in (EMBEDDING_FIELD,EMBEDDING_MODEL_FIELD,ACCESS_COUNT_FIELD,LAST_RECALLED_FIELD)}
+
+def parse_timestamp(value:Optional[str]) -> Optional[float]:
+    if value:
+        try:
+            return datetime.strptime(value,TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            pass
+    return None
+
+def format_timestamp(timestamp:float) -> str:
+    return datetime.fromtimestamp(timestamp,timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+def last_updated_of(item:Item) -> float:
+    """Epoch seconds of the memory `last_updated` field (written by store_messages), else the store update time"""
+    last_updated=parse_timestamp(item.value.get("last_updated"))
+    if last_updated is not None:
+        return last_updated
+    return item.updated_at.timestamp() if item.updated_at else 0.0
+
+def last_recalled_of(item:Item) -> float:
+    """Epoch seconds of the last recall of the memory, a never recalled memory counts from its last update"""
+    last_recalled=parse_timestamp(item.value.get(LAST_RECALLED_FIELD))
+    return last_recalled if last_recalled is not None else last_updated_of(item)
+
+def merge_memory_values(survivor:Dict[str,Any], duplicates:List[Dict[str,Any]]) -> Dict[str,Any]:
+    """Near-duplicate memories merged into the survivor (newest wording kept, user_queries unioned, last_updated refreshed)"""
+    user_queries=list(survivor.get("user_queries") or [])
+    for duplicate in duplicates:
+        for user_query in duplicate.get("user_queries") or []:
+            if user_query not in user_queries:
+                user_queries.append(user_query)
+    merged=public_value(survivor)
+    merged["user_queries"]=user_queries
+    merged["last_updated"]=format_timestamp(time.time())
+    # recall statistics survive the merge so the retention sweeper does not evict a frequently recalled memory
+    values=[survivor]+duplicates
+    access_count=sum(value.get(ACCESS_COUNT_FIELD,0) for value in values)
+    last_recalled=[value[LAST_RECALLED_FIELD] for value in values if value.get(LAST_RECALLED_FIELD)]
+    if access_count:
+        merged[ACCESS_COUNT_FIELD]=access_count
+    if last_recalled:
+        merged[LAST_RECALLED_FIELD]=max(last_recalled)
+    return merged
+
+def embedding_namespace(namespace:Tuple[str,...]) -> Tuple[str,...]:
+    """Sibling namespace holding the embeddings of the memories of namespace (same keys)"""
+    return (EMBEDDINGS_PREFIX,)+tuple(namespace)
+
+def text_digest(value:Dict[str,Any]) -> str:
+    return hashlib.sha1(memory_text(value).encode("utf-8")).hexdigest()[:16]
+
+def stored_value(value:Dict[str,Any]) -> Dict[str,Any]:
+    """Memory value as written to the store: everything but an embedding"""
+    return {key:val for key,val in value.items() if key not in (EMBEDDING_FIELD,EMBEDDING_MODEL_FIELD)}
+
+def embed_memory(value:Dict[str,Any]) -> Dict[str,Any]:
+    """Embedding record of the memory (vector, model, digest of the embedded text), computed once at write time"""
+    embedding=local_embed([memory_text(value)])[0]
+    return {"vector":embedding.tolist(),"model":local_embed_model_name,"text":text_digest(value)}
+
+async def aput_memory(store:BaseStore, namespace:Tuple[str,...], key:str, value:Dict[str,Any], record:Optional[Dict[str,Any]]=None) -> Dict[str,Any]:
+    """Write the memory and its embedding record (sibling namespace) in one batch, returns the record"""
+    value=stored_value(value)
+    if record is None or record.get("text") != text_digest(value):
+        record=await asyncio.to_thread(embed_memory,value)
+    await store.abatch([
+        PutOp(tuple(namespace),key,value),
+        PutOp(embedding_namespace(namespace),key,record,index=False),
+    ])
+    return record
+
+async def adelete_memory(store:BaseStore, namespace:Tuple[str,...], key:str):
+    """Delete the memory and its embedding record"""
+    await store.abatch([PutOp(tuple(namespace),key,None),PutOp(embedding_namespace(namespace),key,None)])
+
+async def aload_embedding_records(store:BaseStore, prefix:Tuple[str,...], limit:int) -> Dict[Tuple[Tuple[str,...],str],Dict[str,Any]]:
+    """(namespace, key) -> embedding record of the memories below the prefix"""
+    records=await store.asearch(embedding_namespace(prefix),limit=limit)
+    return {(tuple(record.namespace)[1:],record.key):record.value for record in records}
+
+
+class IvfIndex:
+    """
+    Small inverted file ANN index (k-means coarse quantizer) over normalized vectors, NumPy only.
+    Only the `nprobe` closest clusters are scanned, used for namespaces too large for brute force.
+    """
+
+    def __init__(self, vectors:np.ndarray, nprobe:int=8, iterations:int=6, seed:int=0):
+        n=vectors.shape[0]
+        self.size=n
+        self.nprobe=nprobe
+        clusters=max(1,int(np.sqrt(n)))
+        rng=np.random.default_rng(seed)
+        centroids=vectors[rng.choice(n,clusters,replace=False)].copy()
+        for _ in range(iterations):
+            assignment=np.argmax(vectors@centroids.T,axis=1)
+            for cluster in range(clusters):
+                members=vectors[assignment==cluster]
+                if len(members):
+                    centroid=members.sum(axis=0)
+                    centroids[cluster]=centroid/(np.linalg.norm(centroid) or 1.0)
+        self.centroids=centroids
+        assignment=np.argmax(vectors@centroids.T,axis=1)
+        self.lists=[np.flatnonzero(assignment==cluster) for cluster in range(clusters)]
+
+    def candidates(self, query:np.ndarray) -> np.ndarray:
+        closest=np.argsort(-(self.centroids@query))[:self.nprobe]
+        return np.concatenate([self.lists[cluster] for cluster in closest])
+
+
+class NamespaceIndex:
+    """Vectors and values of the memories of one namespace, rows are reused on update"""
+
+    def __init__(self, dims:int):
+        self.keys:List[str]=[]
+        self.positions:Dict[str,int]={}
+        self.items:Dict[str,Item]={}
+        self.matrix=np.zeros((16,dims),dtype=np.float32)
+        self.last_updated=np.zeros(16,dtype=np.float64) # recency index, aligned with the matrix rows
+        self._recency_order:Optional[np.ndarray]=None # row positions, newest first
+        self.ann:Optional[IvfIndex]=None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def upsert(self, item:Item, embedding:np.ndarray):
+        position=self.positions.get(item.key)
+        if position is None:
+            position=len(self.keys)
+            if position >= self.matrix.shape[0]:
+                self.matrix=np.vstack([self.matrix,np.zeros_like(self.matrix)])
+                self.last_updated=np.concatenate([self.last_updated,np.zeros_like(self.last_updated)])
+            self.keys.append(item.key)
+            self.positions[item.key]=position
+        elif self.ann is not None and position < self.ann.size:
+            self.ann=None # moved vector, rebuilt on the next search
+        self.matrix[position]=embedding
+        self.last_updated[position]=last_updated_of(item)
+        self._recency_order=None
+        self.items[item.key]=item
+
+    def delete(self, key:str):
+        position=self.positions.pop(key,None)
+        if position is None:
+            return
+        last=len(self.keys)-1
+        if position != last:
+            last_key=self.keys[last]
+            self.keys[position]=last_key
+            self.positions[last_key]=position
+            self.matrix[position]=self.matrix[last]
+            self.last_updated[position]=self.last_updated[last]
+        self.keys.pop()
+        self.items.pop(key,None)
+        self._recency_order=None
+        self.ann=None
+
+    def recency_order(self) -> np.ndarray:
+        """Row positions sorted by last_updated (newest first), re-sorted only after a write"""
+        if self._recency_order is None:
+            self._recency_order=np.argsort(-self.last_updated[:len(self.keys)],kind="stable")
+        return self._recency_order
+
+    def window(self, since:Optional[float], until:Optional[float]) -> np.ndarray:
+        """Row positions (newest first) whose last_updated is in [since, until]"""
+        order=self.recency_order()
+        timestamps=self.last_updated[order]
+        mask=np.ones(len(order),dtype=bool)
+        if since is not None:
+            mask&=timestamps >= since
+        if until is not None:
+            mask&=timestamps <= until
+        return order[mask]
+
+    def scores(self, query:np.ndarray, ann_min_items:int, nprobe:int) -> Tuple[np.ndarray,np.ndarray]:
+        """(row positions, cosine similarities) of the candidates for the query"""
+        size=len(self.keys)
+        if size < ann_min_items:
+            return np.arange(size),self.matrix[:size]@query
+        if self.ann is None or self.ann.size < size*0.9:
+            self.ann=IvfIndex(self.matrix[:size].copy(),nprobe=nprobe)
+            metrics.incr("memory_index.ann_builds")
+        # rows added since the last build are scanned brute force
+        positions=np.concatenate([self.ann.candidates(query),np.arange(self.ann.size,size)])
+        return positions,self.matrix[positions]@query
+
+
+class MemoryIndex:
+    """
+    In-process semantic index of the long-term memories, so relevant_memory works offline with real
+    similarity scores. Embeddings come from the local sentence-transformers model, they are computed when
+    a memory is stored (and kept in the sibling `memory_embeddings` namespace) and loaded lazily per namespace prefix.
+    A loaded prefix is reloaded in background after `refresh_seconds`, so the writes/deletes of other
+    processes are picked up (0 never reloads).
+    Namespaces below `ann_min_items` memories are searched brute force, larger ones through an IVF index.
+    """
+
+    def __init__(self, ann_min_items:Optional[int]=None, nprobe:Optional[int]=None, load_limit:int=100_000, refresh_seconds:Optional[float]=None):
+        self.ann_min_items=ann_min_items or int(os.environ.get("MEMORY_ANN_MIN_ITEMS","5000"))
+        self.nprobe=nprobe or int(os.environ.get("MEMORY_ANN_NPROBE","8"))
+        self.load_limit=load_limit
+        self.refresh_seconds=refresh_seconds if refresh_seconds is not None else float(os.environ.get("MEMORY_INDEX_REFRESH_SECONDS","300"))
+        self.namespaces:Dict[Tuple[str,...],NamespaceIndex]={}
+        self.prefix_namespaces:Dict[Tuple[str,...],List[Tuple[str,...]]]={} # every prefix of a namespace -> namespaces below it
+        self.loaded_prefixes:Dict[Tuple[str,...],float]={} # prefix -> monotonic time of its last load
+        self.pending_access:Dict[Tuple[Tuple[str,...],str],Tuple[int,float]]={} # (namespace, key) -> (recalls, last recall)
+        self._lock=threading.Lock()
+        self._load_lock=asyncio.Lock()
+        self.loading:Dict[Tuple[str,...],asyncio.Task]={}
+        self.key_locks:Dict[Tuple[Tuple[str,...],str],Tuple[asyncio.Lock,int]]={} # (namespace, key) -> (lock, holders and waiters)
+
+    def _namespace(self, namespace:Tuple[str,...], dims:int) -> NamespaceIndex:
+        index=self.namespaces.get(namespace)
+        if index is None:
+            index=self.namespaces[namespace]=NamespaceIndex(dims)
+            for length in range(len(namespace)+1):
+                self.prefix_namespaces.setdefault(namespace[:length],[]).append(namespace)
+        return index
+
+    def _namespaces_below(self, prefix:Tuple[str,...]) -> List[Tuple[Tuple[str,...],NamespaceIndex]]:
+        """Indexed namespaces below the prefix, without visiting the namespaces of other users/threads"""
+        return [(namespace,self.namespaces[namespace]) for namespace in self.prefix_namespaces.get(tuple(prefix),[])]
+
+    def was_loaded(self, prefix:Tuple[str,...]) -> bool:
+        return any(prefix[:len(loaded)] == loaded for loaded in self.loaded_prefixes)
+
+    def is_loaded(self, prefix:Tuple[str,...]) -> bool:
+        """Loaded (by itself or a parent prefix) less than refresh_seconds ago"""
+        now=time.monotonic()
+        return any(
+            prefix[:len(loaded)] == loaded and (not self.refresh_seconds or now-loaded_at < self.refresh_seconds)
+            for loaded,loaded_at in self.loaded_prefixes.items()
+        )
+
+    def _embedding_of(self, value:Dict[str,Any], record:Optional[Dict[str,Any]]=None) -> np.ndarray:
+        """Stored embedding of the memory if it matches its current text and the local model, else computed"""
+        if record and record.get("model") == local_embed_model_name and record.get("text") == text_digest(value):
+            return np.asarray(record["vector"],dtype=np.float32)
+        if value.get(EMBEDDING_FIELD) and value.get(EMBEDDING_MODEL_FIELD) == local_embed_model_name:
+            return np.asarray(value[EMBEDDING_FIELD],dtype=np.float32)
+        metrics.incr("memory_index.embedded_on_load")
+        return local_embed([memory_text(value)])[0]
+
+    def _add(self, item:Item, record:Optional[Dict[str,Any]]=None):
+        embedding=self._embedding_of(item.value,record)
+        public_item=Item(value=public_value(item.value),key=item.key,namespace=item.namespace,created_at=item.created_at,updated_at=item.updated_at)
+        with self._lock:
+            self._namespace(tuple(item.namespace),embedding.shape[0]).upsert(public_item,embedding)
+
+    async def _load(self, store:BaseStore, prefix:Tuple[str,...]):
+        async with self._load_lock:
+            if self.is_loaded(prefix):
+                return
+            reload=self.was_loaded(prefix)
+            started_at=time.time()
+            items,records=await asyncio.gather(store.asearch(prefix,limit=self.load_limit),aload_embedding_records(store,prefix,self.load_limit))
+            await asyncio.to_thread(lambda: [self._add(item,records.get((tuple(item.namespace),item.key))) for item in items])
+            if reload and len(items) < self.load_limit:
+                self._drop_missing(prefix,{(tuple(item.namespace),item.key) for item in items},started_at)
+            self.loaded_prefixes[prefix]=time.monotonic()
+            metrics.incr("memory_index.reloads" if reload else "memory_index.loads")
+            metrics.incr("memory_index.loaded_items",len(items))
+
+    def _drop_missing(self, prefix:Tuple[str,...], found:set, started_at:float):
+        """Forget the memories below the prefix deleted from the store (by another process) since the last load"""
+        with self._lock:
+            for namespace,index in self._namespaces_below(prefix):
+                # a memory indexed while the reload was running is newer than its search
+                for key in [key for key,item in index.items.items() if (namespace,key) not in found and last_updated_of(item) < started_at]:
+                    index.delete(key)
+                    metrics.incr("memory_index.dropped_items")
+
+    def _load_done(self, prefix:Tuple[str,...], task:asyncio.Task):
+        self.loading.pop(prefix,None)
+        if not task.cancelled() and task.exception() is not None:
+            # nobody may await a background reload, the error is reported here
+            print(f"Error loading memories of {prefix}: {task.exception()}")
+            metrics.incr("memory_index.load_errors")
+
+    async def aensure_loaded(self, store:BaseStore, prefix:Tuple[str,...]):
+        """Load every memory below the namespace prefix from the store, reloaded once refresh_seconds have elapsed"""
+        prefix=tuple(prefix)
+        if self.is_loaded(prefix):
+            return
+        task=self.loading.get(prefix)
+        if task is None:
+            task=self.loading[prefix]=asyncio.create_task(self._load(store,prefix))
+            task.add_done_callback(lambda done: self._load_done(prefix,done))
+        if self.was_loaded(prefix):
+            # stale: searched as is while the reload runs in background
+            return
+        # shielded: a caller giving up (prefetch timeout, superseded turn) does not abort a cold load,
+        # it keeps running in background and the next turn finds the prefix loaded
+        await asyncio.shield(task)
+
+    async def aupsert(self, item:Item, record:Optional[Dict[str,Any]]=None):
+        """Index a memory that was just written to the store (with the embedding record aput_memory returned)"""
+        await asyncio.to_thread(self._add,item,record)
+
+    def find_duplicate(self, namespace:Tuple[str,...], embedding:List[float], threshold:float) -> Optional[Tuple[Item,float]]:
+        """Closest memory of exactly this namespace if its similarity is above the threshold"""
+        embedding=np.asarray(embedding,dtype=np.float32)
+        with self._lock:
+            index=self.namespaces.get(tuple(namespace))
+            if not index or not len(index):
+                return None
+            positions,scores=index.scores(embedding,self.ann_min_items,self.nprobe)
+            best=int(np.argmax(scores))
+            if scores[best] < threshold:
+                return None
+            return index.items[index.keys[positions[best]]],float(scores[best])
+
+    @asynccontextmanager
+    async def key_lock(self, namespace:Tuple[str,...], key:str) -> AsyncIterator[None]:
+        """Serializes the read-modify-write of one memory (dedup merge, update, recall counts flush)"""
+        lock_key=(tuple(namespace),key)
+        lock,users=self.key_locks.get(lock_key,(asyncio.Lock(),0))
+        self.key_locks[lock_key]=(lock,users+1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock,users=self.key_locks[lock_key]
+            if users == 1:
+                del self.key_locks[lock_key]
+            else:
+                self.key_locks[lock_key]=(lock,users-1)
+
+    def delete(self, namespace:Tuple[str,...], key:str):
+        with self._lock:
+            index=self.namespaces.get(tuple(namespace))
+            if index:
+                index.delete(key)
+            self.pending_access.pop((tuple(namespace),key),None)
+
+    def record_access(self, items:List[Item]):
+        """Count a recall of the memories, in memory only: the sweeper writes the counts to the store in batch"""
+        now=time.time()
+        with self._lock:
+            for item in items:
+                access_key=(tuple(item.namespace),item.key)
+                count,_=self.pending_access.get(access_key,(0,now))
+                self.pending_access[access_key]=(count+1,now)
+
+    def take_pending_access(self) -> Dict[Tuple[Tuple[str,...],str],Tuple[int,float]]:
+        with self._lock:
+            pending,self.pending_access=self.pending_access,{}
+            return pending
+
+    def _search(self, scopes:List[Tuple[Tuple[str,...],float]], query:str, limit:int, offset:int) -> List[SearchItem]:
+        query_embedding=local_embed([query])[0]
+        # a namespace gets the weight of the most specific scope containing it
+        scopes=sorted(((tuple(prefix),weight) for prefix,weight in scopes),key=lambda scope: -len(scope[0]))
+        best:Dict[str,Tuple[float,Item]]={}
+        with self._lock:
+            below={namespace:index for prefix,_ in scopes for namespace,index in self._namespaces_below(prefix)}
+            for namespace,index in below.items():
+                weight=next(weight for prefix,weight in scopes if namespace[:len(prefix)] == prefix)
+                if not len(index):
+                    continue
+                positions,scores=index.scores(query_embedding,self.ann_min_items,self.nprobe)
+                top=np.argsort(-scores)[:limit+offset]
+                for i in top:
+                    item=index.items[index.keys[positions[i]]]
+                    score=float(scores[i])*weight
+                    if item.key not in best or best[item.key][0] < score:
+                        best[item.key]=(score,item)
+        candidates=sorted(best.values(),key=lambda candidate: -candidate[0])
+        return [
+            SearchItem(namespace=item.namespace,key=item.key,value=item.value,created_at=item.created_at,updated_at=item.updated_at,score=score)
+            for score,item in candidates[offset:offset+limit]
+        ]
+
+    def _recent(self, prefix:Tuple[str,...], query:Optional[str], limit:int, offset:int, since:Optional[float], until:Optional[float], recency_weight:float, half_life_seconds:float) -> List[SearchItem]:
+        query_embedding=local_embed([query])[0] if query else None
+        now=datetime.now(timezone.utc).timestamp()
+        candidates:List[Tuple[float,float,Item]]=[]
+        with self._lock:
+            for namespace,index in self._namespaces_below(prefix):
+                if not len(index):
+                    continue
+                positions=index.window(since,until)
+                if query_embedding is None:
+                    # pure recency read, the positions are already sorted
+                    positions=positions[:limit+offset]
+                    scores=index.last_updated[positions]
+                else:
+                    age=np.maximum(now-index.last_updated[positions],0.0)
+                    recency=np.power(0.5,age/half_life_seconds)
+                    scores=(1-recency_weight)*(index.matrix[positions]@query_embedding)+recency_weight*recency
+                    top=np.argsort(-scores)[:limit+offset]
+                    positions,scores=positions[top],scores[top]
+                candidates.extend((float(score),float(index.last_updated[position]),index.items[index.keys[position]]) for position,score in zip(positions,scores))
+        candidates.sort(key=lambda candidate: (-candidate[0],-candidate[1]))
+        return [
+            SearchItem(namespace=item.namespace,key=item.key,value=item.value,created_at=item.created_at,updated_at=item.updated_at,score=score if query_embedding is not None else None)
+            for score,_,item in candidates[offset:offset+limit]
+        ]
+
+    async def arecent(self, store:BaseStore, prefix:Tuple[str,...], query:Optional[str]=None, limit:int=10, offset:int=0, since:Optional[float]=None, until:Optional[float]=None, recency_weight:Optional[float]=None, half_life_seconds:Optional[float]=None) -> List[SearchItem]:
+        """
+        Most recent memories below the namespace prefix (by last_updated), optionally within a time window.
+        Without a query it is a pure recency read (no embedding), with a query the score blends
+        similarity and an exponential recency decay.
+        """
+        await self.aensure_loaded(store,prefix)
+        recency_weight=recency_weight if recency_weight is not None else float(os.environ.get("MEMORY_RECENCY_WEIGHT","0.5"))
+        half_life_seconds=half_life_seconds or float(os.environ.get("MEMORY_RECENCY_HALF_LIFE_HOURS","72"))*3600
+        with metrics.timer("memory_index.recent_seconds"):
+            return await asyncio.to_thread(self._recent,prefix,query,limit,offset,since,until,recency_weight,half_life_seconds)
+
+    async def asearch(self, store:BaseStore, prefix:Tuple[str,...], query:str, limit:int=10, offset:int=0) -> List[SearchItem]:
+        """Memories below the namespace prefix ranked by cosine similarity with the query"""
+        return await self.asearch_scopes(store,[(prefix,1.0)],query,limit=limit,offset=offset)
+
+    async def asearch_scopes(self, store:BaseStore, scopes:List[Tuple[Tuple[str,...],float]], query:str, limit:int=10, offset:int=0) -> List[SearchItem]:
+        """
+        One search over several nested namespace prefixes (e.g. conversation ⊂ thread ⊂ user) given as (prefix, weight).
+        The similarity of a memory is multiplied by the weight of the most specific scope containing it,
+        results are deduplicated by key and returned as a single ranked list.
+        """
+        prefixes=[tuple(prefix) for prefix,_ in scopes]
+        # loading the outermost prefixes covers the nested ones
+        outermost=[prefix for prefix in prefixes if not any(other != prefix and prefix[:len(other)] == other for other in prefixes)]
+        for prefix in outermost:
+            await self.aensure_loaded(store,prefix)
+        with metrics.timer("memory_index.search_seconds"):
+            return await asyncio.to_thread(self._search,scopes,query,limit,offset)
+
+
+async def compact_namespace(store:BaseStore, namespace:Tuple[str,...], threshold:float, dry_run:bool=False, load_limit:int=100_000) -> Dict[str,int]:
+    """
+    Offline dedup of one namespace: memories are visited newest first and every not yet merged memory
+    above the similarity threshold is merged into it (then deleted from the store).
+    """
+    items=[item for item in await store.asearch(namespace,limit=load_limit) if tuple(item.namespace) == tuple(namespace)]
+    if len(items) < 2:
+        return {"items":len(items),"merged":0}
+    items.sort(key=last_updated_of,reverse=True)
+    records=await aload_embedding_records(store,namespace,load_limit)
+    embeddings=await asyncio.to_thread(lambda: np.vstack([memory_index._embedding_of(item.value,records.get((tuple(namespace),item.key))) for item in items]))
+    merged_away=np.zeros(len(items),dtype=bool)
+    merged=0
+    for i,survivor in enumerate(items):
+        if merged_away[i]:
+            continue
+        similarities=embeddings[i+1:]@embeddings[i]
+        duplicates=[i+1+j for j in np.flatnonzero(similarities >= threshold) if not merged_away[i+1+j]]
+        if not duplicates:
+            continue
+        merged_away[duplicates]=True
+        merged+=len(duplicates)
+        print(f"----- {namespace} [{survivor.key}] <- {[items[j].key for j in duplicates]}")
+        if dry_run:
+            continue
+        value=merge_memory_values(survivor.value,[items[j].value for j in duplicates])
+        record=await aput_memory(store,namespace,survivor.key,value)
+        await memory_index.aupsert(Item(value=value,key=survivor.key,namespace=namespace,created_at=survivor.created_at,updated_at=datetime.now(timezone.utc)),record)
+        for j in duplicates:
+            await adelete_memory(store,namespace,items[j].key)
+            memory_index.delete(namespace,items[j].key)
+    return {"items":len(items),"merged":merged}
+
+
+memory_index = MemoryIndex()
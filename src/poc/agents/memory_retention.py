@@ -0,0 +1,120 @@
+import asyncio
+import os
+import time
+import traceback
+from typing import Any,Dict,List,Optional,Tuple
+from langgraph.store.base import BaseStore,Item
+from .memory_index import memory_index,adelete_memory,stored_value,last_updated_of,last_recalled_of,format_timestamp,ACCESS_COUNT_FIELD,LAST_RECALLED_FIELD
+from .metrics import metrics
+
+
+class MemorySweeper:
+    """
+    Retention of the long-term memories, run periodically in the background:
+        - TTL: memories not updated for `ttl_days` are deleted (0, the default, disables it)
+        - cap: a namespace keeps at most `max_items` memories, the least recently recalled ones are evicted (0, the default, disables it)
+    Recalls are counted in memory by memory_index.record_access and written to the memories (access_count,
+    last_recalled) at the beginning of each sweep. Every sweep reports what it reclaimed.
+    """
+
+    def __init__(self, store:BaseStore, ttl_days:Optional[float]=None, max_items:Optional[int]=None, interval_seconds:Optional[float]=None, prefix:Tuple[str,...]=("long_term_memories",), load_limit:int=100_000):
+        self.store=store
+        self.ttl_days=ttl_days if ttl_days is not None else float(os.environ.get("MEMORY_TTL_DAYS","0"))
+        self.max_items=max_items if max_items is not None else int(os.environ.get("MEMORY_MAX_PER_NAMESPACE","0"))
+        self.interval_seconds=interval_seconds or float(os.environ.get("MEMORY_SWEEP_INTERVAL_SECONDS","3600"))
+        self.prefix=prefix
+        self.load_limit=load_limit
+        self.last_report:Optional[Dict[str,Any]]=None
+        self.task:Optional[asyncio.Task]=None
+        self._sweep_lock=asyncio.Lock()
+
+    def start(self):
+        self.task=asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error sweeping memories: {e}")
+                traceback.print_exc()
+                metrics.incr("memory_sweeper.errors")
+
+    async def flush_access(self) -> int:
+        """Write the recalls counted since the last flush to the memories, returns the number of memories updated"""
+        updated=0
+        for (namespace,key),(count,last_recalled) in memory_index.take_pending_access().items():
+            # same lock as the dedup merge/update of store_messages, so neither overwrites the other
+            async with memory_index.key_lock(namespace,key):
+                item=await self.store.aget(namespace,key)
+                if item is None:
+                    continue
+                value=stored_value(item.value) # also moves an old inline embedding out of the value
+                value[ACCESS_COUNT_FIELD]=value.get(ACCESS_COUNT_FIELD,0)+count
+                value[LAST_RECALLED_FIELD]=format_timestamp(last_recalled)
+                await self.store.aput(namespace,key,value)
+            updated+=1
+        return updated
+
+    def select_reclaimable(self, items:List[Item], now:float) -> Tuple[List[Item],List[Item]]:
+        """(expired, evicted) memories of one namespace according to the policy"""
+        expired=[]
+        if self.ttl_days:
+            expired=[item for item in items if now-last_updated_of(item) > self.ttl_days*86400]
+        expired_keys={(tuple(item.namespace),item.key) for item in expired}
+        kept=[item for item in items if (tuple(item.namespace),item.key) not in expired_keys]
+        evicted=[]
+        if self.max_items and len(kept) > self.max_items:
+            kept.sort(key=lambda item: (last_recalled_of(item),item.value.get(ACCESS_COUNT_FIELD,0)))
+            evicted=kept[:len(kept)-self.max_items]
+        return expired,evicted
+
+    async def sweep(self) -> Dict[str,Any]:
+        """One retention pass over every namespace below the prefix"""
+        async with self._sweep_lock:
+            start=time.perf_counter()
+            now=time.time()
+            report={"namespaces":0,"scanned":0,"expired":0,"evicted":0,"access_flushed":await self.flush_access()}
+            # retention is opt-in: with neither a TTL nor a cap only the recall counts are written
+            namespaces=await self.store.alist_namespaces(prefix=self.prefix,limit=self.load_limit) if self.ttl_days or self.max_items else []
+            for namespace in namespaces:
+                namespace=tuple(namespace)
+                items=[item for item in await self.store.asearch(namespace,limit=self.load_limit) if tuple(item.namespace) == namespace]
+                expired,evicted=self.select_reclaimable(items,now)
+                for item in expired+evicted:
+                    await adelete_memory(self.store,namespace,item.key)
+                    memory_index.delete(namespace,item.key)
+                report["namespaces"]+=1
+                report["scanned"]+=len(items)
+                report["expired"]+=len(expired)
+                report["evicted"]+=len(evicted)
+            report["seconds"]=round(time.perf_counter()-start,3)
+            report["finished_at"]=format_timestamp(now)
+            self.last_report=report
+            metrics.incr("memory_sweeper.sweeps")
+            metrics.incr("memory_sweeper.expired",report["expired"])
+            metrics.incr("memory_sweeper.evicted",report["evicted"])
+            print(f"----- memory sweep: {report}")
+            return report
+
+    def stats(self) -> Dict[str,Any]:
+        return {
+            "ttl_days": self.ttl_days,
+            "max_items": self.max_items,
+            "pending_access": len(memory_index.pending_access),
+            "last_report": self.last_report,
+        }
+
+    async def close(self):
+        """Stop the periodic sweeps, the pending recall counts are still written"""
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task,return_exceptions=True)
+            self.task=None
+        try:
+            await self.flush_access()
+        except Exception as e:
+            print(f"Error flushing memory access counts: {e}")
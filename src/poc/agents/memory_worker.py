@@ -0,0 +1,123 @@
+import asyncio
+import os
+import time
+import traceback
+from typing import Any,Awaitable,Callable,Dict,List,Optional
+from langchain_core.messages.base import BaseMessage
+from langchain_core.runnables.config import RunnableConfig
+from .metrics import metrics
+
+
+class PendingExtraction:
+    """Turns of a thread waiting for memory extraction, coalesced into one job"""
+
+    def __init__(self, config:RunnableConfig):
+        self.config=config
+        self.messages:Dict[str,BaseMessage]={} # id -> message, in order of arrival
+        self.turns=0
+        self.first_submitted_at=time.time()
+        self.queued=False
+        self.idle_timer:Optional[asyncio.Task]=None
+
+    def add(self, config:RunnableConfig, chat_messages:List[BaseMessage]):
+        self.config=config
+        for msg in chat_messages:
+            self.messages[msg.id or str(len(self.messages))]=msg
+        self.turns+=1
+
+
+class MemoryExtractionWorker:
+    """
+    Runs the long-term memory extraction out of the user facing run.
+    Finished turns are submitted per thread and coalesced: a thread is extracted once every
+    `every_turns` turns, or after `idle_seconds` without a new turn, by at most `concurrency` workers.
+    Queue depth and lag (first coalesced turn -> extraction start) are exposed as metrics.
+    """
+
+    def __init__(self, extract:Callable[[List[BaseMessage],RunnableConfig],Awaitable[Any]], every_turns:Optional[int]=None, idle_seconds:Optional[float]=None, concurrency:Optional[int]=None):
+        self.extract=extract
+        self.every_turns=every_turns or int(os.environ.get("MEMORY_EXTRACT_EVERY_TURNS","3"))
+        self.idle_seconds=idle_seconds if idle_seconds is not None else float(os.environ.get("MEMORY_EXTRACT_IDLE_SECONDS","60"))
+        self.concurrency=concurrency or int(os.environ.get("MEMORY_EXTRACT_WORKERS","2"))
+        self.queue:asyncio.Queue[str]=asyncio.Queue()
+        self.pending:Dict[str,PendingExtraction]={}
+        self.workers:List[asyncio.Task]=[]
+
+    def start(self):
+        self.workers=[asyncio.create_task(self._work(index)) for index in range(self.concurrency)]
+
+    def submit(self, config:RunnableConfig, chat_messages:List[BaseMessage]):
+        """Hand over the messages of a finished turn, returns immediately"""
+        thread_id=config["configurable"]["thread_id"]
+        job=self.pending.get(thread_id)
+        if job is None:
+            job=self.pending[thread_id]=PendingExtraction(config)
+        else:
+            metrics.incr("memory_worker.coalesced_turns")
+        job.add(config,chat_messages)
+        if job.queued:
+            return
+        if job.turns >= self.every_turns:
+            self._enqueue(thread_id,job)
+        else:
+            if job.idle_timer:
+                job.idle_timer.cancel()
+            job.idle_timer=asyncio.create_task(self._enqueue_when_idle(thread_id,job))
+
+    def _enqueue(self, thread_id:str, job:PendingExtraction):
+        if job.idle_timer:
+            job.idle_timer.cancel()
+            job.idle_timer=None
+        job.queued=True
+        self.queue.put_nowait(thread_id)
+        metrics.set_gauge("memory_worker.queue_depth",self.queue.qsize())
+
+    async def _enqueue_when_idle(self, thread_id:str, job:PendingExtraction):
+        await asyncio.sleep(self.idle_seconds)
+        if self.pending.get(thread_id) is job and not job.queued:
+            job.idle_timer=None
+            self._enqueue(thread_id,job)
+
+    async def _work(self, index:int):
+        while True:
+            thread_id=await self.queue.get()
+            metrics.set_gauge("memory_worker.queue_depth",self.queue.qsize())
+            job=self.pending.pop(thread_id,None)
+            try:
+                if job:
+                    lag=time.time()-job.first_submitted_at
+                    metrics.observe("memory_worker.lag_seconds",lag)
+                    metrics.set_gauge("memory_worker.last_lag_seconds",lag)
+                    with metrics.timer("memory_worker.extraction_seconds"):
+                        await self.extract(list(job.messages.values()),job.config)
+                    metrics.incr("memory_worker.extractions")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error extracting memories of thread {thread_id}: {e}")
+                traceback.print_exc()
+                metrics.incr("memory_worker.errors")
+            finally:
+                self.queue.task_done()
+
+    def stats(self) -> Dict[str,Any]:
+        now=time.time()
+        return {
+            "queue_depth": self.queue.qsize(),
+            "pending_threads": len(self.pending),
+            "oldest_pending_seconds": max([now-job.first_submitted_at for job in self.pending.values()],default=0.0),
+        }
+
+    async def close(self, flush_timeout:float=10.0):
+        """Extract whatever is still pending (bounded by flush_timeout), then stop the workers"""
+        for thread_id,job in list(self.pending.items()):
+            if not job.queued:
+                self._enqueue(thread_id,job)
+        try:
+            await asyncio.wait_for(self.queue.join(),timeout=flush_timeout)
+        except asyncio.TimeoutError:
+            print(f"----- memory worker stopped with {self.queue.qsize()} pending extractions")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers,return_exceptions=True)
+        self.workers=[]
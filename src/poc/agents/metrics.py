@@ -0,0 +1,65 @@
+import threading
+import time
+from typing import Dict,Any
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Minimal in-process metrics registry (counters, gauges and timings).
+    Values are kept in memory only and exposed through the /metrics endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1):
+        """Increment a counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        """Set a gauge to the current value"""
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        """Record a sample (usually seconds) for a timing"""
+        with self._lock:
+            timing = self.timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["total"] += value
+            timing["max"] = max(timing["max"], value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Context manager recording the elapsed seconds of the block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def ratio(self, numerator: str, denominator: str) -> float:
+        """Ratio of two counters, 0 when the denominator is not recorded yet"""
+        with self._lock:
+            total = self.counters.get(denominator, 0)
+            return self.counters.get(numerator, 0) / total if total else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy of all the recorded values"""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "timings": {
+                    name: {**timing, "avg": timing["total"] / timing["count"] if timing["count"] else 0.0}
+                    for name, timing in self.timings.items()
+                },
+            }
+
+
+metrics = Metrics()
@@ -0,0 +1,213 @@
+import asyncio,json
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict,List,Optional,Tuple,Any
+import numpy as np
+from .state import PlanOutputModal
+from .utils import local_embed
+from .metrics import metrics
+
+
+def normalize_query(query:str) -> str:
+    """Lower case and collapse the whitespaces/punctuation so trivially different queries embed the same way"""
+    query=query.lower().strip()
+    query=re.sub(r"[^\w\s]"," ",query)
+    return re.sub(r"\s+"," ",query).strip()
+
+def catalog_hash(catalog:Any) -> str:
+    """Stable hash of the available agents and tools, plans are only reused for the same catalog"""
+    return hashlib.sha256(json.dumps(catalog,default=str,sort_keys=True).encode("utf-8")).hexdigest()
+
+def context_digest(context:str) -> str:
+    """Hash of the conversation before the user query, a plan is only reused in the same context"""
+    return hashlib.sha256(normalize_query(context).encode("utf-8")).hexdigest()[:16]
+
+# queries that only make sense with the conversation they answer
+DEICTIC_WORDS={"yes","no","ok","okay","sure","continue","go","ahead","proceed","again","same","that","this","it","those","these","above","previous","retry","do"}
+
+def is_cacheable_query(query:str, min_words:int=4) -> bool:
+    """Short or deictic queries ("yes, do it", "continue") are never cached nor looked up"""
+    words=normalize_query(query).split()
+    if len(words) < min_words:
+        return False
+    return not (len(words) <= 2*min_words and sum(word in DEICTIC_WORDS for word in words)*2 >= len(words))
+
+# step__{step_sequence}_{random_character}__${agent_name}__${tool_name}
+STEP_UID_RE=re.compile(r"^step__(\d+)_([A-Za-z0-9]+)(_.*)$")
+
+
+class PlanCache:
+    """
+    Semantic cache of generated plans.
+    The normalized user query is embedded with the local model and compared (cosine) with the queries
+    of previously generated plans for the same key (plan prompt version + digest of the conversation context),
+    above the threshold the plan is reused. Only plans that ran successfully are stored, a plan that fails is removed.
+    Entries are persisted in sqlite (at most `max_entries` rows, the oldest are pruned on insert) and mirrored
+    in memory as one normalized matrix per key.
+    """
+
+    def __init__(self, db_file:str="data/plan_cache.sqlite", threshold:float=0.92, max_entries:int=500, min_query_words:Optional[int]=None):
+        self.db_file=db_file
+        self.threshold=threshold
+        self.max_entries=max_entries
+        self.min_query_words=min_query_words or int(os.environ.get("PLAN_CACHE_MIN_QUERY_WORDS","4"))
+        self._lock=threading.Lock()
+        self.conn:sqlite3.Connection=None
+        # cache key -> (embeddings matrix, [(plan_json, planning_seconds, entry id)])
+        self.entries:Dict[str,Tuple[np.ndarray,List[Tuple[str,float,int]]]]={}
+        self.order:List[Tuple[str,int]]=[] # (cache key, entry id) oldest first, bounded by max_entries
+        self.next_id=-1 # ids of the entries not persisted (no sqlite connection)
+
+    @staticmethod
+    def cache_key(_catalog_hash:str, _context_digest:str) -> str:
+        return f"{_catalog_hash}:{_context_digest}"
+
+    def setup(self):
+        os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+        self.conn=sqlite3.connect(self.db_file,check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS plan_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                catalog_hash TEXT NOT NULL,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                plan TEXT NOT NULL,
+                planning_seconds REAL NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS plan_cache_catalog ON plan_cache(catalog_hash, id)")
+        self._prune()
+        self.conn.commit()
+        rows=self.conn.execute("SELECT id, catalog_hash, embedding, plan, planning_seconds FROM plan_cache ORDER BY id").fetchall()
+        for entry_id,key,embedding,plan_json,planning_seconds in rows:
+            self._add_entry(key,np.frombuffer(embedding,dtype=np.float32),plan_json,planning_seconds,entry_id)
+        print(f"----- plan cache loaded {len(rows)} plans")
+
+    def _prune(self):
+        """Keep the newest max_entries rows"""
+        self.conn.execute("DELETE FROM plan_cache WHERE id NOT IN (SELECT id FROM plan_cache ORDER BY id DESC LIMIT ?)",(self.max_entries,))
+
+    def _add_entry(self, key:str, embedding:np.ndarray, plan_json:str, planning_seconds:float, entry_id:int):
+        matrix,plans=self.entries.get(key,(np.zeros((0,embedding.shape[0]),dtype=np.float32),[]))
+        self.entries[key]=(np.vstack([matrix,embedding[None,:]]),plans+[(plan_json,planning_seconds,entry_id)])
+        self.order.append((key,entry_id))
+        while len(self.order) > self.max_entries:
+            self._remove_entry(*self.order[0])
+
+    def _remove_entry(self, key:str, entry_id:int):
+        self.order=[(k,i) for k,i in self.order if i != entry_id]
+        matrix,plans=self.entries.get(key,(None,[]))
+        keep=[index for index,plan in enumerate(plans) if plan[2] != entry_id]
+        if len(keep) == len(plans):
+            return
+        if keep:
+            self.entries[key]=(matrix[keep],[plans[index] for index in keep])
+        else:
+            del self.entries[key]
+
+    def _lookup(self, query:str, key:str) -> Optional[Tuple[PlanOutputModal,float,float,int]]:
+        with self._lock:
+            matrix,plans=self.entries.get(key,(None,[]))
+        if not plans:
+            return None
+        scores=matrix@local_embed([normalize_query(query)])[0]
+        best=int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        plan_json,planning_seconds,entry_id=plans[best]
+        return self.with_fresh_step_uids(PlanOutputModal.model_validate_json(plan_json)),float(scores[best]),planning_seconds,entry_id
+
+    def _store(self, query:str, key:str, plan_json:str, planning_seconds:float):
+        embedding=local_embed([normalize_query(query)])[0]
+        with self._lock:
+            if self.conn:
+                cursor=self.conn.execute(
+                    "INSERT INTO plan_cache (catalog_hash, query, embedding, plan, planning_seconds, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key,query,embedding.tobytes(),plan_json,planning_seconds,time.time())
+                )
+                entry_id=cursor.lastrowid
+                self._prune()
+                self.conn.commit()
+            else:
+                entry_id=self.next_id
+                self.next_id-=1
+            self._add_entry(key,embedding,plan_json,planning_seconds,entry_id)
+
+    def _invalidate(self, key:str, entry_id:int):
+        with self._lock:
+            self._remove_entry(key,entry_id)
+            if self.conn:
+                self.conn.execute("DELETE FROM plan_cache WHERE id = ?",(entry_id,))
+                self.conn.commit()
+
+    async def alookup(self, query:str, key:str) -> Optional[Tuple[PlanOutputModal,int]]:
+        """(copy of the closest cached plan with fresh step_uids, entry id) if it is above the threshold"""
+        if not is_cacheable_query(query,self.min_query_words):
+            metrics.incr("plan_cache.skipped")
+            return None
+        metrics.incr("plan_cache.lookups")
+        try:
+            result=await asyncio.to_thread(self._lookup,query,key)
+        except Exception as e:
+            print(f"Error looking up plan cache: {e}")
+            result=None
+        if result is None:
+            metrics.incr("plan_cache.misses")
+            metrics.set_gauge("plan_cache.hit_rate",metrics.ratio("plan_cache.hits","plan_cache.lookups"))
+            return None
+        plan,score,planning_seconds,entry_id=result
+        print(f"----- plan cache hit (similarity={score:.3f}), saved ~{planning_seconds:.1f}s of planning")
+        metrics.incr("plan_cache.hits")
+        metrics.incr("plan_cache.time_saved_seconds",planning_seconds)
+        metrics.set_gauge("plan_cache.hit_rate",metrics.ratio("plan_cache.hits","plan_cache.lookups"))
+        return plan,entry_id
+
+    async def astore(self, query:str, key:str, plan_json:str, planning_seconds:float):
+        """Remember a generated plan for the query, once it has run successfully"""
+        if not is_cacheable_query(query,self.min_query_words):
+            return
+        try:
+            await asyncio.to_thread(self._store,query,key,plan_json,planning_seconds)
+            metrics.incr("plan_cache.stored")
+        except Exception as e:
+            print(f"Error storing plan in plan cache: {e}")
+
+    async def ainvalidate(self, key:str, entry_id:int):
+        """Forget a cached plan whose run failed"""
+        try:
+            await asyncio.to_thread(self._invalidate,key,entry_id)
+            metrics.incr("plan_cache.invalidated")
+        except Exception as e:
+            print(f"Error invalidating plan cache entry: {e}")
+
+    @staticmethod
+    def with_fresh_step_uids(plan:PlanOutputModal) -> PlanOutputModal:
+        """Regenerate the random part of the step_uids (and the references to them) so a reused plan never collides with a previous run"""
+        uid_map:Dict[str,str]={}
+        for index,step in enumerate(plan.plan):
+            random_character=uuid.uuid4().hex[:4].upper()
+            match=STEP_UID_RE.match(step.step_uid)
+            if match:
+                uid_map[step.step_uid]=f"step__{match.group(1)}_{random_character}{match.group(3)}"
+            else:
+                tool_name=step.available_tools[0] if step.available_tools else ""
+                uid_map[step.step_uid]=f"step__{index+1:03d}_{random_character}___{step.agent_name}__{tool_name}"
+        for step in plan.plan:
+            step.step_uid=uid_map[step.step_uid]
+            step.status="pending"
+            step.response_token_size=None
+            step.weight_of_current_response=None
+            for prev_resp in step.response_from_previous_step:
+                prev_resp.step_uid=uid_map.get(prev_resp.step_uid,prev_resp.step_uid)
+        return plan
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn=None
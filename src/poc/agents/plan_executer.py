@@ -1,5 +1,5 @@
 import asyncio,json
-from typing import Annotated, NotRequired,Dict,Optional,Any,cast
+from typing import Annotated, NotRequired,Dict,Optional,Any,cast,Callable,Awaitable
 from langgraph.prebuilt import InjectedState,InjectedStore, create_react_agent
 from typing import TypedDict, Literal,List
 from langchain_ollama import ChatOllama
@@ -48,8 +48,9 @@ from .coding_agent import CodingAgent
 from .research_agent import ResearchAgent
 from .structured_output import StructuredOutputAgent
 from langgraph_supervisor.handoff import create_forward_message_tool
-from .state import ChatState,SupervisorNode,PlanOutputModal,CodeSnippetsStructure,StepModal
+from .state import ChatState,SupervisorNode,PlanOutputModal,CodeSnippetsStructure,StepModal,replace_messages
 from .utils import get_aws_modal,max_tokens,AsyncSqliteSaverWrapper,create_handoff_back_node,get_aws_embed_model
+from .context_index import context_index
 from langgraph_supervisor import create_supervisor
 from langchain_core.language_models import BaseChatModel, LanguageModelLike
 from langchain_core.output_parsers import PydanticOutputParser
@@ -59,10 +60,14 @@ from langchain_core.tools import BaseTool
 from langchain_core.callbacks.manager import adispatch_custom_event
 import warnings
 from langmem.short_term import SummarizationNode,summarize_messages,RunningSummary
-from langchain_experimental.text_splitter import SemanticChunker
 from langchain_aws import AmazonKnowledgeBasesRetriever
-from langchain_aws.vectorstores.inmemorydb import InMemoryVectorStore
 from langchain.docstore.document import Document
+from langchain_core.utils.json import parse_partial_json
+from langgraph.errors import GraphInterrupt
+from langgraph._internal._runnable import RunnableCallable
+from .plan_cache import PlanCache,catalog_hash,context_digest
+import time
+import hashlib
 
 
 
@@ -134,6 +139,8 @@ plan_prompt="""
         {output_schema}        
         """
 
+plan_request_message="Generate the plan for the user's query in the above conversation, strictly following the planning instructions."
+
 
 class PlanExecuter:   
     def __init__(self):
@@ -144,6 +151,15 @@ class PlanExecuter:
         self.tool_node = None
         self.graph = None
         self.agents=[]
+        self.agent_nodes:Dict[str,RunnableCallable]={}
+        self.plan_cache:PlanCache=None
+        self.tools_catalog:List[Dict[str,Any]]=[]
+        self.tools_catalog_hash:str=None
+        self.plan_prompt_text:str=None
+        self.plan_prompt_version:str=None
+        self.context_selection=os.environ.get("PLAN_CONTEXT_SELECTION","semantic") # semantic | summary
+        self.interrupted_plans:Dict[str,PlanOutputModal]={} # init_conversation task namespace -> plan whose early dispatched step was interrupted
+        self.plan_runs:Dict[str,Dict[str,Any]]={} # thread_id -> plan being executed, stored in (or removed from) the plan cache at its end
         self.system_message="""
             - You are an supervisor agent, responsible for overseeing and managing other agents.
             - Decide the required tool call to execute agent at the beginning and don't forget to execute planned agents and may be you can understanding each agent by executing first it with dummy query or any /help command like query and list all the available tool for planning then start real execution with real query may be you can retry the original user query usually it will be first message.
@@ -158,19 +174,192 @@ class PlanExecuter:
 
         
     
-    async def init_conversation(self, state: ChatState, config: RunnableConfig) ->  Command[Literal[SupervisorNode.ROUTE]]: # get_state won't  work properly in initial conv
-        """Initialize the conversation state"""     
-        tools=[]
+    async def stream_plan(self, plan_payload: List[messages.BaseMessage], on_step: Callable[[int, StepModal], Awaitable[None]]) -> PlanOutputModal:
+        """Stream the plan tool call and hand every step to `on_step` as soon as its JSON is complete"""
+        plan_llm=self.base_llm.bind_tools([PlanOutputModal],tool_choice=PlanOutputModal.__name__)
+        gathered:Optional[messages.AIMessageChunk]=None
+        emitted=0
+        early_emit=True
+
+        def get_args() -> str:
+            if gathered is None or not gathered.tool_call_chunks:
+                return ""
+            return gathered.tool_call_chunks[0].get("args") or ""
+
+        async for chunk in plan_llm.astream(plan_payload):
+            gathered=chunk if gathered is None else gathered+chunk
+            if not early_emit:
+                continue
+            try:
+                partial_plan=parse_partial_json(get_args()) or {}
+            except Exception:
+                continue
+            raw_steps=partial_plan.get("plan") if isinstance(partial_plan,dict) else None
+            if not isinstance(raw_steps,list):
+                continue
+            # the last step may still be streaming, every step before it is complete
+            while emitted < len(raw_steps)-1:
+                try:
+                    step=StepModal.model_validate(raw_steps[emitted])
+                except Exception as e:
+                    print(f"----- unable to parse streamed plan step {emitted}, waiting for the complete plan: {e}")
+                    early_emit=False
+                    break
+                await on_step(emitted,step)
+                emitted+=1
+
+        plan=PlanOutputModal.model_validate(parse_partial_json(get_args()))
+        for index in range(emitted,len(plan.plan)):
+            await on_step(index,plan.plan[index])
+        return plan
+
+    def compile_plan_prompt(self):
+        """Build the static planning prompt segments once, versioned by the hash of their content"""
+        self.tools_catalog=[]
         for agent in self.agents:
             graph:CompiledStateGraph=agent.graph
             agent_tools:list[BaseTool]=agent.tools
-            tools.append({
+            self.tools_catalog.append({
                 "agent_name":graph.name,
                 "agent_description":agent.descriptions,
                 "tools":[{"name":tool.name,"description":tool.description,"args":tool.args} for tool in agent_tools]
             })
-
-        plan:PlanOutputModal=await self.base_llm.with_structured_output(PlanOutputModal).ainvoke([messages.SystemMessage(content=self.system_message,id=str(uuid.uuid4()))]+state["messages"]+[messages.HumanMessage(content=plan_prompt.format(tools=json.dumps(tools,default=str),output_schema=plan_structure_parser.get_format_instructions(),code_structure=code_structure_parser.get_format_instructions(),max_tokens=max_tokens), id=str(uuid.uuid4()))])
+        self.tools_catalog_hash=catalog_hash(self.tools_catalog)
+        self.plan_prompt_text=plan_prompt.format(
+            tools=json.dumps(self.tools_catalog,default=str,sort_keys=True),
+            output_schema=plan_structure_parser.get_format_instructions(),
+            code_structure=code_structure_parser.get_format_instructions(),
+            max_tokens=max_tokens
+        )
+        self.plan_prompt_version=hashlib.sha256((self.system_message+self.plan_prompt_text).encode("utf-8")).hexdigest()[:16]
+        print(f"----- compiled plan prompt version={self.plan_prompt_version}, tools_catalog_hash={self.tools_catalog_hash[:16]}, approx tokens={count_tokens_approximately([self.plan_prompt_text])}")
+
+    def get_user_query(self, chat_messages:List[messages.BaseMessage]) -> str:
+        """Text of the latest user message, used as the plan cache key"""
+        for msg in reversed(chat_messages):
+            if isinstance(msg,messages.HumanMessage):
+                if isinstance(msg.content,str):
+                    return msg.content
+                return " ".join(part.get("text","") if isinstance(part,dict) else str(part) for part in msg.content)
+        return ""
+
+    def get_plan_cache_key(self, chat_messages:List[messages.BaseMessage]) -> str:
+        """Plan prompt version + digest of the conversation before the latest user message"""
+        last_human=max([index for index,msg in enumerate(chat_messages) if isinstance(msg,messages.HumanMessage)],default=0)
+        return self.plan_cache.cache_key(self.plan_prompt_version,context_digest(get_buffer_string(chat_messages[:last_human])))
+
+    async def finish_plan_run(self, thread_id:str, plan:Optional[PlanOutputModal]):
+        """Cache the plan of a successful run, forget a cached plan that failed (plan is None when the run did not complete)"""
+        run=self.plan_runs.pop(thread_id,None)
+        if not run or not self.plan_cache:
+            return
+        succeeded=plan is not None and all(step.status == "completed" for step in plan.plan)
+        if run["entry_id"] is not None:
+            if not succeeded:
+                print(f"----- cached plan failed, removed from the plan cache")
+                await self.plan_cache.ainvalidate(run["cache_key"],run["entry_id"])
+        elif succeeded:
+            await self.plan_cache.astore(run["query"],run["cache_key"],run["plan_json"],run["planning_seconds"])
+
+    async def init_conversation(self, state: ChatState, config: RunnableConfig) ->  Command[Literal[SupervisorNode.ROUTE,SupervisorNode.POST_AGENT_EXECUTION]]: # get_state won't  work properly in initial conv
+        """Initialize the conversation state"""     
+        # static prefix (system message + compiled plan instructions) stays byte-identical across runs, only the conversation varies
+        plan_payload=[
+            messages.SystemMessage(content=self.system_message,id=str(uuid.uuid4())),
+            messages.SystemMessage(content=self.plan_prompt_text,id=str(uuid.uuid4())),
+        ]+state["messages"]+[messages.HumanMessage(content=plan_request_message, id=str(uuid.uuid4()))]
+
+        early_step:Optional[StepModal]=None
+        early_messages:List[messages.BaseMessage]=[]
+        early_task:Optional[asyncio.Task]=None
+        # the task namespace of this node is the same when it is re-executed to resume an interrupt
+        task_ns=config["configurable"].get("checkpoint_ns","")
+        resuming=bool(config["configurable"].get("__pregel_resuming"))
+        interrupted_plan=self.interrupted_plans.pop(task_ns,None) if resuming else None
+        # on resume the early step is dispatched again only with the plan it was interrupted in (same step_uid, its subgraph
+        # resumes from its checkpoint), otherwise the plan is checkpointed first and the step runs in its own node
+        early_dispatch=not resuming or interrupted_plan is not None
+
+        async def run_early_step(step:StepModal):
+            agent_output:ChatState=await self.agent_nodes[step.agent_name].ainvoke(
+                {
+                    **state,
+                    "tool_call_count":0,
+                    "active_step":step,
+                    "messages":early_messages
+                },
+                config
+            )
+            # streamed as soon as the step completes, not when the next step starts
+            step_result=messages.BaseMessage(
+                type="plan_step_response",
+                content=[{
+                    "type":"plan_step_response",
+                    "step_uid":step.step_uid,
+                    "text":get_buffer_string(agent_output["messages"][-1:])
+                }],
+                id=str(uuid.uuid4()),
+                additional_kwargs={
+                    "output":True
+                }
+            )
+            await adispatch_custom_event("plan_step_response",{"chunk":step_result},config=config)
+            return agent_output
+
+        async def on_step(index:int,step:StepModal):
+            nonlocal early_step,early_messages,early_task
+            step_response=messages.BaseMessage(
+                type="plan_step",
+                content=[{
+                    "type":"plan_step",
+                    "step_uid":step.step_uid,
+                    "text":step.model_dump_json(indent=2)
+                }], 
+                id=str(uuid.uuid4()),
+                additional_kwargs={
+                    "output":True
+                }
+            )
+            await adispatch_custom_event("plan_step",{"chunk":step_response},config=config)
+            # start the first step while the rest of the plan is still being generated
+            if early_dispatch and index==0 and not step.response_from_previous_step and step.agent_name in self.agent_nodes:
+                print(f"----- early dispatch of {step.step_uid} to {step.agent_name}")
+                early_step=step
+                early_messages=self.build_step_messages([step],step)
+                early_task=asyncio.create_task(run_early_step(step))
+
+        thread_id=config["configurable"].get("thread_id","")
+        if not resuming:
+            # the previous plan of the thread never reached the end of the conversation
+            await self.finish_plan_run(thread_id,None)
+        user_query=self.get_user_query(state["messages"])
+        plan:Optional[PlanOutputModal]=interrupted_plan
+        plan_run:Optional[Dict[str,Any]]=None
+        if plan is None and self.plan_cache and user_query:
+            cache_key=self.get_plan_cache_key(state["messages"])
+            plan_run={"query":user_query,"cache_key":cache_key,"entry_id":None,"plan_json":None,"planning_seconds":0.0}
+            cached=await self.plan_cache.alookup(user_query,cache_key)
+            if cached:
+                plan,plan_run["entry_id"]=cached
+        try:
+            if plan:
+                for index,step in enumerate(plan.plan):
+                    await on_step(index,step)
+            else:
+                planning_start=time.perf_counter()
+                plan=await self.stream_plan(plan_payload,on_step)
+                if plan_run:
+                    # stored only once the plan has run successfully (finish_plan_run)
+                    plan_run["plan_json"]=plan.model_dump_json()
+                    plan_run["planning_seconds"]=time.perf_counter()-planning_start
+        except BaseException:
+            if early_task:
+                early_task.cancel()
+            raise
+        if plan_run:
+            self.plan_runs[thread_id]=plan_run
+            while len(self.plan_runs) > 1000:
+                self.plan_runs.pop(next(iter(self.plan_runs)))
 
         plan_map:Dict[str,StepModal]={}
         for step in plan.plan:
@@ -196,7 +385,36 @@ class PlanExecuter:
                 "output":True
             }
         )
-        await adispatch_custom_event("plan",{"chunk":response},config=config)
+        try:
+            await adispatch_custom_event("plan",{"chunk":response},config=config)
+        except BaseException:
+            if early_task:
+                early_task.cancel()
+            raise
+
+        if early_task:
+            try:
+                agent_output:ChatState=await early_task
+                if plan.plan and plan.plan[0].step_uid==early_step.step_uid:
+                    return Command(
+                        update={
+                            "plan": plan,
+                            "original_messages":state["messages"],
+                            "active_step":early_step,
+                            "messages":replace_messages(early_messages+agent_output["messages"]),
+                            "tool_call_count":agent_output.get("tool_call_count",0)
+                        },
+                        goto=SupervisorNode.POST_AGENT_EXECUTION_VAL
+                    )
+            except GraphInterrupt:
+                # resumed by re-executing this node: keep the plan so the same step is dispatched again and resumes
+                self.interrupted_plans[task_ns]=plan
+                while len(self.interrupted_plans) > 100: # never resumed interrupts
+                    self.interrupted_plans.pop(next(iter(self.interrupted_plans)))
+                raise
+            except Exception as e:
+                print(f"Error in early dispatched step {early_step.step_uid}, falling back to route: {e}")
+                traceback.print_exc()
 
         return Command(
             update={
@@ -206,8 +424,36 @@ class PlanExecuter:
             goto=SupervisorNode.ROUTE_VAL
         )
     
-   
- 
+    def build_step_messages(self, plans:List[StepModal], plan:StepModal) -> List[messages.BaseMessage]:
+        """Build the input messages for the agent executing the given step of the plan"""
+        instructions=plan.model_dump()
+        print("\n---instructions",instructions)
+        response_from_previous_step:Dict[str,float]={}
+        for resp in plan.response_from_previous_step:
+            response_from_previous_step[resp.step_uid] = resp.weight
+        dependent_response=[(f"# with importance weight value for current following information: {response_from_previous_step[dependent_plan.step_uid]} of 100,\n\n{dependent_plan.response.content}") for dependent_plan in plans if dependent_plan.step_uid in response_from_previous_step and dependent_plan.response is not None]
+        try:
+            dependent_response=[(f"# with importance weight value for current following information: {response_from_previous_step[dependent_plan.step_uid]} of 100,\n\n{get_buffer_string([dependent_plan.response])}") for dependent_plan in plans if dependent_plan.step_uid in response_from_previous_step and dependent_plan.response]
+        except Exception as e:
+            print(f"Error processing dependent responses: {e}")
+        # total_input_tokens = sum(dependent_plan.response_token_size for dependent_plan in plans if dependent_plan.step_uid in plan.response_from_previous_step and dependent_plan.response_token_size is not None)
+        del instructions["step_uid"]
+        del instructions["agent_name"]
+        del instructions["response"]
+        del instructions["response_from_previous_step"]
+        del instructions["response_token_size"]
+        del instructions["status"]
+
+
+        # AmazonKnowledgeBaseRetriever
+        # get_aws_embed_model().
+
+        return [
+            # state["original_messages"][0],
+            messages.HumanMessage(content=f"current query: {plan.instruction}",id=str(uuid.uuid4())),
+            messages.HumanMessage(content=f"complete instructions:\n {json.dumps(instructions,default=str)}\n\n Depend on the responses(knowledge base):\n{dependent_response}",id=str(uuid.uuid4()))
+        ]
+
     def route_node(self, state:ChatState,config: RunnableConfig) -> Command[Literal[SupervisorNode.CODING_AGENT,SupervisorNode.RESEARCH_AGENT,SupervisorNode.STRUCTURED_OUTPUT_AGENT, SupervisorNode.END_CONV]]:
         """Route node - handles all routing logic using Command pattern"""
         last_message = state['messages'][0]
@@ -220,36 +466,11 @@ class PlanExecuter:
         for plan in plans:
             print(f"\n---plan",plan,type(plan))
             if plan.status == "pending":
-                instructions=plan.model_dump()
-                print("\n---instructions",instructions)
-                response_from_previous_step:Dict[str,float]={}
-                for resp in plan.response_from_previous_step:
-                    response_from_previous_step[resp.step_uid] = resp.weight
-                dependent_response=[(f"# with importance weight value for current following information: {response_from_previous_step[dependent_plan.step_uid]} of 100,\n\n{dependent_plan.response.content}") for dependent_plan in plans if dependent_plan.step_uid in response_from_previous_step and dependent_plan.response is not None]
-                try:
-                    dependent_response=[(f"# with importance weight value for current following information: {response_from_previous_step[dependent_plan.step_uid]} of 100,\n\n{get_buffer_string([dependent_plan.response])}") for dependent_plan in plans if dependent_plan.step_uid in response_from_previous_step and dependent_plan.response]
-                except Exception as e:
-                    print(f"Error processing dependent responses: {e}")
-                # total_input_tokens = sum(dependent_plan.response_token_size for dependent_plan in plans if dependent_plan.step_uid in plan.response_from_previous_step and dependent_plan.response_token_size is not None)
-                del instructions["step_uid"]
-                del instructions["agent_name"]
-                del instructions["response"]
-                del instructions["response_from_previous_step"]
-                del instructions["response_token_size"]
-                del instructions["status"]
-
-
-                # AmazonKnowledgeBaseRetriever
-                # get_aws_embed_model().
-
                 return Command(
                     update={
                         "tool_call_count":0,
-                        'messages':  [
-                            # state["original_messages"][0],
-                            messages.HumanMessage(content=f"current query: {plan.instruction}",id=str(uuid.uuid4())),
-                            messages.HumanMessage(content=f"complete instructions:\n {json.dumps(instructions,default=str)}\n\n Depend on the responses(knowledge base):\n{dependent_response}",id=str(uuid.uuid4()))
-                        ]
+                        "active_step":plan,
+                        'messages': replace_messages(self.build_step_messages(plans,plan))
                     },
                     goto=plan.agent_name
                 )
@@ -260,43 +481,11 @@ class PlanExecuter:
             goto=SupervisorNode.END_CONV_VAL
         )
 
-    def get_relevant_context(self, query:str, response: List[messages.BaseMessage], token_limit) -> str:
+    def get_relevant_context(self, query:str, response: List[messages.BaseMessage], token_limit) -> messages.HumanMessage:
         """Extract relevant context from the chat state for the current plan."""
-        embeddings=get_aws_embed_model()
-        semantic_text_splitter=SemanticChunker(
-            embeddings,
-            breakpoint_threshold_type="percentile",
-            breakpoint_threshold_amount=75.0,
-            min_chunk_size=1000
-        )
-        semantic_chunks = semantic_text_splitter.create_documents([get_buffer_string(response)])
-
-        print("----- chunk length:", len(semantic_chunks))
-        print("----- semantic_chunks", semantic_chunks)
-
-        redis_url = "redis://localhost:6379"
-        vector_schema = {"embedding": "VECTOR"}  # schema for embedding field
-        INDEX_NAME = "temp_index"
-
-        vs = InMemoryVectorStore.from_documents(
-            semantic_chunks,
-            embeddings,
-            redis_url=redis_url,
-            vector_schema=vector_schema,
-            index_name=INDEX_NAME,
-        )
-
-        docs = vs.max_marginal_relevance_search(query, k=10000)
-
-        selected:List[str] = []
-        current_tokens = 0
-        for doc in docs:
-            # tlen = doc.metadata["token_length"]
-            tlen=count_tokens_approximately([messages.HumanMessage(content=doc.page_content,id=str(uuid.uuid4()))])
-            if current_tokens + tlen  > token_limit:
-                break
-            selected.append(doc.page_content)
-            current_tokens += tlen
+        # in-process index: cached local embeddings, MMR over NumPy arrays, nothing shared between concurrent calls
+        selected,chunk_count=context_index.relevant_context(query,get_buffer_string(response),token_limit)
+        print(f"----- relevant context: {len(selected)} of {chunk_count} chunks")
 
         return messages.HumanMessage(content=",".join([doc for doc in selected]),id=str(uuid.uuid4()))
         
@@ -307,7 +496,15 @@ class PlanExecuter:
         for plan in plans:
             if plan.status == "pending":
                 plan.status="completed"
-                if plan.step_uid != last_plan.step_uid:
+                if plan.step_uid != last_plan.step_uid and self.context_selection == "semantic":
+                    user_query=self.get_user_query(state["original_messages"])
+                    plan_instruction=plan.instruction
+                    plan_steps=[sub_step for sub_step in plan.sub_steps]
+                    final_query=f"""Based on the user query: {user_query}, and the plan instruction: {plan_instruction}, and the plan steps: {plan_steps}, provide a concise and relevant response that directly addresses the user's needs. Ensure that the response is clear, informative, and free of unnecessary details."""
+                    context_max_tokens=(max_tokens*0.90)*(plan.weight_of_current_response/100)
+                    plan.response=self.get_relevant_context(final_query,state["messages"][-1:],context_max_tokens)
+                    plan.response_token_size=count_tokens_approximately([plan.response]) 
+                elif plan.step_uid != last_plan.step_uid:
                     summary_max_tokens=(max_tokens*0.90)*(plan.weight_of_current_response/100)
                     max_tokens_before_summary=summary_max_tokens*0.80
                     result = summarize_messages(
@@ -324,12 +521,6 @@ class PlanExecuter:
                             msg.id = str(uuid.uuid4())
                     plan.response=result.messages[-1]
 
-                    # user_query=state["messages"][0].content
-                    # plan_instruction=plan.instruction
-                    # plan_steps=[sub_step for sub_step in plan.sub_steps]
-                    # final_query=f"""Based on the user query: {user_query}, and the plan instruction: {plan_instruction}, and the plan steps: {plan_steps}, provide a concise and relevant response that directly addresses the user's needs. Ensure that the response is clear, informative, and free of unnecessary details."""
-                    # plan.response=self.get_relevant_context(final_query,state["messages"][-1:],max_tokens*0.50)
-
                     # plan.response=state["messages"][-1]
                     plan.response_token_size=count_tokens_approximately([plan.response]) 
                 else:
@@ -346,9 +537,10 @@ class PlanExecuter:
         )
 
     async def before_conversation_end(self, state:ChatState,config: RunnableConfig, *, store: BaseStore):
+        await self.finish_plan_run(config["configurable"].get("thread_id",""),state["plan"])
         return Command(
             update={
-                "messages": state["original_messages"] + state["messages"][-1:]
+                "messages": replace_messages(state["original_messages"] + state["messages"][-1:])
             },
             goto=END
         )
@@ -357,7 +549,7 @@ class PlanExecuter:
         """Initialize the agent with MCP tools and LLM"""
 
         # Initialize LLMs
-        self.base_llm = get_aws_modal()        
+        self.base_llm = get_aws_modal(prompt_cache_node=SupervisorNode.PLAN_EXECUTER_VAL)        
 
         self.tools = []        
 
@@ -370,22 +562,30 @@ class PlanExecuter:
         self.agents.append(coding_agent)
         self.agents.append(research_agent)
         self.agents.append(structured_output_agent)
+        self.compile_plan_prompt()
 
         self.llm = self.base_llm.bind_tools(self.tools)            
         self.tool_node = ToolNode(self.tools)
+
+        if os.environ.get("PLAN_CACHE_ENABLED", "true").lower() == "true":
+            self.plan_cache=PlanCache(threshold=float(os.environ.get("PLAN_CACHE_THRESHOLD", "0.92")))
+            self.plan_cache.setup()
       
 
         builder = StateGraph(ChatState)
         builder.add_node(SupervisorNode.START_CONV_VAL, self.init_conversation)
-        builder.add_node(SupervisorNode.CODING_AGENT_VAL, create_handoff_back_node(coding_agent.graph,recursion_limit=100))
-        builder.add_node(SupervisorNode.RESEARCH_AGENT_VAL, create_handoff_back_node(research_agent.graph))
-        builder.add_node(SupervisorNode.STRUCTURED_OUTPUT_AGENT_VAL, create_handoff_back_node(structured_output_agent.graph))
+        self.agent_nodes={
+            SupervisorNode.CODING_AGENT_VAL: create_handoff_back_node(coding_agent.graph,recursion_limit=100),
+            SupervisorNode.RESEARCH_AGENT_VAL: create_handoff_back_node(research_agent.graph),
+            SupervisorNode.STRUCTURED_OUTPUT_AGENT_VAL: create_handoff_back_node(structured_output_agent.graph),
+        }
+        for agent_name,agent_node in self.agent_nodes.items():
+            builder.add_node(agent_name, agent_node)
         builder.add_node(SupervisorNode.ROUTE_VAL, self.route_node)
         builder.add_node(SupervisorNode.POST_AGENT_EXECUTION_VAL, self.post_agent_execution)
         builder.add_node(SupervisorNode.END_CONV_VAL, self.before_conversation_end)
 
         builder.set_entry_point(SupervisorNode.START_CONV_VAL)
-        builder.add_edge(SupervisorNode.START_CONV_VAL, SupervisorNode.ROUTE_VAL)
         builder.add_edge(SupervisorNode.CODING_AGENT_VAL, SupervisorNode.POST_AGENT_EXECUTION_VAL)
         builder.add_edge(SupervisorNode.RESEARCH_AGENT_VAL, SupervisorNode.POST_AGENT_EXECUTION_VAL)
         builder.add_edge(SupervisorNode.STRUCTURED_OUTPUT_AGENT_VAL, SupervisorNode.POST_AGENT_EXECUTION_VAL)
@@ -412,5 +612,7 @@ class PlanExecuter:
                 await agent.close()
             except Exception as e:
                 print(f"Error closing agent {agent}: {e}")
+        if self.plan_cache:
+            self.plan_cache.close()
         
         print("Agent cleanup completed")
@@ -12,6 +12,8 @@ from fastmcp import Client
 from mcp import ClientSession
 from langchain_mcp_adapters.tools import load_mcp_tools
 from .state import ChatState,SupervisorNode
+from .tool_selection import ToolSelector
+from .metrics import metrics
 from langchain_core.tools import tool
 import traceback
 import time
@@ -1638,6 +1640,7 @@ class ResearchAgent:
         self.llm = None
         self.tools = None
         self.tool_node = None
+        self.tool_selector:ToolSelector = None
         self.graph = None
         self.client:Client = None
         self.client_session:ClientSession = None
@@ -1655,16 +1658,16 @@ class ResearchAgent:
             if not hasattr(msg, 'id') or msg.id is None:
                 msg.id = str(uuid.uuid4())
         try:
-            response = await self.llm.ainvoke(chat_messages)
+            llm = await self.tool_selector.abind(state.get("active_step"))
+            with metrics.timer(f"agent.{self.name}.llm_seconds"):
+                response = await llm.ainvoke(chat_messages)
         except Exception as e:
             print(f"Error invoking LLM: {e}\n", chat_messages, traceback.print_exc())
             response = messages.AIMessage(content=f"An error occurred while processing your request. Please try again later. {e}", id=str(uuid.uuid4()))
         
-        updated_messages = chat_messages + [response]
-
         return Command(
             update={
-                'messages': updated_messages,
+                'messages': [response],
             },
             goto="route"
         )
@@ -1674,12 +1677,9 @@ class ResearchAgent:
         ai_msg: messages.AIMessage = state["messages"][-1]
         result = await self.tool_node.ainvoke(state)
 
-        # Combine all messages for the updated state
-        all_updated_messages = state['messages'] + result['messages']
-        
         return Command(
             update={
-                'messages': all_updated_messages,
+                'messages': result['messages'],
                 'tool_call_count': state['tool_call_count'] + 1
             },
             goto="route"
@@ -1722,7 +1722,7 @@ class ResearchAgent:
         # Initialize LLMs
         botocore_cfg = Config(connect_timeout=30, read_timeout=60, retries={'max_attempts': 0})
 
-        self.base_llm = get_aws_modal(config=botocore_cfg)
+        self.base_llm = get_aws_modal(config=botocore_cfg,prompt_cache_node=self.name)
 
         mcp_config={
                 "context7": {
@@ -1754,6 +1754,7 @@ class ResearchAgent:
         # Bind tools to LLM and create tool node
         self.llm = self.base_llm.bind_tools(self.tools)
         self.tool_node = ToolNode(self.tools)
+        self.tool_selector = ToolSelector(self.name, self.base_llm, self.tools)
 
         # Build the graph using StateGraph
         builder = StateGraph(ChatState)
@@ -1,8 +1,10 @@
-from typing import TypedDict,List,Literal,get_args,NotRequired,Optional
+from typing import TypedDict,List,Literal,get_args,NotRequired,Optional,Annotated
 from enum import Enum
 from langchain_core.messages.base import BaseMessage
+from langchain_core.messages.modifier import RemoveMessage
 from langmem.short_term import RunningSummary
 from langgraph.prebuilt.chat_agent_executor import AgentState
+from langgraph.graph.message import add_messages,REMOVE_ALL_MESSAGES
 
 
 from pydantic import BaseModel, Field
@@ -52,14 +54,20 @@ class CompletedStep:
     instruction: str
     response: BaseMessage
 
+def replace_messages(new_messages: List[BaseMessage]) -> List[BaseMessage]:
+    """Update for the `messages` channel replacing the whole list instead of appending to it"""
+    return [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + list(new_messages)
+
 class ChatState(AgentState):
-    messages: List[BaseMessage]
+    # append/replace-by-id reducer, nodes only return the new messages; use RemoveMessage to remove one message or replace_messages() to replace all
+    messages: Annotated[List[BaseMessage], add_messages]
     original_messages: NotRequired[List[BaseMessage]]
     tool_call_count: int
     thread_id: str 
-    messages_history: List[BaseMessage]
+    transcript_cursor: NotRequired[int] # seq of the last message in the transcript store (UI visible messages_history)
     plan_executed: NotRequired[bool]
     plan: PlanOutputModal
+    active_step: NotRequired[Optional[StepModal]]
 
 
 
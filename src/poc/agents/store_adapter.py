@@ -0,0 +1,176 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any,AsyncIterator,Dict,Iterable,List,Optional,Tuple
+from langgraph.store.base import BaseStore,GetOp,Op,PutOp,Result,SearchOp
+from langgraph.store.redis import AsyncRedisStore
+from redis.asyncio import ConnectionPool,Redis
+from .metrics import metrics
+
+
+class CachedStore(BaseStore):
+    """
+    Adapter in front of the long-term memory store (any BaseStore, e.g. AsyncRedisStore):
+        - batching: the operations submitted concurrently (same event loop tick, or within `batch_window_seconds`)
+          are sent to the store as a single abatch call, so one pipelined round trip instead of one per call
+        - read-through cache: get and search results of the namespaces below `cached_prefixes` are kept in a small
+          LRU (`cache_size` entries, `cache_ttl_seconds`), a put/delete invalidates the key and every search of a
+          prefix containing its namespace
+    The TTL bounds the staleness when another process writes to the same store.
+    """
+
+    def __init__(self, store:BaseStore, cache_size:Optional[int]=None, cache_ttl_seconds:Optional[float]=None, batch_window_seconds:Optional[float]=None, cached_prefixes:Iterable[Tuple[str,...]]=(("long_term_memories",),)):
+        self.store=store
+        self.cache_size=cache_size if cache_size is not None else int(os.environ.get("STORE_CACHE_SIZE","512"))
+        self.cache_ttl_seconds=cache_ttl_seconds if cache_ttl_seconds is not None else float(os.environ.get("STORE_CACHE_TTL_SECONDS","30"))
+        self.batch_window_seconds=batch_window_seconds if batch_window_seconds is not None else float(os.environ.get("STORE_BATCH_WINDOW_SECONDS","0"))
+        self.cached_prefixes=[tuple(prefix) for prefix in cached_prefixes]
+        self.cache:OrderedDict[tuple,Tuple[float,Any]]=OrderedDict()
+        self.generation=0 # bumped by every invalidation, a read started before it is not cached
+        self.pending:List[Tuple[Op,asyncio.Future]]=[]
+        self.flush_task:Optional[asyncio.Task]=None
+
+    # ---------- cache ----------
+
+    def _is_cached_namespace(self, namespace:Tuple[str,...]) -> bool:
+        return bool(self.cache_size) and any(tuple(namespace[:len(prefix)]) == prefix for prefix in self.cached_prefixes)
+
+    def _cache_key(self, op:Op) -> Optional[tuple]:
+        if isinstance(op,GetOp) and self._is_cached_namespace(op.namespace):
+            return ("get",tuple(op.namespace),op.key)
+        if isinstance(op,SearchOp) and self._is_cached_namespace(op.namespace_prefix):
+            return ("search",tuple(op.namespace_prefix),repr(sorted((op.filter or {}).items())),op.limit,op.offset,op.query)
+        return None
+
+    def _cache_get(self, cache_key:tuple) -> Tuple[bool,Any]:
+        entry=self.cache.get(cache_key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.cache[cache_key]
+            metrics.incr("store_cache.misses")
+            return False,None
+        self.cache.move_to_end(cache_key)
+        metrics.incr("store_cache.hits")
+        return True,list(entry[1]) if isinstance(entry[1],list) else entry[1]
+
+    def _cache_set(self, cache_key:tuple, result:Any):
+        self.cache[cache_key]=(time.monotonic()+self.cache_ttl_seconds,result)
+        self.cache.move_to_end(cache_key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def invalidate(self, namespace:Tuple[str,...], key:Optional[str]=None):
+        """Forget the cached reads a write to namespace/key may have changed"""
+        namespace=tuple(namespace)
+        self.generation+=1
+        for cache_key in list(self.cache):
+            if cache_key[0] == "get" and cache_key[1] == namespace and (key is None or cache_key[2] == key):
+                del self.cache[cache_key]
+            elif cache_key[0] == "search" and namespace[:len(cache_key[1])] == cache_key[1]:
+                del self.cache[cache_key]
+
+    # ---------- batching ----------
+
+    async def _flush(self):
+        if self.batch_window_seconds:
+            await asyncio.sleep(self.batch_window_seconds)
+        else:
+            await asyncio.sleep(0)
+        pending,self.pending=self.pending,[]
+        self.flush_task=None
+        if not pending:
+            return
+        metrics.incr("store.batches")
+        metrics.incr("store.batched_ops",len(pending))
+        try:
+            results=await self.store.abatch([op for op,_ in pending])
+        except Exception as e:
+            if len(pending) == 1:
+                if not pending[0][1].done():
+                    pending[0][1].set_exception(e)
+                return
+            # one bad op must not fail the callers it was coalesced with: retry them one by one
+            print(f"Error in batch of {len(pending)} store ops, retrying them individually: {e}")
+            metrics.incr("store.batch_retries")
+            for op,future in pending:
+                try:
+                    result=(await self.store.abatch([op]))[0]
+                except Exception as op_error:
+                    if not future.done():
+                        future.set_exception(op_error)
+                    continue
+                if not future.done():
+                    future.set_result(result)
+            return
+        for (_,future),result in zip(pending,results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _submit(self, ops:List[Op]) -> List[Result]:
+        loop=asyncio.get_running_loop()
+        futures=[]
+        for op in ops:
+            future=loop.create_future()
+            self.pending.append((op,future))
+            futures.append(future)
+        if self.flush_task is None:
+            self.flush_task=asyncio.create_task(self._flush())
+        return list(await asyncio.gather(*futures))
+
+    # ---------- BaseStore ----------
+
+    async def abatch(self, ops:Iterable[Op]) -> List[Result]:
+        ops=list(ops)
+        results:List[Result]=[None]*len(ops)
+        to_store:List[int]=[]
+        for index,op in enumerate(ops):
+            cache_key=self._cache_key(op)
+            if cache_key is not None:
+                hit,result=self._cache_get(cache_key)
+                if hit:
+                    results[index]=result
+                    continue
+            if isinstance(op,PutOp):
+                self.invalidate(op.namespace,op.key)
+            to_store.append(index)
+        if to_store:
+            generation=self.generation
+            store_results=await self._submit([ops[index] for index in to_store])
+            for index,result in zip(to_store,store_results):
+                results[index]=result
+                if isinstance(ops[index],PutOp):
+                    # reads that raced with the write must not cache the old value
+                    self.invalidate(ops[index].namespace,ops[index].key)
+                    continue
+                cache_key=self._cache_key(ops[index])
+                if cache_key is not None and generation == self.generation:
+                    self._cache_set(cache_key,result)
+        return results
+
+    def batch(self, ops:Iterable[Op]) -> List[Result]:
+        ops=list(ops)
+        for op in ops:
+            if isinstance(op,PutOp):
+                self.invalidate(op.namespace,op.key)
+        return self.store.batch(ops)
+
+    def stats(self) -> Dict[str,Any]:
+        return {"cache_entries": len(self.cache), "pending_ops": len(self.pending)}
+
+
+@asynccontextmanager
+async def open_redis_store(redis_url:Optional[str]=None, max_connections:Optional[int]=None, **cache_args) -> AsyncIterator[CachedStore]:
+    """AsyncRedisStore on a bounded connection pool, behind the batching/caching adapter"""
+    redis_url=redis_url or os.environ.get("REDIS_URL","redis://localhost:6379")
+    max_connections=max_connections or int(os.environ.get("REDIS_MAX_CONNECTIONS","20"))
+    pool=ConnectionPool.from_url(redis_url,max_connections=max_connections)
+    client=Redis(connection_pool=pool)
+    try:
+        store=AsyncRedisStore(redis_client=client)
+        await store.setup()
+        yield CachedStore(store,**cache_args)
+    finally:
+        await client.aclose()
+        await pool.disconnect()
@@ -11,6 +11,8 @@ from .utils import mcp_sampling_handler,get_aws_modal,create_handoff_tool
 from fastmcp import Client
 from langchain_mcp_adapters.tools import load_mcp_tools
 from .state import ChatState,SupervisorNode,CodeSnippetsStructure
+from .tool_selection import ToolSelector
+from .metrics import metrics
 import traceback
 from langgraph.prebuilt import InjectedState,InjectedStore, create_react_agent
 from langchain_core.tools import tool, InjectedToolCallId
@@ -25,6 +27,7 @@ from langchain_core.callbacks.manager import adispatch_custom_event
 from langchain_core.tools.base import  BaseTool
 
 code_parser = PydanticOutputParser(pydantic_object=CodeSnippetsStructure)
+code_format_instructions = code_parser.get_format_instructions()
 
 @tool
 def combine_responses() -> str | list[str | dict]:
@@ -51,7 +54,7 @@ def combine_responses() -> str | list[str | dict]:
     - The final code should be executable
       
     Output Schema:
-    {code_parser.get_format_instructions()} 
+    {code_format_instructions} 
 
     """)
 def structured_output_for_code() -> CodeSnippetsStructure:
@@ -79,6 +82,7 @@ class StructuredOutputAgent:
         self.llm = None
         self.tools = None
         self.tool_node = None
+        self.tool_selector:ToolSelector = None
         self.graph = None
         self.name:str=SupervisorNode.STRUCTURED_OUTPUT_AGENT_VAL
         self.descriptions="Responsible for generating structured outputs and also combining the multiple information from different execution steps but it can do only one task for the agent execution means it can call only one tool for the current agent execution, if another tool call also needed then agent should be re-invoked."
@@ -102,7 +106,7 @@ class StructuredOutputAgent:
 
         return Command(
             update={
-                'messages': state["messages"] + [response],
+                'messages': [response],
             },
             goto="route"
         )
@@ -116,7 +120,7 @@ class StructuredOutputAgent:
                 * provide structured output for the code implementations for the plan
                 * if the multiple unidentified code snippet present then try to relate each other before providing the structured output and if any data like file_name,language,framework,descriptions etc then try to identify or guess them
                 * for the descriptions don't create README.md as a part of /file instead provide it as part of structured output which have fields for descriptions
-                * Output Schema(Output response should be STRICTLY needed in the format): {code_parser.get_format_instructions()}
+                * Output Schema(Output response should be STRICTLY needed in the format): {code_format_instructions}
                 """,
                 id=str(uuid.uuid4())
             )
@@ -167,7 +171,7 @@ class StructuredOutputAgent:
 
         return Command(
             update={
-                'messages': state["messages"] + [response],
+                'messages': [response],
             },
             goto="route"
         )
@@ -180,16 +184,16 @@ class StructuredOutputAgent:
             if not hasattr(msg, 'id') or msg.id is None:
                 msg.id = str(uuid.uuid4())
         try:
-            response = await self.llm.ainvoke(chat_messages)
+            llm = await self.tool_selector.abind(state.get("active_step"))
+            with metrics.timer(f"agent.{self.name}.llm_seconds"):
+                response = await llm.ainvoke(chat_messages)
         except Exception as e:
             print(f"Error invoking LLM: {e}\n", chat_messages, traceback.print_exc())
             response = messages.AIMessage(content=f"An error occurred while processing your request. Please try again later. {e}", id=str(uuid.uuid4()))
         
-        updated_messages = chat_messages + [response]
-
         return Command(
             update={
-                'messages': updated_messages,
+                'messages': [response],
             },
             goto="route"
         )
@@ -199,12 +203,9 @@ class StructuredOutputAgent:
         ai_msg: messages.AIMessage = state["messages"][-1]
         result = await self.tool_node.ainvoke(state)
 
-        # Combine all messages for the updated state
-        all_updated_messages = state['messages'] + result['messages']
-        
         return Command(
             update={
-                'messages': all_updated_messages,
+                'messages': result['messages'],
             },
             goto="route"
         )
@@ -238,7 +239,7 @@ class StructuredOutputAgent:
             print("\n------check_plan_executer------\n")
             return Command(
                 update={
-                    'messages':  state['messages'] + [tool_message]
+                    'messages':  [tool_message]
                 },
                 goto=agent_node_name
             )  
@@ -269,7 +270,7 @@ class StructuredOutputAgent:
         
         # Initialize LLMs
         config = Config(read_timeout=3600, connect_timeout=60)
-        self.base_llm = get_aws_modal(config=config,additional_model_request_fields=None, temperature=0)
+        self.base_llm = get_aws_modal(config=config,additional_model_request_fields=None, temperature=0,prompt_cache_node=self.name)
 
         self.tools:List[BaseTool] = []
         self.tools.append(combine_responses) 
@@ -279,6 +280,7 @@ class StructuredOutputAgent:
             tool.name=self.name+"_"+tool.name  
         self.llm = self.base_llm.bind_tools(self.tools)
         self.tool_node = ToolNode(self.tools)
+        self.tool_selector = ToolSelector(self.name, self.base_llm, self.tools)
 
         # Build the graph using StateGraph
         builder = StateGraph(ChatState)
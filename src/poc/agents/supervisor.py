@@ -1,5 +1,6 @@
 import asyncio,json
-from typing import Annotated, NotRequired,Dict,Optional,Any,cast
+from typing import Annotated, NotRequired,Dict,Optional,Any,Tuple,cast
+from collections import OrderedDict
 from langgraph.prebuilt import InjectedState,InjectedStore, create_react_agent
 from typing import TypedDict, Literal,List
 from langchain_ollama import ChatOllama
@@ -31,7 +32,7 @@ import uuid
 from langgraph.checkpoint.base import Checkpoint, BaseCheckpointSaver
 from langchain_core.prompts.chat import ChatPromptTemplate, ChatPromptValue
 from langchain_core.messages.utils import get_buffer_string
-from langgraph.store.base import BaseStore,SearchItem
+from langgraph.store.base import BaseStore,SearchItem,Item
 from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.store.sqlite import AsyncSqliteStore
 from langgraph.store.redis import AsyncRedisStore
@@ -48,7 +49,13 @@ from .coding_agent import CodingAgent
 from .research_agent import ResearchAgent
 from .plan_executer import PlanExecuter
 from langgraph_supervisor.handoff import create_forward_message_tool
-from .state import ChatState,SupervisorNode,PlanOutputModal
+from .state import ChatState,SupervisorNode,PlanOutputModal,replace_messages
+from .transcript_store import TranscriptStore
+from .memory_worker import MemoryExtractionWorker
+from .memory_retention import MemorySweeper
+from .store_adapter import CachedStore,open_redis_store
+from .memory_index import memory_index,embed_memory,aput_memory,merge_memory_values,ACCESS_COUNT_FIELD,LAST_RECALLED_FIELD
+from .metrics import metrics
 from .utils import get_aws_modal,max_tokens,AsyncSqliteSaverWrapper,create_handoff_back_node
 from langgraph_supervisor import create_supervisor
 from langchain_core.language_models import BaseChatModel, LanguageModelLike
@@ -88,19 +95,14 @@ warnings.filterwarnings(
 
 
 
+memory_dedup_threshold = float(os.environ.get("MEMORY_DEDUP_THRESHOLD","0.9"))
+
 memory_tool_names = {'store_messages':"memorizing", 'relevant_memory':"recalling", 'recent_memory':"recalling recent", 'query_memory_id':"querying memory"}
 
 
 
-async def query_memories(
-        query: str, 
-        record_limit: Optional[int] = 10,
-        record_offset: Optional[int] = 0,
-        *,
-        config: RunnableConfig, 
-        store: BaseStore,
-        get_recent: bool
-    ) -> str:
+def memory_namespace(config: RunnableConfig) -> tuple:
+    """Namespace (prefix) searched for the memories of the conversation, according to the context_scope"""
     namespace = (
         "long_term_memories",
         config["configurable"]["user_id"],
@@ -121,12 +123,46 @@ async def query_memories(
             "long_term_memories",
             config["configurable"]["user_id"],
         )
+    return namespace
+
+memory_scope_weights = [float(weight) for weight in os.environ.get("MEMORY_SCOPE_WEIGHTS","1.0,0.9,0.8").split(",")]
+
+def memory_scopes(config: RunnableConfig) -> List[Tuple[tuple,float]]:
+    """
+    Nested namespace prefixes searched together, most specific first, with their weight:
+    conversation (thread + group) ⊂ thread ⊂ user. An explicit context_scope keeps its single namespace.
+    """
+    if config["configurable"].get("context_scope", None) in ("thread","user"):
+        return [(memory_namespace(config),1.0)]
+    user_namespace = ("long_term_memories", config["configurable"]["user_id"])
+    thread_namespace = user_namespace + (config["configurable"]["thread_id"],)
+    prefixes = [thread_namespace, user_namespace]
+    group_id=config["configurable"].get("group_id",None)
+    if group_id:
+        prefixes.insert(0, thread_namespace + (group_id,))
+    return [(prefix, memory_scope_weights[min(index,len(memory_scope_weights)-1)]) for index,prefix in enumerate(prefixes)]
+
+async def query_memories(
+        query: str, 
+        record_limit: Optional[int] = 10,
+        record_offset: Optional[int] = 0,
+        *,
+        config: RunnableConfig, 
+        store: BaseStore,
+        get_recent: bool,
+        since_hours: Optional[float] = None,
+    ) -> str:
+    namespace = memory_namespace(config)
     if get_recent:
-        query+="Today is "+datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
-    #     namespace=namespace+(datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),)
-    # print("\n--------- namespace -------------",namespace)
-    memories = await store.asearch(namespace, query=query, limit=record_limit, offset=record_offset)
-    formatted = "\n".join(f"[{mem.key}]: {mem.value} (similarity: {mem.score})" for mem in memories)
+        # recency index: pure "latest N" read without a query, recency blended with similarity otherwise
+        since=datetime.now(timezone.utc).timestamp()-since_hours*3600 if since_hours else None
+        memories = await memory_index.arecent(store, namespace, query.strip() or None, limit=record_limit, offset=record_offset, since=since)
+    else:
+        # thread, group and user level memories in one search, the more specific scopes weigh more
+        namespace = memory_scopes(config)
+        memories = await memory_index.asearch_scopes(store, namespace, query, limit=record_limit, offset=record_offset)
+    memory_index.record_access(memories)
+    formatted = "\n".join(f"[{mem.key}]: {mem.value}" + (f" (score: {mem.score:.3f})" if mem.score is not None else "") for mem in memories)
     print("\n\n----------memories----------",namespace,formatted,end="\n\n")
     if formatted:
         return f"""
@@ -194,11 +230,35 @@ async def store_messages(
     )
     if group_id:
         namespace=namespace+(group_id,)
-    await store.aput(
-        namespace=namespace,
-        key=key,
-        value={"content": content, "context": context,"user_queries":user_queries,"last_updated":datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")},
-    )
+    now=datetime.now(timezone.utc)
+    value={"content": content, "context": context,"user_queries":user_queries,"last_updated":now.strftime("%Y-%m-%dT%H:%M:%SZ")}
+    record=await asyncio.to_thread(embed_memory,value)
+    merged=False
+    if not memory_id:
+        # write time dedup: a reworded memory already stored is updated instead of adding another one
+        await memory_index.aensure_loaded(store, namespace)
+        duplicate=memory_index.find_duplicate(namespace, record["vector"], memory_dedup_threshold)
+        if duplicate:
+            existing,similarity=duplicate
+            print(f"----- memory merged into {existing.key} (similarity={similarity:.3f})")
+            key=existing.key
+            merged=True
+            metrics.incr("memory.dedup_merges")
+    # the recall statistics flushed by the sweeper are read and written under the same lock
+    async with memory_index.key_lock(namespace,key):
+        if merged:
+            # the stored value carries the recall statistics the index does not keep
+            stored=await store.aget(namespace,key)
+            value=merge_memory_values(value,[stored.value if stored else existing.value])
+        elif memory_id:
+            stored=await store.aget(namespace,key)
+            if stored:
+                value.update({field:stored.value[field] for field in (ACCESS_COUNT_FIELD,LAST_RECALLED_FIELD) if field in stored.value})
+        # the vector goes to the sibling embeddings namespace, the memory value stays plain
+        record=await aput_memory(store,namespace,key,value,record)
+    await memory_index.aupsert(Item(value=value,key=key,namespace=namespace,created_at=now,updated_at=now),record)
+    if merged:
+        return f"Merged into existing memory {key}"
     return f"Summarized with {key}"
 
 
@@ -245,21 +305,23 @@ async def relevant_memory(
         
 @tool
 async def recent_memory(
-    context: str,
+    context: str = "",
     record_limit: Optional[int] =10,
     record_offset: Optional[int] = 0,
+    since_hours: Optional[float] = None,
     *,
     config: RunnableConfig,
     store: Annotated[BaseStore, InjectedStore],
 ) -> str:
-    """Provide recent memories from long term memory.
+    """Provide recent memories from long term memory, newest first.
 
     Args:
-        context: last user query or relevant memory for the current context.
+        context: optional, last user query or relevant memory to rank the recent memories by relevance too. Leave empty for the latest memories only.
         record_limit: Maximum number of records to return. Defaults to 10.
         record_offset: Offset for pagination. Defaults to 0.
+        since_hours: only the memories updated in the last `since_hours` hours.
     """
-    return await query_memories(context,record_limit,record_offset, config=config, store=store, get_recent=True)
+    return await query_memories(context,record_limit,record_offset, config=config, store=store, get_recent=True, since_hours=since_hours)
 
 
 @tool
@@ -286,7 +348,21 @@ class MyAgent:
         self.graph = None
         self.plan_executer:PlanExecuter=None
         self.max_tool_calls = 6
-        self.store:AsyncRedisStore | AsyncSqliteStore| BaseStore = None
+        self.store:CachedStore | AsyncRedisStore | AsyncSqliteStore| BaseStore = None
+        self.checkpointer:AsyncSqliteSaverWrapper = None
+        self.sql_lite_conn:sqlite3.Connection = None
+        self.transcript_store:TranscriptStore = None
+        self.memory_worker:MemoryExtractionWorker = None
+        self.memory_sweeper:MemorySweeper = None
+        self.llm_without_memory_tools = None
+        self.memory_prefetches:Dict[str,asyncio.Task] = {} # thread_id -> prefetch of the memories for the incoming message
+        self.memory_prefetch_enabled = os.environ.get("MEMORY_PREFETCH_ENABLED","true").lower()=="true"
+        self.memory_prefetch_k = int(os.environ.get("MEMORY_PREFETCH_K","5"))
+        self.memory_prefetch_min_score = float(os.environ.get("MEMORY_PREFETCH_MIN_SCORE","0.3"))
+        self.memory_prefetch_tokens = int(os.environ.get("MEMORY_PREFETCH_TOKENS","800"))
+        self.memory_prefetch_timeout = float(os.environ.get("MEMORY_PREFETCH_TIMEOUT","0.3"))
+        self.history_marks:OrderedDict[str,Tuple[int,str]] = OrderedDict() # LRU thread_id -> (count, id of the last message) already added to the transcript
+        self.history_marks_size = int(os.environ.get("HISTORY_CACHE_THREADS","256"))
         self.system_message="""
             - You are an supervisor agent, responsible for overseeing and managing other agents.
             - Decide the required tool call to execute agent at the beginning and don't forget to execute planned agents and may be you can understanding each agent by executing first it with dummy query or any /help command like query and list all the available tool for planning then start real execution with real query may be you can retry the original user query usually it will be first message.
@@ -299,27 +375,68 @@ class MyAgent:
 
     """
 
+    def empty_state(self, config:RunnableConfig) -> ChatState:
+        return {
+            'messages': [],
+            "tool_call_count": 0,
+            "thread_id": config["configurable"]["thread_id"],
+            "transcript_cursor": 0,
+            "plan_executed":False,
+        }
+
     def get_state(self, config:RunnableConfig) -> ChatState:
         """Get the current state of the agent"""
         if not self.graph.get_state(config).values:
-            self.graph.update_state(
-                config, 
-                values={
-                    'messages': [],
-                    "tool_call_count": 0,
-                    "thread_id": config["configurable"]["thread_id"],
-                    "messages_history": [],
-                    "plan_executed":False,
-                },
-                as_node="tools"
-            )
+            self.graph.update_state(config, values=self.empty_state(config), as_node="tools")
         return self.graph.get_state(config).values
     
     def set_state(self, config:RunnableConfig, new_state:ChatState,as_node:str=SupervisorNode.TOOLS_VAL):
         """Set the current state of the agent"""
         self.graph.update_state(config, values=new_state,as_node=as_node)
 
-        
+    async def aget_state(self, config:RunnableConfig) -> ChatState:
+        """Async version of get_state, the checkpoint read doesn't block the event loop"""
+        values=(await self.graph.aget_state(config)).values
+        if not values:
+            await self.graph.aupdate_state(config, values=self.empty_state(config), as_node="tools")
+            values=(await self.graph.aget_state(config)).values
+        return values
+
+    async def aset_state(self, config:RunnableConfig, new_state:ChatState,as_node:str=SupervisorNode.TOOLS_VAL):
+        """Async version of set_state"""
+        await self.graph.aupdate_state(config, values=new_state,as_node=as_node)
+
+    async def aread_state(self, config:RunnableConfig) -> ChatState:
+        """Current state of the agent without any side effect (an empty thread is not initialized)"""
+        values=(await self.graph.aget_state(config)).values
+        return values or self.empty_state(config)
+
+    async def astate_version(self, config:RunnableConfig) -> str:
+        """Cheap version of the thread (latest checkpoint id + transcript cursor), used as ETag of the state"""
+        thread_id=config["configurable"]["thread_id"]
+        checkpoint_id=await asyncio.to_thread(self.checkpointer.latest_checkpoint_id, thread_id)
+        transcript_cursor=await asyncio.to_thread(self.transcript_store.count, thread_id)
+        return f"{checkpoint_id or 'empty'}.{transcript_cursor}"
+
+    async def arepair_missing_ids(self, config:RunnableConfig) -> bool:
+        """Give an id to the messages of older checkpoints (the messages reducer assigns them for new writes), writes only when something was missing"""
+        values=(await self.graph.aget_state(config)).values
+        missing=[msg for msg in values.get("messages",[]) if not msg.id] if values else []
+        if not missing:
+            return False
+        for msg in missing:
+            msg.id = str(uuid.uuid4()) # !!! this is must ag-ui to work, every message must have an id
+        await self.aset_state(config, values)
+        return True
+
+    async def aget_messages_history_page(self, config: RunnableConfig, after:Optional[str]=None, limit:Optional[int]=None) -> List[BaseMessage]:
+        """Page of the transcript after the given message id (from the start when after is None or unknown)"""
+        thread_id=config["configurable"]["thread_id"]
+        after_seq=0
+        if after:
+            after_seq=await asyncio.to_thread(self.transcript_store.seq_of, thread_id, after) or 0
+        return await self.transcript_store.aread(thread_id, after_seq, limit)
+
     def filter_visible_messages(self,messages: List[BaseMessage]) -> List[BaseMessage]:
         """Filter out messages marked as hidden from chat display"""
         visible_messages = []
@@ -368,16 +485,8 @@ class MyAgent:
             processed_messages.append(msg)
         return processed_messages
 
-    def update_messages_history(self, config: RunnableConfig, existing_history: List[BaseMessage], chat_messages: List[BaseMessage]):
-        """
-        Update messages_history with all messages except those marked as hidden_from_chat.
-        This method is thread-safe using synchronous graph state operations.
-        
-        Args:
-            config: The RunnableConfig for the current thread
-            messages: List of messages to potentially add to history
-        """
-
+    def get_visible_messages(self, chat_messages: List[BaseMessage]) -> List[BaseMessage]:
+        """Messages to show in the chat transcript, i.e. all messages except those marked as hidden_from_chat"""
         messages=self.mark_tool_messages_as_hidden(chat_messages)
         
         # Filter messages to exclude those with hidden_from_chat = True
@@ -395,30 +504,64 @@ class MyAgent:
                 print(f"Error processing message: {traceback.format_exc()}",msg)
                 traceback.print_exc()
                 traceback.print_stack()
+        return visible_messages
+
+    def new_history_messages(self, thread_id:str, chat_messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Messages appended since the previous call for the thread (high-water mark), so only the new tail is
+        classified/hidden-filtered instead of the whole conversation on every node call.
+        Falls back to a backward scan for the last seen id when the list was trimmed/replaced.
+        """
+        count,last_id=self.history_marks.get(thread_id,(0,None))
+        start=0
+        if last_id is not None:
+            if 0 < count <= len(chat_messages) and chat_messages[count-1].id == last_id:
+                start=count
+            else:
+                for index in range(len(chat_messages)-1,-1,-1):
+                    if chat_messages[index].id == last_id:
+                        start=index+1
+                        break
+        for msg in chat_messages[start:]:
+            if not hasattr(msg, 'id') or msg.id is None:
+                msg.id = str(uuid.uuid4())
+        if chat_messages:
+            self.history_marks[thread_id]=(len(chat_messages),chat_messages[-1].id)
+            self.history_marks.move_to_end(thread_id)
+            # an evicted thread falls back to the full scan once, the store's id index drops what is already stored
+            while len(self.history_marks) > self.history_marks_size:
+                self.history_marks.popitem(last=False)
+        # the id index of the store drops whatever was already stored (e.g. after a fallback full scan)
+        return [msg for msg in chat_messages[start:] if not self.transcript_store.contains(thread_id,msg.id)]
+
+    def update_messages_history(self, config: RunnableConfig, chat_messages: List[BaseMessage]) -> int:
+        """
+        Append the new visible messages to the transcript store (idempotent by message id).
         
+        Args:
+            config: The RunnableConfig for the current thread
+            chat_messages: List of messages to potentially add to history
 
-        # Only update if there are new visible messages
-        if visible_messages:
-            # Create a set of existing message IDs to avoid duplicates
-            existing_ids = {msg.id for msg in existing_history if hasattr(msg, 'id') and msg.id}
-            
-            # Add only new messages (not already in history)
-            new_messages = [msg for msg in visible_messages if msg.id not in existing_ids]
-            
-            if new_messages:
-                updated_history = existing_history + new_messages
-                
-                # # Update the state synchronously (thread-safe)
-                # self.graph.update_state(
-                #     config, 
-                #     {"messages_history": updated_history},
-                #     as_node="tools"  # Use as_node to control the update origin
-                # )
-                
-                print(f"------ Added {len(new_messages)} new messages to history. Total history: {len(updated_history)} messages")
-                return updated_history
+        Returns:
+            the transcript cursor (seq of the last stored message) to keep in the graph state
+        """
+        thread_id=config["configurable"]["thread_id"]
+        new_messages=self.new_history_messages(thread_id, chat_messages)
+        if not new_messages:
+            return self.transcript_store.count(thread_id)
+        return self.transcript_store.append(thread_id, self.get_visible_messages(new_messages))
 
-        return existing_history
+    async def aupdate_messages_history(self, config: RunnableConfig, chat_messages: List[BaseMessage]) -> int:
+        """Async version of update_messages_history"""
+        thread_id=config["configurable"]["thread_id"]
+        new_messages=self.new_history_messages(thread_id, chat_messages)
+        if not new_messages:
+            return await asyncio.to_thread(self.transcript_store.count, thread_id)
+        return await self.transcript_store.aappend(thread_id, self.get_visible_messages(new_messages))
+
+    def get_messages_history(self, config: RunnableConfig, after_seq:int=0, limit:Optional[int]=None) -> List[BaseMessage]:
+        """UI visible transcript of the thread, read from the transcript store"""
+        return self.transcript_store.read(config["configurable"]["thread_id"], after_seq, limit)
 
 
     def decide_store_messages(self,state:ChatState,config: RunnableConfig, store: BaseStore) -> bool:       
@@ -437,14 +580,29 @@ Then call the store_messages tool with meaningful content and context parameters
         return analysis_prompt
             
 
-    def init_conversation(self, state: ChatState, config: RunnableConfig, *, store: BaseStore): # get_state won't  work properly in initial conv
+    def close_dangling_tool_calls(self, chat_messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        A cancelled run (client disconnect, cancel policy) can stop between the llm and tools nodes and leave tool calls
+        without results, which bedrock rejects on the next turn. Answer them with a cancellation ToolMessage.
+        """
+        answered={msg.tool_call_id for msg in chat_messages if isinstance(msg, messages.ToolMessage)}
+        closed=[]
+        for msg in chat_messages:
+            closed.append(msg)
+            for tool_call in getattr(msg, 'tool_calls', None) or []:
+                if tool_call.get("id") and tool_call["id"] not in answered:
+                    closed.append(messages.ToolMessage(
+                        content="Cancelled, the previous run was stopped before this tool returned.",
+                        tool_call_id=tool_call["id"],
+                        name=tool_call.get("name"),
+                        id=str(uuid.uuid4()),
+                    ))
+        return closed
+
+    async def init_conversation(self, state: ChatState, config: RunnableConfig, *, store: BaseStore): # get_state won't  work properly in initial conv
         """Initialize the conversation state"""
         # Initialize messages if not already set
-        print("\n--state--", state)
-
-        # Initialize messages_history if not already set
-        if not state.get("messages_history"):
-            state["messages_history"] = []
+        print("\n--state-- messages:", len(state.get("messages") or []), "thread_id:", config["configurable"]["thread_id"])
 
         if not state.get("messages"):
             state["messages"] = []
@@ -459,41 +617,107 @@ Then call the store_messages tool with meaningful content and context parameters
 
         llm_studio_fix()
 
-        if len(state["messages_history"])>0:
-            new_messages=[]
-            last_finish=state["messages_history"][-1].id
-            for msg in state["messages"]:
-                if msg.id == last_finish:
-                    last_finish=None
-                if not last_finish:
-                    new_messages.append(msg)
-            if not last_finish:
+        messages_update=[]
+        last_finish=await asyncio.to_thread(self.transcript_store.last_message_id, config["configurable"]["thread_id"])
+        if last_finish:
+            # scan backwards, the cost is the number of messages since the last finish, not the length of the thread
+            finish_index=None
+            for index in range(len(state["messages"])-1,-1,-1):
+                if state["messages"][index].id == last_finish:
+                    finish_index=index
+                    break
+            if finish_index is not None:
+                new_messages=state["messages"][finish_index:]
                 print(f"----- found {len(new_messages)} new messages since last finish")
                 state["messages"] = new_messages
-
-        state["messages_history"]=self.update_messages_history(config, state['messages_history'], [state["messages"][-1]])
+                # drop the previous turns from the channel, keep only the messages since the last finish
+                messages_update=replace_messages(new_messages)
+
+        closed_messages=self.close_dangling_tool_calls(state["messages"])
+        if len(closed_messages) != len(state["messages"]):
+            state["messages"]=closed_messages
+            messages_update=replace_messages(closed_messages)
+
+        last_message=state["messages"][-1] if state["messages"] else None
+        if self.memory_prefetch_enabled and isinstance(last_message,messages.HumanMessage) and isinstance(last_message.content,str) and last_message.content.strip():
+            # runs while the turn is initialized, awaited (with a timeout) by the first llm call
+            previous=self.memory_prefetches.pop(config["configurable"]["thread_id"],None)
+            if previous:
+                previous.cancel()
+            self.memory_prefetches[config["configurable"]["thread_id"]]=asyncio.create_task(self.prefetch_memories(last_message.content,config))
+
+        transcript_cursor=await self.aupdate_messages_history(config, [state["messages"][-1]])
         
         # Return command to route to LLM node
         return Command(
             update={
-                'messages': state["messages"],
+                'messages': messages_update,
                 'tool_call_count': 0,
                 'thread_id': config["configurable"]["thread_id"],
-                "messages_history": state.get("messages_history", []),
+                "transcript_cursor": transcript_cursor,
                 "plan_executed":False,
                 "plan":[]
             },
             goto=SupervisorNode.LLM_VAL
         )
     
+    async def prefetch_memories(self, query: str, config: RunnableConfig) -> Optional[str]:
+        """Compact block of the memories relevant to the user message, within the prefetch token budget (None if nothing relevant)"""
+        memories=await memory_index.asearch_scopes(self.store, memory_scopes(config), query, limit=self.memory_prefetch_k)
+        lines=[]
+        recalled=[]
+        for mem in memories:
+            if mem.score is None or mem.score < self.memory_prefetch_min_score:
+                continue
+            line=f"- [{mem.key}] {mem.value.get('content','')} ({mem.value.get('context','')}, {mem.value.get('last_updated','')})"
+            if count_tokens_approximately(lines+[line]) > self.memory_prefetch_tokens:
+                break
+            lines.append(line)
+            recalled.append(mem)
+        memory_index.record_access(recalled)
+        if not lines:
+            return None
+        return "<memories>\nRelevant long-term memories (already retrieved, no need to call the memory tools for this message):\n"+"\n".join(lines)+"\n</memories>"
+
+    async def take_memory_prefetch(self, config: RunnableConfig) -> Optional[str]:
+        """
+        Result of the prefetch launched by init_conversation (only for the first llm call of the turn). The memories have
+        to be in the request so the prefetch overlaps the turn initialization and checkpointing, the llm call waits at most
+        memory_prefetch_timeout for the rest and goes on without them (a cold index load keeps running in background).
+        """
+        task=self.memory_prefetches.pop(config["configurable"]["thread_id"],None)
+        if task is None:
+            return None
+        try:
+            memory_block=await asyncio.wait_for(task,timeout=self.memory_prefetch_timeout)
+        except asyncio.TimeoutError:
+            metrics.incr("memory_prefetch.timeouts")
+            return None
+        except Exception as e:
+            print(f"Error prefetching memories: {e}")
+            metrics.incr("memory_prefetch.errors")
+            return None
+        metrics.incr("memory_prefetch.hits" if memory_block else "memory_prefetch.empty")
+        return memory_block
+
+    async def extract_memories(self, chat_messages: List[BaseMessage], config: RunnableConfig):
+        """Long-term memory extraction of the (coalesced) turns of a thread, run by the memory worker"""
+        store_recom=self.decide_store_messages(None, config, self.store)
+        msg = await self.base_llm.bind_tools([store_messages]).ainvoke(get_buffer_string(chat_messages+[store_recom]))
+        results=[]
+        for tool_call in msg.tool_calls:
+            results.append(await store_messages.ainvoke({**tool_call["args"], "store": self.store}, config=config))
+        print("\n\n-----memories extracted-------\n",config["configurable"]["thread_id"],json.dumps(results,default=str,indent=2),end="\n\n")
+        return results
+
     async def before_conversation_end(self, state:ChatState,config: RunnableConfig, *, store: BaseStore):
         """Handle any cleanup before conversation ends"""
-        store_recom=self.decide_store_messages(state, config, store)        
-        msg = await self.base_llm.bind_tools([store_messages]).ainvoke(get_buffer_string(state["messages"]+[store_recom]))
-        temp_tool_node = ToolNode([store_messages])
-        tool_res=await temp_tool_node.ainvoke({"messages": state["messages"] + [msg]})
-
-        print("\n\n-----before stop-------\n",type(store),store,json.dumps([msg,tool_res],default=str,indent=2),end="\n\n")
+        # memory extraction is handed to the background worker, the run finishes as soon as the answer is ready
+        memory_config={"configurable":{
+            key:value for key,value in config["configurable"].items()
+            if key in ("user_id","thread_id","group_id","context_scope")
+        }}
+        self.memory_worker.submit(memory_config, list(state["messages"]))
 
 
         # chat_messages =state["messages"]
@@ -514,16 +738,9 @@ Then call the store_messages tool with meaningful content and context parameters
         
         # updated_messages = chat_messages + [response]
 
-        updated_messages=state["messages"]
-
-        for msg in updated_messages:
-            if not hasattr(msg, 'id') or msg.id is None:
-                msg.id = str(uuid.uuid4())
-
+        # messages already carry ids (assigned by the add_messages reducer), nothing to write back
         return Command(
-            update={
-                "messages":updated_messages
-            },
+            update={},
             goto=END
         )
 
@@ -535,23 +752,34 @@ Then call the store_messages tool with meaningful content and context parameters
         for msg in chat_messages:
             if not hasattr(msg, 'id') or msg.id is None:
                 msg.id = str(uuid.uuid4())
+        llm=self.llm
+        request_messages=chat_messages
+        memory_block=await self.take_memory_prefetch(config)
+        if memory_block and chat_messages and isinstance(chat_messages[-1],messages.HumanMessage):
+            # request only (not persisted): memories in front of the user message, memory tools dropped for this call
+            last=chat_messages[-1]
+            request_messages=chat_messages[:-1]+[last.model_copy(update={"content":f"{memory_block}\n\n{last.content}"})]
+            llm=self.llm_without_memory_tools
+            metrics.incr("memory_prefetch.injected_turns")
         try:
-            response = await self.llm.ainvoke([messages.SystemMessage(content=self.system_message,id=str(uuid.uuid4()))]+chat_messages)
+            response = await llm.ainvoke([messages.SystemMessage(content=self.system_message,id=str(uuid.uuid4()))]+request_messages)
         except Exception as e:
             print(f"Error invoking LLM: {e}\n",chat_messages,traceback.print_exc())
             response = messages.AIMessage(content=f"An error occurred while processing your request. Please try again later. {e}",id=str(uuid.uuid4()))
         
         updated_messages = chat_messages + [response]
+        messages_update = [response]
         if token_limit_warning:
             updated_messages = chat_messages[0:1]+list(filter(lambda msg: msg.type not in ["human","ai"],chat_messages[1:])) + [response]
+            messages_update = replace_messages(updated_messages)
 
         # Always go to router after LLM response
         return Command(
             update={
-                'messages': updated_messages,
+                'messages': messages_update,
                 'tool_call_count': state['tool_call_count'],
                 'thread_id': state['thread_id'],
-                'messages_history': self.update_messages_history(config, state['messages_history'], updated_messages),
+                'transcript_cursor': await self.aupdate_messages_history(config, updated_messages),
             },
             goto=SupervisorNode.ROUTE_VAL
         )
@@ -597,14 +825,14 @@ Then call the store_messages tool with meaningful content and context parameters
         # Always go to router after tools execution
         return Command(
             update={
-                'messages': all_updated_messages,
+                'messages': tool_messages,
                 'tool_call_count': state['tool_call_count']+1,
-                'messages_history': self.update_messages_history(config,state["messages_history"], all_updated_messages)
+                'transcript_cursor': await self.aupdate_messages_history(config, all_updated_messages)
             },
             goto=SupervisorNode.ROUTE_VAL
         )
 
-    def route_node(self, state:ChatState,config: RunnableConfig, *, store: BaseStore) -> Command[Literal[SupervisorNode.TOOLS, SupervisorNode.LLM,SupervisorNode.END_CONV,SupervisorNode.PLAN_EXECUTER]]:
+    async def route_node(self, state:ChatState,config: RunnableConfig, *, store: BaseStore) -> Command[Literal[SupervisorNode.TOOLS, SupervisorNode.LLM,SupervisorNode.END_CONV,SupervisorNode.PLAN_EXECUTER]]:
         """Route node - handles all routing logic using Command pattern"""
         # !!! Command pattern allows us to define custom logic and state can be update during routing
 
@@ -632,7 +860,7 @@ Then call the store_messages tool with meaningful content and context parameters
             print("\n------check_plan_executer------\n")
             return Command(
                 update={
-                    'messages':  state['messages'] + [tool_message]
+                    'messages':  [tool_message]
                 },
                 goto=SupervisorNode.PLAN_EXECUTER_VAL
             )  
@@ -668,15 +896,14 @@ Then call the store_messages tool with meaningful content and context parameters
             else:
                 # User provided new input i.e., its neither yes nor no - this becomes a new human message
                 new_human_message = messages.HumanMessage(content=user_answer, id=str(uuid.uuid4()))
-                updated_messages = state['messages'] + [new_human_message]
                 
                 # Update messages_history with the new human message              
                 # Reset tool count and restart LLM processing
                 return Command(
                     update={
-                        'messages': updated_messages, 
+                        'messages': [new_human_message], 
                         'tool_call_count': 0,
-                        'messages_history': self.update_messages_history(config,state['messages_history'], [new_human_message])
+                        'transcript_cursor': await self.aupdate_messages_history(config, [new_human_message])
                     },
                     goto=SupervisorNode.LLM_VAL
                 )
@@ -710,16 +937,20 @@ Then call the store_messages tool with meaningful content and context parameters
             )   
 
     def on_start(self,run:Run, config:RunnableConfig):
-        print("\n\ninitial state:", json.dumps(self.get_state(config),default=str))
-        print("\nconfig:", json.dumps(config,default=str))
-        self.get_state(config)
+        # runs inside the streaming path, keep it cheap: no checkpoint read, no state dump
+        inputs=run.inputs if isinstance(run.inputs,dict) else {}
+        print(
+            "\n\n---- run started: run_id=",run.id,
+            ", thread_id=",config.get("configurable",{}).get("thread_id"),
+            ", input_messages=",len(inputs.get("messages") or []),
+        )
 
 
     async def init(self):
         """Initialize the agent with MCP tools and LLM"""
 
         # Initialize LLMs
-        self.base_llm = get_aws_modal()
+        self.base_llm = get_aws_modal(prompt_cache_node=SupervisorNode.SUPERVISOR_VAL)
         
 
         self.tools = []        
@@ -730,7 +961,8 @@ Then call the store_messages tool with meaningful content and context parameters
         self.tools.append(query_memory_id)
 
 
-        self.llm = self.base_llm.bind_tools(self.tools)            
+        self.llm = self.base_llm.bind_tools(self.tools)
+        self.llm_without_memory_tools = self.base_llm.bind_tools([tool for tool in self.tools if tool.name not in memory_tool_names])            
         self.tool_node = ToolNode(self.tools)
       
 
@@ -760,6 +992,8 @@ Then call the store_messages tool with meaningful content and context parameters
             sql_file= "data/graph_studio_data.sqlite"
 
         self.sql_lite_conn = sqlite3.connect(sql_file,check_same_thread=False)
+        self.transcript_store = TranscriptStore(sql_file.replace(".sqlite","_transcript.sqlite"))
+        self.transcript_store.setup()
         sqlite_saver = SqliteSaver(self.sql_lite_conn)
         self.checkpointer = AsyncSqliteSaverWrapper(sqlite_saver, max_workers=4)
         
@@ -771,10 +1005,14 @@ Then call the store_messages tool with meaningful content and context parameters
 
         # index_config:IndexConfig = IndexConfig(embed=get_aws_embed_model(),dims=1536) # vector search not working
         # self.redis_ctx= AsyncRedisStore.from_conn_string("redis://localhost:6379",index=index_config)
-        self.redis_ctx= AsyncRedisStore.from_conn_string("redis://localhost:6379")
+        # pooled connections, batched round trips and a read-through cache of the memory namespaces
+        self.redis_ctx= open_redis_store("redis://localhost:6379")
         self.store =await self.redis_ctx.__aenter__()
-        await self.store.setup()
         await self.store.aput(("test"),"test_key",{"value": "dummy"})
+        self.memory_worker = MemoryExtractionWorker(self.extract_memories)
+        self.memory_worker.start()
+        self.memory_sweeper = MemorySweeper(self.store)
+        self.memory_sweeper.start()
 
         self._base_graph = builder.compile(checkpointer=self.checkpointer, store=self.store, debug=False, name="fds_agent")
 
@@ -804,6 +1042,14 @@ Then call the store_messages tool with meaningful content and context parameters
         import asyncio
         import warnings
 
+        if self.memory_worker:
+            await self.memory_worker.close()
+            self.memory_worker = None
+
+        if self.memory_sweeper:
+            await self.memory_sweeper.close()
+            self.memory_sweeper = None
+
         if self.plan_executer:
             self.plan_executer.close()
         
@@ -817,6 +1063,8 @@ Then call the store_messages tool with meaningful content and context parameters
                     self.sql_lite_conn.close()
                 except Exception as e:
                     print(f"Error closing SQLite connection: {e}")
+            if self.transcript_store:
+                self.transcript_store.close()
             # if self.redis_ctx:
             #     self.redis_ctx.__aexit__(None, None, None)
 
@@ -0,0 +1,74 @@
+import asyncio,json
+import hashlib
+from typing import Dict,List,Optional
+import numpy as np
+from langchain_core.tools import BaseTool
+from langchain_core.runnables import Runnable
+from langchain_core.language_models import BaseChatModel
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_core.messages.utils import count_tokens_approximately
+from .state import StepModal
+from .utils import local_embed
+from .metrics import metrics
+
+
+class ToolSelector:
+    """
+    Binds only the tools needed for the current plan step instead of every tool of the agent.
+    The tools named in `step.available_tools` are used, otherwise the `top_k` tools most similar
+    (local embeddings) to the step instruction. Bound variants are cached by the hash of the tool set.
+    """
+
+    def __init__(self, agent_name:str, base_llm:BaseChatModel, tools:List[BaseTool], top_k:int=8):
+        self.agent_name=agent_name
+        self.base_llm=base_llm
+        self.tools=tools
+        self.top_k=top_k
+        self.tool_map:Dict[str,BaseTool]={tool.name:tool for tool in tools}
+        self.bound_llms:Dict[str,Runnable]={}
+        self.tool_embeddings:Optional[np.ndarray]=None
+        self.schema_tokens:Dict[str,int]={
+            tool.name:count_tokens_approximately([json.dumps(convert_to_openai_tool(tool),default=str)]) for tool in tools
+        }
+
+    def resolve_names(self, tool_names:List[str]) -> List[BaseTool]:
+        """Match the planned tool names, with or without the agent name prefix"""
+        selected=[]
+        for name in tool_names:
+            tool=self.tool_map.get(name) or self.tool_map.get(self.agent_name+"_"+name)
+            if tool and tool not in selected:
+                selected.append(tool)
+        return selected
+
+    def rank_by_similarity(self, text:str) -> List[BaseTool]:
+        if self.tool_embeddings is None:
+            self.tool_embeddings=local_embed([f"{tool.name}: {tool.description}" for tool in self.tools])
+        scores=self.tool_embeddings@local_embed([text])[0]
+        return [self.tools[i] for i in np.argsort(-scores)[:self.top_k]]
+
+    async def aselect(self, step:Optional[StepModal]) -> List[BaseTool]:
+        """Tools to bind for the step, all the tools when there is no step"""
+        if step is None:
+            return self.tools
+        selected=self.resolve_names(step.available_tools or [])
+        if selected:
+            return selected
+        if len(self.tools) <= self.top_k:
+            return self.tools
+        try:
+            return await asyncio.to_thread(self.rank_by_similarity," ".join([step.instruction]+list(step.sub_steps or [])))
+        except Exception as e:
+            print(f"Error ranking tools for {self.agent_name}, binding all the tools: {e}")
+            return self.tools
+
+    async def abind(self, step:Optional[StepModal]) -> Runnable:
+        """LLM bound to the tool subset of the step, reusing the previous binding for the same tool set"""
+        tools=await self.aselect(step)
+        names=sorted(tool.name for tool in tools)
+        key=hashlib.sha1("\n".join(names).encode("utf-8")).hexdigest()
+        if key not in self.bound_llms:
+            self.bound_llms[key]=self.base_llm.bind_tools(tools)
+        saved_tokens=sum(self.schema_tokens.values())-sum(self.schema_tokens.get(name,0) for name in names)
+        metrics.observe(f"tool_selection.{self.agent_name}.bound_tools",len(names))
+        metrics.incr(f"tool_selection.{self.agent_name}.schema_tokens_saved",saved_tokens)
+        return self.bound_llms[key]
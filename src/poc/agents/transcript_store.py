@@ -0,0 +1,125 @@
+import asyncio,json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict,List,Optional,Set
+from langchain_core.messages.base import BaseMessage
+from langchain_core.messages import messages_to_dict,messages_from_dict
+
+
+class TranscriptStore:
+    """
+    Append-only store of the UI visible transcript (previously `messages_history` in the graph state).
+    Rows are keyed by (thread_id, seq) and inserts are idempotent by message id, so re-appending
+    an already stored message is a no-op. The graph state only keeps the last seq as a cursor.
+    The per thread cursor and id index are kept for the `max_threads` most recently used threads
+    and reloaded from sqlite when an evicted thread is used again.
+    """
+
+    def __init__(self, db_file:str="data/transcript.sqlite", max_threads:Optional[int]=None):
+        self.db_file=db_file
+        self.conn:sqlite3.Connection=None
+        self._lock=threading.Lock()
+        self.max_threads=max_threads or int(os.environ.get("HISTORY_CACHE_THREADS","256"))
+        self.last_seq:OrderedDict[str,int]=OrderedDict()
+        self.ids:OrderedDict[str,Set[str]]=OrderedDict() # LRU per thread index of the stored message ids, loaded from sqlite
+
+    def setup(self):
+        os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+        self.conn=sqlite3.connect(self.db_file,check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcript (
+                thread_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                message_id TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (thread_id, seq),
+                UNIQUE (thread_id, message_id)
+            )
+        """)
+        self.conn.commit()
+
+    def _touch(self, cache:OrderedDict, thread_id:str):
+        cache.move_to_end(thread_id)
+        while len(cache) > self.max_threads:
+            cache.popitem(last=False)
+
+    def _get_last_seq(self, thread_id:str) -> int:
+        if thread_id not in self.last_seq:
+            row=self.conn.execute("SELECT MAX(seq) FROM transcript WHERE thread_id=?",(thread_id,)).fetchone()
+            self.last_seq[thread_id]=row[0] or 0
+        seq=self.last_seq[thread_id]
+        self._touch(self.last_seq,thread_id)
+        return seq
+
+    def _get_ids(self, thread_id:str) -> Set[str]:
+        if thread_id not in self.ids:
+            rows=self.conn.execute("SELECT message_id FROM transcript WHERE thread_id=?",(thread_id,)).fetchall()
+            self.ids[thread_id]={row[0] for row in rows}
+        ids=self.ids[thread_id]
+        self._touch(self.ids,thread_id)
+        return ids
+
+    def contains(self, thread_id:str, message_id:str) -> bool:
+        with self._lock:
+            return message_id in self._get_ids(thread_id)
+
+    def append(self, thread_id:str, chat_messages:List[BaseMessage]) -> int:
+        """Append the messages not stored yet (by id), returns the cursor (last seq) of the thread"""
+        with self._lock:
+            seq=self._get_last_seq(thread_id)
+            ids=self._get_ids(thread_id)
+            chat_messages=[msg for msg in chat_messages if msg.id not in ids]
+            if not chat_messages:
+                return seq
+            now=time.time()
+            for msg in chat_messages:
+                cursor=self.conn.execute(
+                    "INSERT OR IGNORE INTO transcript (thread_id, seq, message_id, message, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (thread_id,seq+1,msg.id,json.dumps(messages_to_dict([msg])[0],default=str),now)
+                )
+                if cursor.rowcount:
+                    seq+=1
+                ids.add(msg.id)
+            self.conn.commit()
+            self.last_seq[thread_id]=seq
+            return seq
+
+    def read(self, thread_id:str, after_seq:int=0, limit:Optional[int]=None) -> List[BaseMessage]:
+        """Messages of the thread with seq > after_seq, in order"""
+        with self._lock:
+            rows=self.conn.execute(
+                "SELECT message FROM transcript WHERE thread_id=? AND seq>? ORDER BY seq LIMIT ?",
+                (thread_id,after_seq,-1 if limit is None else limit)
+            ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def seq_of(self, thread_id:str, message_id:str) -> Optional[int]:
+        """Seq of the message in the thread, None if it is not in the transcript"""
+        with self._lock:
+            row=self.conn.execute("SELECT seq FROM transcript WHERE thread_id=? AND message_id=?",(thread_id,message_id)).fetchone()
+        return row[0] if row else None
+
+    def last_message_id(self, thread_id:str) -> Optional[str]:
+        with self._lock:
+            row=self.conn.execute("SELECT message_id FROM transcript WHERE thread_id=? ORDER BY seq DESC LIMIT 1",(thread_id,)).fetchone()
+        return row[0] if row else None
+
+    def count(self, thread_id:str) -> int:
+        with self._lock:
+            return self._get_last_seq(thread_id)
+
+    async def aappend(self, thread_id:str, chat_messages:List[BaseMessage]) -> int:
+        return await asyncio.to_thread(self.append,thread_id,chat_messages)
+
+    async def aread(self, thread_id:str, after_seq:int=0, limit:Optional[int]=None) -> List[BaseMessage]:
+        return await asyncio.to_thread(self.read,thread_id,after_seq,limit)
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn=None
@@ -42,6 +42,12 @@ from langchain_core.runnables import RunnableConfig
 from uuid import UUID, uuid5
 from langgraph._internal._config import patch_configurable
 from botocore.config import Config
+from langchain_aws.chat_models.bedrock_converse import _messages_to_bedrock,_snake_to_camel_keys
+from pydantic import BaseModel, Field
+import numpy as np
+import os
+from datetime import datetime, timezone
+from .metrics import metrics
 
 
 # claude-sonnet-4 -> supports upto 200k tokens
@@ -61,8 +67,92 @@ thinking_params = {
 
 # set_llm_cache(SQLiteCache(database_path=".langchain.db"))
 
-def get_aws_modal(model_id="us.anthropic.claude-sonnet-4-20250514-v1:0",config:Config=None,model_max_tokens=max_tokens,temperature=0.5,additional_model_request_fields=None,**kwargs):
-    return ChatBedrockConverse(
+class PromptCacheConfig(BaseModel):
+    """Where to place Bedrock prompt cache checkpoints for the requests of a node"""
+    system: bool = Field(False, description="cache point after the (static) system prompt")
+    tools: bool = Field(False, description="cache point after the bound tool definitions")
+    conversation: bool = Field(False, description="cache point after the last message, useful for agent loops resending a growing conversation")
+
+# per node configuration, the static prefixes are the system prompt/plan instructions and the tool schemas
+prompt_cache_configs:Dict[str,PromptCacheConfig]={
+    SupervisorNode.SUPERVISOR_VAL: PromptCacheConfig(system=True,tools=True),
+    SupervisorNode.PLAN_EXECUTER_VAL: PromptCacheConfig(system=True,tools=True),
+    SupervisorNode.CODING_AGENT_VAL: PromptCacheConfig(tools=True,conversation=True),
+    SupervisorNode.RESEARCH_AGENT_VAL: PromptCacheConfig(tools=True,conversation=True),
+    SupervisorNode.STRUCTURED_OUTPUT_AGENT_VAL: PromptCacheConfig(tools=True),
+}
+
+
+class CachedChatBedrockConverse(ChatBedrockConverse):
+    """
+    ChatBedrockConverse which marks Bedrock prompt cache points (`cachePoint` blocks) on the stable prefixes
+    of every request according to `prompt_cache`, and records the cache read/write token usage as metrics.
+    """
+    prompt_cache: Optional[PromptCacheConfig] = None
+    prompt_cache_node: Optional[str] = None
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        if self.prompt_cache and self.prompt_cache.tools and tools:
+            tools=list(tools)+[ChatBedrockConverse.create_cache_point()]
+        return super().bind_tools(tools, tool_choice=tool_choice, **kwargs)
+
+    def add_cache_points(self, chat_messages: List[BaseMessage]) -> List[BaseMessage]:
+        """Copy of the messages with cache points appended to the last system message and/or the last message"""
+        if not self.prompt_cache or not chat_messages:
+            return chat_messages
+
+        def with_cache_point(msg:BaseMessage) -> BaseMessage:
+            content=[{"type":"text","text":msg.content}] if isinstance(msg.content,str) else list(msg.content)
+            return msg.model_copy(update={"content":content+[ChatBedrockConverse.create_cache_point()]})
+
+        chat_messages=list(chat_messages)
+        if self.prompt_cache.system:
+            system_indexes=[i for i,msg in enumerate(chat_messages) if isinstance(msg,messages.SystemMessage)]
+            if system_indexes:
+                chat_messages[system_indexes[-1]]=with_cache_point(chat_messages[system_indexes[-1]])
+        if self.prompt_cache.conversation and not isinstance(chat_messages[-1],messages.SystemMessage):
+            chat_messages[-1]=with_cache_point(chat_messages[-1])
+        return chat_messages
+
+    def record_cache_usage(self, msg:BaseMessage):
+        usage=getattr(msg,"usage_metadata",None)
+        if not usage:
+            return
+        details=usage.get("input_token_details") or {}
+        node=self.prompt_cache_node or "default"
+        metrics.incr(f"prompt_cache.{node}.requests")
+        metrics.incr(f"prompt_cache.{node}.input_tokens",usage.get("input_tokens",0))
+        metrics.incr(f"prompt_cache.{node}.cache_read_tokens",details.get("cache_read",0) or 0)
+        metrics.incr(f"prompt_cache.{node}.cache_write_tokens",details.get("cache_creation",0) or 0)
+
+    def converse_request(self, chat_messages: List[BaseMessage], stop: Optional[List[str]] = None, **kwargs) -> Dict[str,Any]:
+        """The request sent to the Converse API for the messages (without sending it), to inspect the cache points offline"""
+        bedrock_messages, system = _messages_to_bedrock(self.add_cache_points(chat_messages))
+        params = self._converse_params(
+            stop=stop,
+            **_snake_to_camel_keys(kwargs, excluded_keys={"inputSchema", "properties", "thinking"}),
+        )
+        return {"messages": bedrock_messages, "system": system, **params}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        result=super()._generate(self.add_cache_points(messages), stop=stop, run_manager=run_manager, **kwargs)
+        for generation in result.generations:
+            self.record_cache_usage(generation.message)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for chunk in super()._stream(self.add_cache_points(messages), stop=stop, run_manager=run_manager, **kwargs):
+            self.record_cache_usage(chunk.message)
+            yield chunk
+
+
+def get_aws_modal(model_id="us.anthropic.claude-sonnet-4-20250514-v1:0",config:Config=None,model_max_tokens=max_tokens,temperature=0.5,additional_model_request_fields=None,prompt_cache_node:Optional[str]=None,**kwargs):
+    prompt_cache=None
+    if prompt_cache_node and os.environ.get("PROMPT_CACHE_ENABLED", "true").lower() == "true":
+        prompt_cache=prompt_cache_configs.get(prompt_cache_node)
+    return CachedChatBedrockConverse(
+        prompt_cache=prompt_cache,
+        prompt_cache_node=prompt_cache_node,
         config=config,
         model_id=model_id, 
         # model_id="openai.gpt-oss-120b-1:0", 
@@ -79,6 +169,22 @@ def get_aws_modal(model_id="us.anthropic.claude-sonnet-4-20250514-v1:0",config:C
     #     base_url="http://192.168.3.104:11434"
     # )
 
+local_embed_model_name="sentence-transformers/all-MiniLM-L6-v2"
+_local_embed_models:Dict[str,Any]={}
+
+def get_local_embed_model(model_name=local_embed_model_name):
+    """Lazily load (once per process) the sentence-transformers model used for offline embeddings"""
+    if model_name not in _local_embed_models:
+        from sentence_transformers import SentenceTransformer
+        _local_embed_models[model_name]=SentenceTransformer(model_name)
+    return _local_embed_models[model_name]
+
+def local_embed(texts:List[str],model_name=local_embed_model_name) -> np.ndarray:
+    """Embed the texts with the local model, rows are L2 normalized so dot product is the cosine similarity"""
+    if not texts:
+        return np.zeros((0,get_local_embed_model(model_name).get_sentence_embedding_dimension()),dtype=np.float32)
+    return np.asarray(get_local_embed_model(model_name).encode(texts,normalize_embeddings=True,convert_to_numpy=True),dtype=np.float32)
+
 def get_aws_embed_model():
     return BedrockEmbeddings(
         model_id="amazon.titan-embed-text-v2:0",
@@ -189,11 +295,15 @@ def create_handoff_back_node(agent:CompiledStateGraph,full_history:bool=False,re
         output_messages = output["messages"]
         print(f"\n---- process_output sub agent = {agent.name} ---- \n")
         print(f"\n---- {agent.name} ---- \n",output_messages)
+        # messages channel appends, so only hand back the messages produced by the sub agent
         if not full_history:
             if isinstance(output_messages[-1], messages.ToolMessage):
-                output_messages = output_messages[:len(state["messages"])]+output_messages[-2:]
+                output_messages = output_messages[-2:]
             else:
-                output_messages = output_messages[:len(state["messages"])]+output_messages[-1:]
+                output_messages = output_messages[-1:]
+        else:
+            existing_ids = {msg.id for msg in state["messages"]}
+            output_messages = [msg for msg in output_messages if msg.id not in existing_ids]
         
         return {
             **output,
@@ -243,6 +353,16 @@ def create_handoff_back_node(agent:CompiledStateGraph,full_history:bool=False,re
     return RunnableCallable(call_agent, acall_agent)
 
 
+def checkpoint_created_at(checkpoint_id:str) -> Optional[str]:
+    """Creation time of a checkpoint read from its id (uuid6, the timestamp is in the high bits) instead of the checkpoint blob"""
+    try:
+        high=uuid.UUID(checkpoint_id).int >> 64
+    except ValueError:
+        return None
+    timestamp=((high >> 32) << 28) | (((high >> 16) & 0xFFFF) << 12) | (high & 0x0FFF)
+    return datetime.fromtimestamp((timestamp-0x01B21DD213814000)/1e7,timezone.utc).isoformat()
+
+
 class AsyncSqliteSaverWrapper(BaseCheckpointSaver):
     """
     A wrapper around SqliteSaver that provides full async support while maintaining
@@ -292,6 +412,113 @@ class AsyncSqliteSaverWrapper(BaseCheckpointSaver):
     
     def get_next_version(self, current, channel):
         return self.sqlite_saver.get_next_version(current, channel)
+
+    def latest_checkpoint_id(self, thread_id:str, checkpoint_ns:str="") -> Optional[str]:
+        """Id of the latest checkpoint of the thread without loading/deserializing the checkpoint itself"""
+        with self.sqlite_saver.cursor(transaction=False) as cur:
+            cur.execute(
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                (str(thread_id), checkpoint_ns),
+            )
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    def _branch_targets(self, cur, thread_id:str, checkpoint_ns:str, checkpoint_id:Optional[str]) -> List[str]:
+        """Nodes the tasks run from this checkpoint routed to (their `branch:to:<node>` writes)"""
+        if not checkpoint_id:
+            return []
+        cur.execute(
+            "SELECT DISTINCT channel FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND channel LIKE 'branch:to:%'",
+            (str(thread_id), checkpoint_ns, checkpoint_id),
+        )
+        return sorted(channel[len("branch:to:"):] for channel, in cur.fetchall())
+
+    def _transcript_cursor(self, cur, thread_id:str, checkpoint_ns:str, checkpoint_id:str, parent_checkpoint_id:Optional[str], updates:Dict[str,int]) -> int:
+        """
+        transcript_cursor channel of a checkpoint without loading it: the last cursor written by the tasks run from
+        its ancestors (a msgpack int). Only the values set by update_state are not in the writes table, so the
+        newest `update` checkpoint more recent than that write is read instead (rare: thread seeding and repairs).
+        """
+        written_at,cursor=None,0
+        if parent_checkpoint_id:
+            cur.execute(
+                "SELECT checkpoint_id, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id <= ? AND channel = 'transcript_cursor' ORDER BY checkpoint_id DESC, idx DESC LIMIT 1",
+                (str(thread_id), checkpoint_ns, parent_checkpoint_id),
+            )
+            row=cur.fetchone()
+            if row:
+                written_at,cursor=row[0],self.sqlite_saver.serde.loads_typed((row[1], row[2]))
+        cur.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id <= ? AND checkpoint_id > ? AND json_extract(CAST(metadata AS TEXT), '$.source') = 'update' ORDER BY checkpoint_id DESC LIMIT 1",
+            (str(thread_id), checkpoint_ns, checkpoint_id, written_at or ""),
+        )
+        row=cur.fetchone()
+        if row:
+            if row[0] not in updates:
+                cur.execute(
+                    "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (str(thread_id), checkpoint_ns, row[0]),
+                )
+                checkpoint=self.sqlite_saver.serde.loads_typed(cur.fetchone())
+                updates[row[0]]=checkpoint.get("channel_values",{}).get("transcript_cursor") or 0
+            cursor=updates[row[0]]
+        return cursor or 0
+
+    def list_checkpoint_summaries(self, thread_id:str, before:Optional[str]=None, limit:int=20, checkpoint_ns:str="") -> List[Dict[str,Any]]:
+        """
+        Lightweight projection of the thread checkpoints, newest first: ids, step, source, node that produced
+        the checkpoint, next nodes, created_at, transcript cursor, message count and sizes. The checkpoint blobs are
+        not deserialized (except the rare update_state ones, see _transcript_cursor).
+        The tasks run from a checkpoint write to it, so the next nodes of a checkpoint are the branch targets
+        written to its parent and the node that produced it is the next of its parent.
+        message_count is the number of messages of the thread transcript (the UI visible history) at the checkpoint:
+        its seqs start at 1 without gaps, so it equals the transcript cursor.
+        """
+        query="SELECT checkpoint_id, parent_checkpoint_id, LENGTH(checkpoint), metadata FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        params=[str(thread_id), checkpoint_ns]
+        if before:
+            query+=" AND checkpoint_id < ?"
+            params.append(before)
+        query+=" ORDER BY checkpoint_id DESC LIMIT ?"
+        params.append(limit)
+        summaries=[]
+        updates:Dict[str,int]={}
+        with self.sqlite_saver.cursor(transaction=False) as cur:
+            cur.execute(query, params)
+            rows=cur.fetchall()
+            parents={checkpoint_id:parent_checkpoint_id for checkpoint_id,parent_checkpoint_id,_,_ in rows}
+            for checkpoint_id,parent_checkpoint_id,checkpoint_bytes,metadata_blob in rows:
+                if parent_checkpoint_id and parent_checkpoint_id not in parents:
+                    cur.execute(
+                        "SELECT parent_checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                        (str(thread_id), checkpoint_ns, parent_checkpoint_id),
+                    )
+                    row=cur.fetchone()
+                    parents[parent_checkpoint_id]=row[0] if row else None
+                cur.execute(
+                    "SELECT SUM(LENGTH(value)) FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (str(thread_id), checkpoint_ns, checkpoint_id),
+                )
+                writes_bytes=cur.fetchone()[0] or 0
+                metadata=json.loads(metadata_blob) if metadata_blob else {}
+                # the input checkpoint triggers __start__ through its own channel values, not through writes
+                node=["__start__"] if metadata.get("step") == 0 else self._branch_targets(cur, thread_id, checkpoint_ns, parents.get(parent_checkpoint_id))
+                next_nodes=["__start__"] if metadata.get("source") == "input" else self._branch_targets(cur, thread_id, checkpoint_ns, parent_checkpoint_id)
+                transcript_cursor=self._transcript_cursor(cur, thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, updates)
+                summaries.append({
+                    "checkpoint_id": checkpoint_id,
+                    "parent_checkpoint_id": parent_checkpoint_id,
+                    "step": metadata.get("step"),
+                    "source": metadata.get("source"),
+                    "node": node,
+                    "next": next_nodes,
+                    "created_at": checkpoint_created_at(checkpoint_id),
+                    "message_count": transcript_cursor,
+                    "transcript_cursor": transcript_cursor,
+                    "checkpoint_bytes": checkpoint_bytes or 0,
+                    "writes_bytes": writes_bytes,
+                })
+        return summaries
     
     # Async methods - run sync methods in thread pool
     async def aget_tuple(self, config):
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import time
+import uuid
+from langchain_core import messages
+from .agents.supervisor import MyAgent
+from .agents.transcript_store import TranscriptStore
+
+
+class CountingTranscriptStore(TranscriptStore):
+    """Counts the messages checked against the id index, i.e. the messages update_messages_history looked at"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args,**kwargs)
+        self.checked=0
+
+    def contains(self, thread_id:str, message_id:str) -> bool:
+        self.checked+=1
+        return super().contains(thread_id,message_id)
+
+
+def build_history(size:int):
+    history=[]
+    for index in range(size):
+        if index % 2 == 0:
+            history.append(messages.HumanMessage(content=f"question {index}",id=str(uuid.uuid4())))
+        else:
+            history.append(messages.AIMessage(content=f"answer {index}",id=str(uuid.uuid4())))
+    return history
+
+def step_cost(agent:MyAgent, config, history, steps:int=200) -> float:
+    """Average seconds of update_messages_history when one message is appended per node call"""
+    agent.update_messages_history(config, history)
+    start=time.perf_counter()
+    for index in range(steps):
+        history.append(messages.AIMessage(content=f"step {index}",id=str(uuid.uuid4())))
+        checked=agent.transcript_store.checked
+        agent.update_messages_history(config, history)
+        # O(new messages): only the appended message is looked at, whatever the size of the history
+        assert agent.transcript_store.checked-checked == 1, f"{agent.transcript_store.checked-checked} messages checked for 1 new message (history={len(history)})"
+    return (time.perf_counter()-start)/steps
+
+def run():
+    """
+    Microbenchmark of the incremental messages history update: the per step cost
+    should stay flat while the conversation grows from 100 to 10k messages.
+    Fails when a step looks at more than the appended message, or when the per step time at 10k
+    messages is more than BENCH_HISTORY_MAX_RATIO (default 3) times the one at 100 messages.
+    """
+    max_ratio=float(os.environ.get("BENCH_HISTORY_MAX_RATIO","3"))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        agent=MyAgent()
+        agent.transcript_store=CountingTranscriptStore(os.path.join(tmp_dir,"transcript.sqlite"))
+        agent.transcript_store.setup()
+        try:
+            costs=[]
+            for size in [100,1_000,10_000]:
+                config={"configurable":{"thread_id":f"bench_{size}"}}
+                seconds=step_cost(agent,config,build_history(size))
+                costs.append(seconds)
+                print(f"history={size:>6} messages: {seconds*1e6:8.1f} us/step")
+        finally:
+            agent.transcript_store.close()
+    ratio=costs[-1]/costs[0]
+    print(f"per step cost ratio 10k/100: {ratio:.2f} (max {max_ratio})")
+    assert ratio <= max_ratio, f"per step cost grows with the history size (ratio {ratio:.2f} > {max_ratio})"
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,34 @@
+import argparse
+import asyncio
+from langgraph.store.redis import AsyncRedisStore
+from .agents.memory_index import compact_namespace
+
+
+async def compact(threshold:float, dry_run:bool, prefix:tuple, redis_url:str):
+    async with AsyncRedisStore.from_conn_string(redis_url) as store:
+        namespaces=await store.alist_namespaces(prefix=prefix,limit=100_000)
+        total_items,total_merged=0,0
+        for namespace in namespaces:
+            result=await compact_namespace(store,tuple(namespace),threshold,dry_run=dry_run)
+            total_items+=result["items"]
+            total_merged+=result["merged"]
+            if result["merged"]:
+                print(f"{namespace}: {result['merged']} of {result['items']} memories merged")
+        action="would be merged" if dry_run else "merged"
+        print(f"{len(namespaces)} namespaces, {total_items} memories, {total_merged} {action}")
+
+def run():
+    """
+    Offline compaction of the long-term memories: near-duplicates (cosine similarity above the threshold)
+    of the same namespace are merged into the newest one, the others are deleted.
+    """
+    parser=argparse.ArgumentParser(description="Merge near-duplicate long-term memories")
+    parser.add_argument("--threshold",type=float,default=0.9)
+    parser.add_argument("--dry-run",action="store_true",help="only report what would be merged")
+    parser.add_argument("--prefix",default="long_term_memories",help="namespace prefix, '/' separated (e.g. long_term_memories/user_1)")
+    parser.add_argument("--redis-url",default="redis://localhost:6379")
+    args=parser.parse_args()
+    asyncio.run(compact(args.threshold,args.dry_run,tuple(args.prefix.split("/")),args.redis_url))
+
+if __name__ == "__main__":
+    run()
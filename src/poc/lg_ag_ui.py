@@ -194,21 +194,24 @@ class LangGraphToAgUi:
                         name=_type,
                         value= {"text":reasoning_text,"type":EventType.THINKING_TEXT_MESSAGE_CONTENT,"message_id":"reasoning_content_"+event["run_id"]}
                     ))   
-            elif _type=="code" or _type=="plan":
+            elif _type=="code" or _type=="plan" or _type=="plan_step" or _type=="plan_step_response":
+                message_id=_type+"_"+event["run_id"]
+                if _content.get("step_uid"): # plan steps are streamed one by one within the same run
+                    message_id+="_"+_content["step_uid"]
                 ac_events.append(CustomEvent(
                     type=EventType.CUSTOM,
                     name=_type,
-                    value= {"type":_type+"_start","message_id":_type+"_"+event["run_id"]}
+                    value= {"type":_type+"_start","message_id":message_id}
                 ))   
                 ac_events.append(CustomEvent(
                     type=EventType.CUSTOM,
                     name=_type,
-                    value= {"text":_content.get("text",{}),"type":_type,"message_id":_type+"_"+event["run_id"]}
+                    value= {"text":_content.get("text",{}),"type":_type,"message_id":message_id}
                 ))   
                 ac_events.append(CustomEvent(
                     type=EventType.CUSTOM,
                     name=_type,
-                    value= {"type":_type+"_end","message_id":_type+"_"+event["run_id"]}
+                    value= {"type":_type+"_end","message_id":message_id}
                 ))
             else:
                 print("Unhandled chunk type:", _type, _content)
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict,Optional,Tuple
+from .agents.metrics import metrics
+
+
+RUN_POLICIES=("queue","reject","cancel")
+
+class ThreadBusyError(Exception):
+    """Raised with the `reject` policy when the thread already has an active run"""
+
+    def __init__(self, thread_id:str, active_run_id:Optional[str]=None):
+        super().__init__(f"thread {thread_id} already has an active run {active_run_id or ''}".strip())
+        self.thread_id=thread_id
+        self.active_run_id=active_run_id
+
+
+class RunCoordinator:
+    """
+    Serializes the runs of a thread (one checkpoint lineage = one writer) while runs of different
+    threads keep executing in parallel. The policy decides what happens to a run submitted while
+    the thread is busy:
+        - queue: wait for the previous runs (FIFO)
+        - reject: raise ThreadBusyError (409 for the API)
+        - cancel: cancel the active run, then start once it has released the thread
+    """
+
+    def __init__(self, policy:Optional[str]=None):
+        self.policy=(policy or os.environ.get("RUN_POLICY","queue")).lower()
+        if self.policy not in RUN_POLICIES:
+            raise ValueError(f"unknown run policy {self.policy}, expected one of {RUN_POLICIES}")
+        self.locks:Dict[str,asyncio.Lock]={}
+        self.waiters:Dict[str,int]={}
+        self.active:Dict[str,Tuple[str,asyncio.Task]]={} # thread_id -> (run_id, task)
+
+    def is_busy(self, thread_id:str) -> bool:
+        lock=self.locks.get(thread_id)
+        return thread_id in self.active or bool(lock and lock.locked())
+
+    def active_run_id(self, thread_id:str) -> Optional[str]:
+        active=self.active.get(thread_id)
+        return active[0] if active else None
+
+    def cancel(self, thread_id:str) -> bool:
+        """Cancel the active run of the thread, if any"""
+        active=self.active.get(thread_id)
+        if not active or active[1].done():
+            return False
+        active[1].cancel()
+        return True
+
+    @asynccontextmanager
+    async def run(self, thread_id:str, run_id:str, policy:Optional[str]=None):
+        """Hold the thread for the duration of the block, according to the policy"""
+        policy=(policy or self.policy).lower()
+        if policy not in RUN_POLICIES:
+            policy=self.policy
+        if policy == "reject" and self.is_busy(thread_id):
+            metrics.incr("run_coordinator.rejected")
+            raise ThreadBusyError(thread_id,self.active_run_id(thread_id))
+        if policy == "cancel" and self.cancel(thread_id):
+            print(f"----- cancelling run {self.active_run_id(thread_id)} of thread {thread_id}, superseded by {run_id}")
+            metrics.incr("run_coordinator.cancelled_previous")
+
+        lock=self.locks.setdefault(thread_id,asyncio.Lock())
+        self.waiters[thread_id]=self.waiters.get(thread_id,0)+1
+        start=time.perf_counter()
+        try:
+            await lock.acquire()
+        finally:
+            self.waiters[thread_id]-=1
+        wait_seconds=time.perf_counter()-start
+        metrics.observe("run_coordinator.wait_seconds",wait_seconds)
+        if wait_seconds > 0.01:
+            print(f"----- run {run_id} waited {wait_seconds:.2f}s for thread {thread_id}")
+
+        self.active[thread_id]=(run_id,asyncio.current_task())
+        metrics.set_gauge("run_coordinator.active_runs",len(self.active))
+        try:
+            yield
+        finally:
+            if self.active.get(thread_id,(None,None))[0] == run_id:
+                del self.active[thread_id]
+            lock.release()
+            if not self.waiters.get(thread_id) and not lock.locked():
+                self.locks.pop(thread_id,None)
+                self.waiters.pop(thread_id,None)
+            metrics.set_gauge("run_coordinator.active_runs",len(self.active))
@@ -0,0 +1,279 @@
+import asyncio,json
+import hashlib
+import os
+import time
+from collections import deque
+from typing import Any,AsyncIterator,Callable,Deque,Dict,List,Optional,Tuple
+from .agents.metrics import metrics
+
+
+RUN_EVENTS_DIR=os.path.abspath(os.environ.get("RUN_EVENTS_DIR",os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","..","data","run_events")))
+
+class RunEventLog:
+    """
+    Ordered log of the encoded events of one run. The last `max_memory_events` are kept in memory,
+    older ones are spilled to a jsonl file so a late subscriber can still replay the whole run.
+    Sequence numbers start at 1 and are used as SSE event ids (Last-Event-ID).
+    Events always live in one of three contiguous tiers: disk (1..written), write buffer (spilled by the
+    event loop, written to disk by a background thread) and memory (the most recent ones).
+    """
+
+    def __init__(self, run_id:str, max_memory_events:int=500, spill_dir:Optional[str]=None):
+        self.run_id=run_id
+        self.max_memory_events=max_memory_events
+        self.spill_file=os.path.join(spill_dir or RUN_EVENTS_DIR,f"{run_id}.jsonl")
+        self.memory:Deque[Tuple[int,str]]=deque()
+        self.write_buffer:Deque[Tuple[int,str]]=deque()
+        self.offsets:List[int]=[] # byte offset of each event written to disk, offsets[seq-1]
+        self.file_size=0
+        self.spilled=0
+        self.written=0
+        self.last_seq=0
+        self.closed=False
+        self.deleted=False
+        self._file=None
+        self._writer:Optional[asyncio.Task]=None
+        self._changed=asyncio.Condition()
+
+    async def append(self, data:str) -> int:
+        async with self._changed:
+            self.last_seq+=1
+            self.memory.append((self.last_seq,data))
+            if len(self.memory) > self.max_memory_events:
+                self._spill(self.memory.popleft())
+            self._changed.notify_all()
+            return self.last_seq
+
+    async def close(self):
+        async with self._changed:
+            self.closed=True
+            self._changed.notify_all()
+
+    def _spill(self, event:Tuple[int,str]):
+        """Move the event to the write buffer, the file is written off the event loop"""
+        self.write_buffer.append(event)
+        self.spilled+=1
+        metrics.incr("runs.events_spilled")
+        if self._writer is None:
+            self._writer=asyncio.create_task(self._write_spilled())
+
+    def _write_lines(self, lines:List[bytes]):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.spill_file), exist_ok=True)
+            self._file=open(self.spill_file,"ab")
+        self._file.write(b"".join(lines))
+        self._file.flush()
+
+    async def _write_spilled(self):
+        try:
+            while self.write_buffer and not self.deleted:
+                batch=list(self.write_buffer)
+                lines=[(json.dumps(event)+"\n").encode("utf-8") for event in batch]
+                await asyncio.to_thread(self._write_lines,lines)
+                # the events leave the buffer only once readable from disk
+                for line in lines:
+                    self.offsets.append(self.file_size)
+                    self.file_size+=len(line)
+                    self.write_buffer.popleft()
+                self.written+=len(batch)
+        finally:
+            self._writer=None
+            if self.deleted:
+                self._remove_file()
+
+    def _read_spilled(self, after_seq:int, until_seq:int) -> List[Tuple[int,str]]:
+        """Events after_seq+1..until_seq from disk, seeking to the offset of the first one"""
+        with open(self.spill_file,"rb") as file:
+            file.seek(self.offsets[after_seq])
+            return [tuple(json.loads(file.readline())) for _ in range(until_seq-after_seq)]
+
+    async def subscribe(self, after_seq:int=0) -> AsyncIterator[Tuple[int,str]]:
+        """Replay the events after `after_seq` (disk, then buffer and memory) and follow the live ones until the run ends"""
+        seq=after_seq
+        while True:
+            if seq < self.written:
+                for event in await asyncio.to_thread(self._read_spilled,seq,self.written):
+                    seq=event[0]
+                    yield event
+                # more events may have been spilled meanwhile, check the disk again
+                continue
+            events=[event for event in list(self.write_buffer)+list(self.memory) if event[0] > seq]
+            if events:
+                if events[0][0] != seq+1:
+                    # the events in between were written to disk while this subscriber was suspended
+                    continue
+                for event in events:
+                    seq=event[0]
+                    yield event
+                continue
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.closed or self.last_seq > seq)
+                if self.closed and self.last_seq <= seq:
+                    return
+
+    def _remove_file(self):
+        if self._file:
+            self._file.close()
+            self._file=None
+        if os.path.exists(self.spill_file):
+            os.remove(self.spill_file)
+
+    def delete(self):
+        """Drop the spill file (the writer removes it when it finishes if a write is in progress)"""
+        self.deleted=True
+        if self._writer is None:
+            self._remove_file()
+
+
+class BackgroundRun:
+    """A run executing independently of the HTTP connection(s) streaming it"""
+
+    def __init__(self, run_id:str, thread_id:str, log:RunEventLog):
+        self.run_id=run_id
+        self.thread_id=thread_id
+        self.log=log
+        self.task:Optional[asyncio.Task]=None
+        self.subscribers=0
+        self.started_at=time.time()
+        self.finished_at:Optional[float]=None
+        self.status="reserved" # reserved | running | finished | cancelled | failed
+        self._orphan_timer:Optional[asyncio.Task]=None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+
+class RunManager:
+    """
+    Executes agent runs as background tasks writing their encoded events into a RunEventLog.
+    Any number of clients can subscribe (and re-subscribe with Last-Event-ID) to a run without starting
+    a second execution. A run left without subscribers for `orphan_grace_seconds` is cancelled, finished
+    runs are kept `retention_seconds` for late reconnects.
+    """
+
+    def __init__(self, max_memory_events:Optional[int]=None, orphan_grace_seconds:Optional[float]=None, retention_seconds:Optional[float]=None):
+        self.max_memory_events=max_memory_events or int(os.environ.get("RUN_EVENT_LOG_MEMORY","500"))
+        self.orphan_grace_seconds=orphan_grace_seconds if orphan_grace_seconds is not None else float(os.environ.get("RUN_ORPHAN_GRACE_SECONDS","30"))
+        self.retention_seconds=retention_seconds if retention_seconds is not None else float(os.environ.get("RUN_RETENTION_SECONDS","600"))
+        self.runs:Dict[str,BackgroundRun]={}
+
+    def get(self, run_id:str) -> Optional[BackgroundRun]:
+        return self.runs.get(run_id)
+
+    def get_replayable(self, run_id:str) -> Optional[BackgroundRun]:
+        """
+        The run to attach a duplicate submission of `run_id` to: an active run, or a run that completed within
+        the retention window (its recorded events are the outcome). A cancelled run has no outcome and can be submitted again.
+        """
+        self.sweep()
+        run=self.runs.get(run_id)
+        if run is None or run.status == "cancelled":
+            return None
+        return run
+
+    def reserve(self, run_id:str, thread_id:str) -> Tuple[BackgroundRun,bool]:
+        """
+        (run, created): claim the run_id before any await of the request handling, so a concurrent duplicate
+        submission attaches to this run instead of starting a second one. created is False for an existing run.
+        """
+        run=self.get_replayable(run_id)
+        if run is not None:
+            return run,False
+        run=BackgroundRun(run_id,thread_id,RunEventLog(run_id,self.max_memory_events))
+        self.runs[run_id]=run
+        return run,True
+
+    def reserve_submission(self, run_id:str, thread_id:str, command:Optional[Dict[str,Any]]=None) -> Tuple[BackgroundRun,bool]:
+        """
+        reserve() for a POST of the API. The UI resumes an interrupt by posting again with the same run_id and
+        `command.resume`, so a resume is its own run keyed by (run_id, resume payload): a duplicate of the
+        resume attaches to it while it runs, but once it is done the same answer to the next interrupt starts a new run.
+        """
+        if not command:
+            return self.reserve(run_id,thread_id)
+        resume=json.dumps(command.get("resume",""),sort_keys=True,default=str)
+        key=f"{run_id}.resume-{hashlib.sha1(resume.encode('utf-8')).hexdigest()[:12]}"
+        run=self.get_replayable(key)
+        if run is not None and run.done:
+            # kept under a unique key until the retention sweep, for the reconnects of its own stream
+            self.runs[f"{key}.{run.finished_at}"]=self.runs.pop(key)
+        return self.reserve(key,thread_id)
+
+    async def release(self, run:BackgroundRun):
+        """Give up a reservation that was never started (request rejected), its run_id can be submitted again"""
+        if run.task is None and not run.done:
+            run.status="cancelled"
+            run.finished_at=time.time()
+            await run.log.close()
+
+    def start(self, run_id:str, thread_id:str, events:Callable[[],AsyncIterator[str]]) -> BackgroundRun:
+        """Start consuming the encoded events of the run in a background task (an already started run is returned as is)"""
+        run,_=self.reserve(run_id,thread_id)
+        if run.task is not None or run.done:
+            metrics.incr("runs.duplicate_start")
+            return run
+        run.status="running"
+
+        async def execute():
+            try:
+                async for data in events():
+                    await run.log.append(data)
+                run.status="finished"
+            except asyncio.CancelledError:
+                run.status="cancelled"
+                raise
+            except Exception:
+                run.status="failed"
+                raise
+            finally:
+                run.finished_at=time.time()
+                await run.log.close()
+                metrics.set_gauge("runs.active",len([r for r in self.runs.values() if not r.done]))
+
+        run.task=asyncio.create_task(execute())
+        metrics.incr("runs.started")
+        metrics.set_gauge("runs.active",len([r for r in self.runs.values() if not r.done]))
+        return run
+
+    async def stream(self, run:BackgroundRun, after_seq:int=0) -> AsyncIterator[str]:
+        """SSE stream of the run for one subscriber, events carry their seq as id"""
+        run.subscribers+=1
+        if run._orphan_timer:
+            run._orphan_timer.cancel()
+            run._orphan_timer=None
+        if after_seq:
+            metrics.incr("runs.resumed_subscriptions")
+        try:
+            async for seq,data in run.log.subscribe(after_seq):
+                yield f"id: {seq}\n{data}"
+        finally:
+            run.subscribers-=1
+            if run.subscribers == 0 and not run.done:
+                run._orphan_timer=asyncio.create_task(self._cancel_orphan(run))
+
+    async def _cancel_orphan(self, run:BackgroundRun):
+        await asyncio.sleep(self.orphan_grace_seconds)
+        if run.subscribers == 0 and not run.done and run.task:
+            print(f"----- run {run.run_id} has no subscriber for {self.orphan_grace_seconds}s, cancelling")
+            run.task.cancel()
+
+    def sweep(self):
+        """Forget the finished runs older than the retention window"""
+        now=time.time()
+        for run_id,run in list(self.runs.items()):
+            if run.done and now-run.finished_at > self.retention_seconds:
+                run.log.delete()
+                del self.runs[run_id]
+
+    async def close(self):
+        for run in self.runs.values():
+            if run.task and not run.task.done():
+                run.task.cancel()
+        for run in self.runs.values():
+            if run.task:
+                try:
+                    await run.task
+                except BaseException:
+                    pass
+            run.log.delete()
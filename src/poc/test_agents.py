@@ -30,7 +30,7 @@ async def run_test_tool_calls(my_agent:MyAgent):
                 # Resume with Command pattern
                 output=await my_agent.graph.ainvoke(Command(resume=user_message), config=config)
             else:
-                state=my_agent.get_state(config)
+                state=await my_agent.aget_state(config)
                 state['messages']=[messages.HumanMessage(content=user_message)]
                 output=await my_agent.graph.ainvoke(state, config=config)
 
@@ -43,7 +43,7 @@ async def run_test_tool_calls(my_agent:MyAgent):
                 continue
 
             # print(json.dumps(output, indent=2,default=str), '\n')
-            print(output['messages_history'][-1].content, '\n')
+            print(my_agent.get_messages_history(config, after_seq=output['transcript_cursor']-1)[-1].content, '\n')
             await asyncio.sleep(2)
             # print(json.dumps(my_agent.state, indent=2,default=str), '\n')
         except KeyboardInterrupt:
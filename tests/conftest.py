@@ -0,0 +1,18 @@
+import hashlib
+import numpy as np
+import pytest
+
+
+def hashing_embed(texts):
+    """Deterministic bag of words embedding, stands in for the local sentence-transformers model"""
+    vectors=np.zeros((len(texts),256),dtype=np.float32)
+    for row,text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[row,int(hashlib.md5(word.encode("utf-8")).hexdigest(),16)%256]+=1.0
+    norms=np.linalg.norm(vectors,axis=1,keepdims=True)
+    return vectors/np.where(norms == 0,1.0,norms)
+
+
+@pytest.fixture
+def embed():
+    return hashing_embed
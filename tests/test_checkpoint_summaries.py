@@ -0,0 +1,45 @@
+import sqlite3
+from typing import TypedDict
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import END,START,StateGraph
+from poc.agents.utils import AsyncSqliteSaverWrapper
+
+
+class CounterState(TypedDict):
+    steps:int
+    transcript_cursor:int
+
+
+def make_graph(saver:SqliteSaver):
+    graph=StateGraph(CounterState)
+    graph.add_node("chat",lambda state: {"steps":state["steps"]+1,"transcript_cursor":state["transcript_cursor"]+2})
+    graph.add_node("tools",lambda state: {"steps":state["steps"]+1})
+    graph.add_edge(START,"chat")
+    graph.add_edge("chat","tools")
+    graph.add_edge("tools",END)
+    return graph.compile(checkpointer=saver)
+
+
+def test_summaries_match_the_checkpoint_values():
+    saver=SqliteSaver(sqlite3.connect(":memory:",check_same_thread=False))
+    saver.setup()
+    checkpointer=AsyncSqliteSaverWrapper(saver,max_workers=1)
+    graph=make_graph(saver)
+    config={"configurable":{"thread_id":"t1"}}
+    graph.update_state(config,{"steps":0,"transcript_cursor":0},as_node="tools")
+    graph.invoke({"steps":0},config)
+    # a repair through update_state is not recorded in the writes table
+    graph.update_state(config,{"transcript_cursor":7},as_node="tools")
+    graph.invoke({"steps":0},config)
+    snapshots={snapshot.config["configurable"]["checkpoint_id"]:snapshot for snapshot in graph.get_state_history(config)}
+    summaries=checkpointer.list_checkpoint_summaries("t1",limit=50)
+    assert [summary["checkpoint_id"] for summary in summaries] == list(snapshots)
+    for summary in summaries:
+        snapshot=snapshots[summary["checkpoint_id"]]
+        assert summary["transcript_cursor"] == snapshot.values["transcript_cursor"]
+        assert summary["message_count"] == summary["transcript_cursor"]
+        assert summary["next"] == list(snapshot.next)
+    assert summaries[0]["transcript_cursor"] == 9
+    # pagination: the older page resolves the cursor the same way
+    older=checkpointer.list_checkpoint_summaries("t1",before=summaries[3]["checkpoint_id"],limit=2)
+    assert older == summaries[4:6]
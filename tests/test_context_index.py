@@ -0,0 +1,47 @@
+import pytest
+from poc.agents import context_index as context_index_module
+from poc.agents.context_index import ContextIndex
+from poc.agents.metrics import metrics
+
+QUERY="pump pressure in the north plant"
+CHUNKS=[
+    "The north plant pump pressure dropped below the alarm limit twice last week.",
+    "The north plant pump pressure dropped below the alarm limit twice last week.",
+    "Cafeteria menu for the quarter with vegetarian options and opening hours.",
+    "North plant pump maintenance is scheduled after the pressure alarm review.",
+]
+
+
+@pytest.fixture(autouse=True)
+def fake_embed(monkeypatch,embed):
+    monkeypatch.setattr(context_index_module,"local_embed",embed)
+
+
+def test_most_relevant_chunk_comes_first_and_duplicates_are_skipped():
+    index=ContextIndex()
+    selected=index.select(QUERY,CHUNKS,token_limit=10_000,lambda_mult=0.5)
+    assert selected[0] == CHUNKS[0]
+    # the copy of the first chunk is fully redundant: MMR picks the other pump chunk before it
+    assert selected[1] == CHUNKS[3]
+    assert len(selected) == len(CHUNKS)
+
+
+def test_selection_stops_at_the_token_budget():
+    index=ContextIndex()
+    budget=index.tokens(CHUNKS[0])+index.tokens(CHUNKS[3])
+    selected=index.select(QUERY,CHUNKS,token_limit=budget)
+    assert selected == [CHUNKS[0],CHUNKS[3]]
+    assert index.select(QUERY,CHUNKS,token_limit=index.tokens(CHUNKS[0])-1) == []
+    assert index.select(QUERY,[],token_limit=budget) == []
+
+
+def test_embeddings_are_cached_across_calls():
+    index=ContextIndex(cache_size=3)
+    hits=metrics.snapshot()["counters"].get("context_index.embed_cache_hits",0)
+    index.embed(CHUNKS[:2])
+    # identical texts share one entry: the model sees it once, then the second call is all hits
+    assert metrics.snapshot()["counters"]["context_index.embed_cache_hits"]-hits == 1
+    index.embed(CHUNKS[:2])
+    assert metrics.snapshot()["counters"]["context_index.embed_cache_hits"]-hits == 3
+    index.embed(CHUNKS[2:]+[QUERY])
+    assert len(index.embeddings) == 3
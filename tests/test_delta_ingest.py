@@ -0,0 +1,60 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+from langchain_core import messages
+from poc.ag_ui_server import RunAgentInputExtended,check_delta_base,delta_messages
+from poc.agents.transcript_store import TranscriptStore
+
+
+def make_agent(tmp_path):
+    store=TranscriptStore(os.path.join(tmp_path,"transcript.sqlite"))
+    store.setup()
+    store.append("t1",[messages.HumanMessage(content="hi",id="m1"),messages.AIMessage(content="hello",id="m2")])
+    return SimpleNamespace(transcript_store=store)
+
+
+def check(agent, last_known_message_id):
+    return asyncio.run(check_delta_base(agent,"t1",last_known_message_id))
+
+
+def test_delta_on_top_of_the_last_message_is_accepted(tmp_path):
+    agent=make_agent(tmp_path)
+    assert check(agent,"m2") is None
+
+
+def test_stale_client_is_told_where_to_resync(tmp_path):
+    agent=make_agent(tmp_path)
+    response=check(agent,"m1")
+    assert response.status_code == 409
+    body=json.loads(response.body)
+    assert body["error"] == "stale_client"
+    assert body["last_message_id"] == "m2"
+    assert body["resync_after"] == "m1"
+
+
+def test_unknown_message_id_asks_for_a_full_resync(tmp_path):
+    agent=make_agent(tmp_path)
+    for last_known_message_id in ("not_in_thread",None):
+        response=check(agent,last_known_message_id)
+        assert response.status_code == 409
+        body=json.loads(response.body)
+        assert body["error"] == "unknown_message_id"
+        assert body["resync_after"] is None
+
+
+def test_delta_messages_keep_the_client_ids_of_the_user_messages():
+    input_data=RunAgentInputExtended(
+        thread_id="t1",
+        run_id="r1",
+        state={},
+        messages=[
+            {"id":"m3","role":"user","content":"next question"},
+            {"id":"m4","role":"assistant","content":"server authored"},
+        ],
+        tools=[],
+        context=[],
+        forwarded_props={"user_id":"u1","last_known_message_id":"m2"},
+    )
+    human_msgs=delta_messages(input_data)
+    assert [(msg.id,msg.content) for msg in human_msgs] == [("m3","next question")]
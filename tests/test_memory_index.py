@@ -0,0 +1,156 @@
+import asyncio
+from datetime import datetime,timezone
+import pytest
+from langgraph.store.memory import InMemoryStore
+from poc.agents import memory_index as memory_index_module
+from poc.agents.memory_index import MemoryIndex,NamespaceIndex,aput_memory,compact_namespace,embed_memory,embedding_namespace,merge_memory_values,ACCESS_COUNT_FIELD,EMBEDDING_FIELD
+
+USER=("long_term_memories","user")
+THREAD=USER+("thread",)
+OTHER_THREAD=USER+("other_thread",)
+
+
+@pytest.fixture(autouse=True)
+def fake_embed(monkeypatch,embed):
+    monkeypatch.setattr(memory_index_module,"local_embed",embed)
+
+
+def memory(content:str, last_updated:str="2026-10-01T00:00:00Z"):
+    return {"content":content,"context":"","user_queries":[],"last_updated":last_updated}
+
+
+async def put(store, namespace, key, value):
+    await aput_memory(store,namespace,key,value)
+
+
+def test_scoped_search_weights_the_most_specific_scope():
+    async def main():
+        store=InMemoryStore()
+        await put(store,THREAD,"in_thread",memory("pump maintenance schedule"))
+        await put(store,OTHER_THREAD,"in_user",memory("pump maintenance schedule"))
+        index=MemoryIndex()
+        results=await index.asearch_scopes(store,[(USER,0.5),(THREAD,1.0)],"pump maintenance schedule",limit=5)
+        assert [item.key for item in results] == ["in_thread","in_user"]
+        assert results[0].score == pytest.approx(1.0,abs=1e-5)
+        assert results[1].score == pytest.approx(0.5,abs=1e-5)
+    asyncio.run(main())
+
+
+def test_search_only_visits_the_namespaces_of_the_scope(monkeypatch):
+    async def main():
+        store=InMemoryStore()
+        for tenant in range(50):
+            await put(store,("long_term_memories",f"tenant{tenant}","thread"),"k",memory(f"memory of tenant {tenant}"))
+        await put(store,THREAD,"mine",memory("my own memory"))
+        index=MemoryIndex()
+        await index.aensure_loaded(store,("long_term_memories",))
+        visited=[]
+        scores=NamespaceIndex.scores
+        def counting_scores(self,*args):
+            visited.append(self)
+            return scores(self,*args)
+        monkeypatch.setattr(NamespaceIndex,"scores",counting_scores)
+        results=await index.asearch(store,USER,"my own memory",limit=5)
+        assert [item.key for item in results] == ["mine"]
+        assert visited == [index.namespaces[THREAD]]
+        recent=await index.arecent(store,USER,limit=5)
+        assert [item.key for item in recent] == ["mine"]
+    asyncio.run(main())
+
+
+def test_embeddings_are_kept_out_of_the_memory_values():
+    async def main():
+        store=InMemoryStore()
+        await put(store,THREAD,"k1",memory("pump maintenance schedule"))
+        assert (await store.aget(THREAD,"k1")).value == memory("pump maintenance schedule")
+        assert all(EMBEDDING_FIELD not in item.value for item in await store.asearch(USER,limit=10))
+        record=(await store.aget(embedding_namespace(THREAD),"k1")).value
+        assert len(record["vector"]) == 256
+        # the index reuses the stored vector instead of embedding again
+        index=MemoryIndex()
+        await index.aensure_loaded(store,USER)
+        assert index.namespaces[THREAD].items["k1"].value == memory("pump maintenance schedule")
+    asyncio.run(main())
+
+
+def test_ann_search_finds_the_exact_memory():
+    async def main():
+        store=InMemoryStore()
+        for index in range(300):
+            await put(store,THREAD,f"k{index}",memory(f"word{index} topic{index % 7} detail{index * 3}"))
+        index=MemoryIndex(ann_min_items=50,nprobe=4)
+        results=await index.asearch(store,USER,"word123 topic4 detail369",limit=3)
+        assert index.namespaces[THREAD].ann is not None
+        assert results[0].key == "k123"
+        assert results[0].score == pytest.approx(1.0,abs=1e-5)
+    asyncio.run(main())
+
+
+def test_recent_reads_newest_first_within_the_window():
+    async def main():
+        store=InMemoryStore()
+        await put(store,THREAD,"old",memory("pump alarm history","2026-01-01T00:00:00Z"))
+        await put(store,THREAD,"mid",memory("valve alarm history","2026-06-01T00:00:00Z"))
+        await put(store,OTHER_THREAD,"new",memory("boiler report","2026-10-01T00:00:00Z"))
+        index=MemoryIndex()
+        recent=await index.arecent(store,USER,limit=10)
+        assert [item.key for item in recent] == ["new","mid","old"]
+        since=datetime(2026,5,1,tzinfo=timezone.utc).timestamp()
+        assert [item.key for item in await index.arecent(store,USER,limit=10,since=since)] == ["new","mid"]
+        # with a query, similarity is blended with the recency decay
+        ranked=await index.arecent(store,USER,query="valve alarm history",limit=10,recency_weight=0.2)
+        assert ranked[0].key == "mid"
+    asyncio.run(main())
+
+
+def test_loaded_prefix_is_reloaded_after_the_refresh_interval():
+    async def main():
+        store=InMemoryStore()
+        await put(store,THREAD,"a",memory("apple pie recipe"))
+        await put(store,THREAD,"b",memory("banana bread recipe"))
+        index=MemoryIndex(refresh_seconds=0.05)
+        await index.aensure_loaded(store,USER)
+        assert sorted(index.namespaces[THREAD].items) == ["a","b"]
+        # written/deleted by another process
+        await store.adelete(THREAD,"a")
+        await put(store,THREAD,"c",memory("cherry tart recipe"))
+        await index.aensure_loaded(store,USER)
+        assert sorted(index.namespaces[THREAD].items) == ["a","b"] # still fresh
+        await asyncio.sleep(0.1)
+        await index.aensure_loaded(store,USER) # stale: reloaded in background
+        await asyncio.sleep(0.05)
+        assert sorted(index.namespaces[THREAD].items) == ["b","c"]
+    asyncio.run(main())
+
+
+def test_duplicate_detection_and_merge():
+    async def main():
+        store=InMemoryStore()
+        await put(store,THREAD,"k1",{**memory("user prefers metric units"),"user_queries":["use metric"],ACCESS_COUNT_FIELD:2})
+        index=MemoryIndex()
+        await index.aensure_loaded(store,THREAD)
+        vector=embed_memory({**memory("user prefers metric units"),"user_queries":["use metric"]})["vector"]
+        existing,similarity=index.find_duplicate(THREAD,vector,0.9)
+        assert existing.key == "k1" and similarity == pytest.approx(1.0,abs=1e-5)
+        assert index.find_duplicate(OTHER_THREAD,vector,0.9) is None
+        assert index.find_duplicate(THREAD,embed_memory(memory("boiler maintenance report"))["vector"],0.9) is None
+        stored=(await store.aget(THREAD,"k1")).value
+        merged=merge_memory_values({**memory("user prefers metric units"),"user_queries":["switch to metric"]},[stored])
+        assert merged["user_queries"] == ["switch to metric","use metric"]
+        assert merged[ACCESS_COUNT_FIELD] == 2
+    asyncio.run(main())
+
+
+def test_compaction_merges_near_duplicates_into_the_newest():
+    async def main():
+        store=InMemoryStore()
+        await put(store,THREAD,"old",{**memory("user prefers metric units","2026-01-01T00:00:00Z"),"user_queries":["q1"]})
+        await put(store,THREAD,"new",{**memory("user prefers metric units always","2026-09-01T00:00:00Z"),"user_queries":["q2"]})
+        await put(store,THREAD,"other",memory("boiler maintenance report"))
+        result=await compact_namespace(store,THREAD,0.6)
+        assert result == {"items":3,"merged":1}
+        keys=sorted(item.key for item in await store.asearch(THREAD,limit=10))
+        assert keys == ["new","other"]
+        assert await store.aget(embedding_namespace(THREAD),"old") is None
+        assert (await store.aget(THREAD,"new")).value["user_queries"] == ["q2","q1"]
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+import asyncio
+from datetime import datetime,timezone
+from langgraph.store.base import Item
+from langgraph.store.memory import InMemoryStore
+from poc.agents.memory_index import memory_index,ACCESS_COUNT_FIELD,LAST_RECALLED_FIELD
+from poc.agents.memory_retention import MemorySweeper
+
+NAMESPACE=("long_term_memories","user","thread")
+
+
+def make_item(key:str, last_updated:str, **value) -> Item:
+    now=datetime.now(timezone.utc)
+    return Item(value={"content":key,"last_updated":last_updated,**value},key=key,namespace=NAMESPACE,created_at=now,updated_at=now)
+
+
+def test_retention_is_opt_in(monkeypatch):
+    monkeypatch.delenv("MEMORY_TTL_DAYS",raising=False)
+    monkeypatch.delenv("MEMORY_MAX_PER_NAMESPACE",raising=False)
+    async def main():
+        store=InMemoryStore()
+        for index in range(5):
+            await store.aput(NAMESPACE,f"k{index}",{"content":f"memory {index}","last_updated":"2000-01-01T00:00:00Z"})
+        sweeper=MemorySweeper(store)
+        assert sweeper.ttl_days == 0 and sweeper.max_items == 0
+        report=await sweeper.sweep()
+        assert report["expired"] == report["evicted"] == 0
+        assert len(await store.asearch(NAMESPACE,limit=10)) == 5
+    asyncio.run(main())
+
+
+def test_select_reclaimable_expires_then_evicts_the_least_recalled():
+    sweeper=MemorySweeper(InMemoryStore(),ttl_days=30,max_items=2)
+    now=datetime(2026,10,19,tzinfo=timezone.utc).timestamp()
+    items=[
+        make_item("old","2020-01-01T00:00:00Z"),
+        make_item("recalled","2026-10-01T00:00:00Z",**{LAST_RECALLED_FIELD:"2026-10-18T00:00:00Z",ACCESS_COUNT_FIELD:3}),
+        make_item("never_recalled","2026-10-02T00:00:00Z"),
+        make_item("newest","2026-10-10T00:00:00Z"),
+    ]
+    expired,evicted=sweeper.select_reclaimable(items,now)
+    assert [item.key for item in expired] == ["old"]
+    assert [item.key for item in evicted] == ["never_recalled"]
+
+
+def test_flush_access_does_not_overwrite_a_concurrent_update():
+    async def main():
+        store=InMemoryStore()
+        await store.aput(NAMESPACE,"k1",{"content":"first wording"})
+        item=await store.aget(NAMESPACE,"k1")
+        memory_index.take_pending_access()
+        memory_index.record_access([item])
+        sweeper=MemorySweeper(store)
+        async with memory_index.key_lock(NAMESPACE,"k1"):
+            flush=asyncio.create_task(sweeper.flush_access())
+            await asyncio.sleep(0.01)
+            assert not flush.done() # waits for the merge holding the key
+            await store.aput(NAMESPACE,"k1",{"content":"merged wording"})
+        assert await flush == 1
+        value=(await store.aget(NAMESPACE,"k1")).value
+        assert value["content"] == "merged wording"
+        assert value[ACCESS_COUNT_FIELD] == 1
+        assert not memory_index.key_locks
+    asyncio.run(main())
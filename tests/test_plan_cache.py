@@ -0,0 +1,120 @@
+import asyncio
+import os
+import pytest
+from langchain_core import messages
+from poc.agents import plan_cache as plan_cache_module
+from poc.agents.plan_cache import PlanCache,context_digest,is_cacheable_query
+from poc.agents.plan_executer import PlanExecuter
+from poc.agents.state import PlanOutputModal
+
+QUERY="find the tag names matching pump in the north plant"
+
+
+@pytest.fixture(autouse=True)
+def fake_embed(monkeypatch,embed):
+    monkeypatch.setattr(plan_cache_module,"local_embed",embed)
+
+
+def step(step_uid:str, agent_name:str, tool_name:str, previous=()):
+    return {
+        "step_uid":step_uid,"agent_name":agent_name,"instruction":"do it","sub_steps":[],"available_tools":[tool_name],
+        "response_from_previous_step":[{"step_uid":uid,"weight":100} for uid in previous],
+        "response":messages.AIMessage(content=""),"response_token_size":None,"weight_of_current_response":None,"status":"pending",
+    }
+
+
+def make_plan() -> PlanOutputModal:
+    first="step__001_ABCD___coding_agent__FindTagNamesBySubstring"
+    return PlanOutputModal(plan=[
+        step(first,"coding_agent","FindTagNamesBySubstring"),
+        step("step__002_WXYZ___research_agent__SearchDocs","research_agent","SearchDocs",[first]),
+    ])
+
+
+def make_cache(tmp_path, **kwargs) -> PlanCache:
+    cache=PlanCache(db_file=os.path.join(tmp_path,"plan_cache.sqlite"),threshold=0.9,**kwargs)
+    cache.setup()
+    return cache
+
+
+def test_short_and_deictic_queries_are_not_cached():
+    assert not is_cacheable_query("continue")
+    assert not is_cacheable_query("yes, do it")
+    assert not is_cacheable_query("ok go ahead and do that")
+    assert is_cacheable_query(QUERY)
+
+
+def test_plans_are_keyed_on_the_conversation_context(tmp_path):
+    async def main():
+        cache=make_cache(tmp_path)
+        key=cache.cache_key("v1",context_digest(""))
+        await cache.astore(QUERY,key,make_plan().model_dump_json(),2.0)
+        plan,_=await cache.alookup(QUERY,key)
+        assert [s.agent_name for s in plan.plan] == ["coding_agent","research_agent"]
+        # same words after a different conversation, or another plan prompt version: no reuse
+        assert await cache.alookup(QUERY,cache.cache_key("v1",context_digest("Human: about the boilers"))) is None
+        assert await cache.alookup(QUERY,cache.cache_key("v2",context_digest(""))) is None
+        await cache.astore("yes, do it",key,make_plan().model_dump_json(),2.0)
+        assert len(cache.order) == 1
+        cache.close()
+    asyncio.run(main())
+
+
+def test_fresh_step_uids_keep_the_format(tmp_path):
+    async def main():
+        cache=make_cache(tmp_path)
+        key=cache.cache_key("v1",context_digest(""))
+        await cache.astore(QUERY,key,make_plan().model_dump_json(),2.0)
+        plan,_=await cache.alookup(QUERY,key)
+        first,second=plan.plan
+        assert first.step_uid.startswith("step__001_") and first.step_uid.endswith("___coding_agent__FindTagNamesBySubstring")
+        assert first.step_uid != "step__001_ABCD___coding_agent__FindTagNamesBySubstring"
+        assert second.step_uid.endswith("___research_agent__SearchDocs")
+        assert second.response_from_previous_step[0].step_uid == first.step_uid
+        cache.close()
+    asyncio.run(main())
+
+
+def test_invalidated_plan_is_forgotten_and_rows_are_pruned(tmp_path):
+    async def main():
+        cache=make_cache(tmp_path,max_entries=3)
+        key=cache.cache_key("v1",context_digest(""))
+        await cache.astore(QUERY,key,make_plan().model_dump_json(),2.0)
+        _,entry_id=await cache.alookup(QUERY,key)
+        await cache.ainvalidate(key,entry_id)
+        assert await cache.alookup(QUERY,key) is None
+        for index in range(5):
+            await cache.astore(f"{QUERY} number {index}",cache.cache_key("v1",str(index)),make_plan().model_dump_json(),1.0)
+        assert cache.conn.execute("SELECT COUNT(*) FROM plan_cache").fetchone()[0] == 3
+        assert len(cache.order) == 3
+        cache.close()
+        reopened=make_cache(tmp_path,max_entries=2)
+        assert len(reopened.order) == 2
+        assert reopened.conn.execute("SELECT COUNT(*) FROM plan_cache").fetchone()[0] == 2
+        reopened.close()
+    asyncio.run(main())
+
+
+def test_plan_is_stored_after_success_and_invalidated_after_failure(tmp_path):
+    async def main():
+        executer=PlanExecuter()
+        executer.plan_cache=make_cache(tmp_path)
+        executer.plan_prompt_version="v1"
+        conversation=[messages.HumanMessage(content=QUERY,id="m1")]
+        key=executer.get_plan_cache_key(conversation)
+        # a freshly generated plan is only stored once all its steps completed
+        plan=make_plan()
+        executer.plan_runs["t1"]={"query":QUERY,"cache_key":key,"entry_id":None,"plan_json":plan.model_dump_json(),"planning_seconds":2.0}
+        await executer.finish_plan_run("t1",plan)
+        assert await executer.plan_cache.alookup(QUERY,key) is None
+        executer.plan_runs["t1"]={"query":QUERY,"cache_key":key,"entry_id":None,"plan_json":plan.model_dump_json(),"planning_seconds":2.0}
+        for plan_step in plan.plan:
+            plan_step.status="completed"
+        await executer.finish_plan_run("t1",plan)
+        cached,entry_id=await executer.plan_cache.alookup(QUERY,key)
+        # the cached plan never reached the end of the conversation (run failed): removed
+        executer.plan_runs["t1"]={"query":QUERY,"cache_key":key,"entry_id":entry_id,"plan_json":None,"planning_seconds":0.0}
+        await executer.finish_plan_run("t1",None)
+        assert await executer.plan_cache.alookup(QUERY,key) is None
+        executer.plan_cache.close()
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+from unittest.mock import MagicMock
+from langchain_core import messages
+from langchain_core.tools import tool
+from poc.agents.utils import CachedChatBedrockConverse,PromptCacheConfig
+
+CACHE_POINT={"cachePoint":{"type":"default"}}
+
+
+@tool
+def find_tag_names(substring:str) -> str:
+    """Find the tag names containing the substring"""
+    return substring
+
+
+def make_llm(**prompt_cache) -> CachedChatBedrockConverse:
+    return CachedChatBedrockConverse(
+        model_id="us.anthropic.claude-sonnet-4-20250514-v1:0",
+        region_name="us-west-2",
+        client=MagicMock(), # the request is only built, never sent
+        prompt_cache=PromptCacheConfig(**prompt_cache),
+    )
+
+
+def conversation():
+    return [
+        messages.SystemMessage(content="static system prompt"),
+        messages.HumanMessage(content="find the pump tags"),
+        messages.AIMessage(content="",tool_calls=[{"name":"find_tag_names","args":{"substring":"pump"},"id":"call_1"}]),
+        messages.ToolMessage(content="PUMP_01, PUMP_02",tool_call_id="call_1"),
+    ]
+
+
+def build_request(llm:CachedChatBedrockConverse, chat_messages):
+    bound=llm.bind_tools([find_tag_names])
+    return llm.converse_request(chat_messages,**bound.kwargs)
+
+
+def test_cache_point_after_tools_and_system():
+    request=build_request(make_llm(system=True,tools=True),conversation())
+    tools=request["toolConfig"]["tools"]
+    assert tools[0]["toolSpec"]["name"] == "find_tag_names"
+    assert tools[-1] == CACHE_POINT
+    assert request["system"] == [{"text":"static system prompt"},CACHE_POINT]
+    # no conversation cache point for this configuration
+    assert all("cachePoint" not in block for msg in request["messages"] for block in msg["content"])
+
+
+def test_cache_point_after_last_tool_result():
+    request=build_request(make_llm(tools=True,conversation=True),conversation())
+    last=request["messages"][-1]
+    assert last["role"] == "user"
+    assert "toolResult" in last["content"][0]
+    assert last["content"][-1] == CACHE_POINT
+    # the cache point follows the tool result block, it is not inside it
+    assert all("cachePoint" not in block for block in last["content"][0]["toolResult"]["content"])
+    assert request["toolConfig"]["tools"][-1] == CACHE_POINT
+    assert "system" not in request or all("cachePoint" not in block for block in request["system"])
+
+
+def test_no_cache_points_without_config():
+    llm=make_llm()
+    llm.prompt_cache=None
+    request=build_request(llm,conversation())
+    assert CACHE_POINT not in request["toolConfig"]["tools"]
+    assert CACHE_POINT not in request["system"]
@@ -0,0 +1,237 @@
+import asyncio
+import os
+import random
+import pytest
+from poc import run_manager as run_manager_module
+from poc.run_manager import RunEventLog,RunManager
+from poc.run_coordinator import RunCoordinator,ThreadBusyError
+
+
+@pytest.fixture(autouse=True)
+def spill_dir(tmp_path,monkeypatch):
+    monkeypatch.setattr(run_manager_module,"RUN_EVENTS_DIR",str(tmp_path))
+    return tmp_path
+
+
+def events(count:int, delay:float=0.0):
+    async def generate():
+        for index in range(count):
+            if delay:
+                await asyncio.sleep(delay)
+            yield f"event {index}"
+    return generate
+
+
+async def collect(log:RunEventLog, after_seq:int=0, slow:bool=False):
+    seqs=[]
+    async for seq,_ in log.subscribe(after_seq):
+        seqs.append(seq)
+        if slow and random.random() < 0.3:
+            await asyncio.sleep(0.001)
+    return seqs
+
+
+# ---------- reserve / start ----------
+
+def test_duplicate_reserve_attaches_to_the_first_run():
+    async def main():
+        manager=RunManager()
+        run,created=manager.reserve("r1","t1")
+        duplicate,duplicate_created=manager.reserve("r1","t1")
+        assert created and not duplicate_created
+        assert duplicate is run
+        assert run.status == "reserved"
+    asyncio.run(main())
+
+
+def test_duplicate_start_executes_once():
+    async def main():
+        manager=RunManager()
+        executions=[]
+        def counted():
+            executions.append(1)
+            return events(3)()
+        run=manager.start("r1","t1",counted)
+        again=manager.start("r1","t1",counted)
+        assert again is run
+        await run.task
+        assert len(executions) == 1
+        assert run.status == "finished"
+        # a finished run is replayed, not executed again
+        replayed,created=manager.reserve("r1","t1")
+        assert replayed is run and not created
+    asyncio.run(main())
+
+
+def test_released_reservation_can_be_submitted_again():
+    async def main():
+        manager=RunManager()
+        run,_=manager.reserve("r1","t1")
+        await manager.release(run)
+        assert run.status == "cancelled"
+        retry,created=manager.reserve("r1","t1")
+        assert created and retry is not run
+    asyncio.run(main())
+
+
+def test_resume_with_the_same_run_id_is_a_new_run():
+    async def main():
+        manager=RunManager()
+        first=manager.start("r1","t1",events(2))
+        await first.task
+        # true duplicate POST of the first submission
+        duplicate,created=manager.reserve_submission("r1","t1",None)
+        assert duplicate is first and not created
+        # the UI resumes an interrupt with the same runId and forwardedProps.command.resume
+        command={"resume":"yes"}
+        resume,created=manager.reserve_submission("r1","t1",command)
+        assert created and resume is not first
+        manager.start(resume.run_id,"t1",events(2,delay=0.01))
+        # duplicate of the resume while it runs attaches to it
+        duplicate_resume,created=manager.reserve_submission("r1","t1",dict(command))
+        assert duplicate_resume is resume and not created
+        other_answer,created=manager.reserve_submission("r1","t1",{"resume":"no"})
+        assert created and other_answer is not resume
+        await resume.task
+        # the same answer to the next interrupt of the run is a new run too
+        next_resume,created=manager.reserve_submission("r1","t1",command)
+        assert created and next_resume is not resume
+    asyncio.run(main())
+
+
+# ---------- event log replay ----------
+
+def test_replay_across_memory_buffer_and_disk(spill_dir):
+    async def main():
+        log=RunEventLog("r1",max_memory_events=5,spill_dir=str(spill_dir))
+        for index in range(20):
+            await log.append(f"event {index}")
+        # nothing written yet: events 1..15 are in the write buffer, 16..20 in memory
+        assert log.written == 0 and len(log.write_buffer) == 15
+        await log.close()
+        assert await collect(log,2) == list(range(3,21))
+        await asyncio.sleep(0.05) # let the writer flush the buffer
+        assert log.written == 15 and not log.write_buffer
+        assert await collect(log) == list(range(1,21))
+        assert await collect(log,7) == list(range(8,21))
+        assert await collect(log,17) == list(range(18,21))
+        assert await collect(log,20) == []
+    asyncio.run(main())
+
+
+def test_concurrent_subscribers_get_every_event_in_order(spill_dir):
+    async def main():
+        log=RunEventLog("r1",max_memory_events=5,spill_dir=str(spill_dir))
+        async def produce():
+            for index in range(1000):
+                await log.append(f"event {index}")
+                if index % 7 == 0:
+                    await asyncio.sleep(0)
+            await log.close()
+        results=await asyncio.gather(produce(),collect(log,0,True),collect(log,0,False),collect(log,300,True))
+        assert results[1] == results[2] == list(range(1,1001))
+        assert results[3] == list(range(301,1001))
+    asyncio.run(main())
+
+
+def test_delete_removes_the_spill_file(spill_dir):
+    async def main():
+        log=RunEventLog("r1",max_memory_events=1,spill_dir=str(spill_dir))
+        for index in range(5):
+            await log.append(f"event {index}")
+        await asyncio.sleep(0.05)
+        assert os.path.exists(log.spill_file)
+        log.delete()
+        assert not os.path.exists(log.spill_file)
+    asyncio.run(main())
+
+
+# ---------- orphans / retention ----------
+
+def test_run_without_subscriber_is_cancelled_after_the_grace_period():
+    async def main():
+        manager=RunManager(orphan_grace_seconds=0.05)
+        run=manager.start("r1","t1",events(1000,delay=0.01))
+        stream=manager.stream(run)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.2)
+        assert run.status == "cancelled"
+    asyncio.run(main())
+
+
+def test_resubscribing_within_the_grace_period_keeps_the_run():
+    async def main():
+        manager=RunManager(orphan_grace_seconds=0.1)
+        run=manager.start("r1","t1",events(20,delay=0.01))
+        stream=manager.stream(run)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.02)
+        ids=[data.split("\n")[0] async for data in manager.stream(run,1)]
+        assert ids == [f"id: {seq}" for seq in range(2,21)]
+        assert run.status == "finished"
+    asyncio.run(main())
+
+
+def test_finished_runs_expire_after_the_retention_window():
+    async def main():
+        manager=RunManager(max_memory_events=1,retention_seconds=0)
+        run=manager.start("r1","t1",events(5))
+        await run.task
+        await asyncio.sleep(0.05)
+        assert os.path.exists(run.log.spill_file)
+        manager.sweep()
+        assert manager.get("r1") is None
+        assert not os.path.exists(run.log.spill_file)
+        # an expired run_id is executed again
+        _,created=manager.reserve("r1","t1")
+        assert created
+    asyncio.run(main())
+
+
+# ---------- run coordinator policies ----------
+
+def test_queue_policy_runs_the_thread_in_order():
+    async def main():
+        coordinator=RunCoordinator("queue")
+        order=[]
+        async def run(run_id):
+            async with coordinator.run("t1",run_id):
+                order.append(f"start {run_id}")
+                await asyncio.sleep(0.01)
+                order.append(f"end {run_id}")
+        await asyncio.gather(run("r1"),run("r2"),run("r3"))
+        assert order == ["start r1","end r1","start r2","end r2","start r3","end r3"]
+        assert not coordinator.is_busy("t1")
+    asyncio.run(main())
+
+
+def test_reject_policy_raises_while_the_thread_is_busy():
+    async def main():
+        coordinator=RunCoordinator("reject")
+        async with coordinator.run("t1","r1"):
+            with pytest.raises(ThreadBusyError) as error:
+                async with coordinator.run("t1","r2"):
+                    pass
+            assert error.value.active_run_id == "r1"
+            # other threads are not blocked
+            async with coordinator.run("t2","r3"):
+                pass
+    asyncio.run(main())
+
+
+def test_cancel_policy_cancels_the_active_run():
+    async def main():
+        coordinator=RunCoordinator("queue")
+        started=asyncio.Event()
+        async def long_run():
+            async with coordinator.run("t1","r1"):
+                started.set()
+                await asyncio.sleep(10)
+        first=asyncio.create_task(long_run())
+        await started.wait()
+        async with coordinator.run("t1","r2","cancel"):
+            assert coordinator.active_run_id("t1") == "r2"
+        assert first.cancelled()
+    asyncio.run(main())
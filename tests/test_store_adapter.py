@@ -0,0 +1,81 @@
+import asyncio
+from langgraph.store.base import GetOp
+from langgraph.store.memory import InMemoryStore
+from poc.agents.store_adapter import CachedStore
+
+NAMESPACE=("long_term_memories","user","thread")
+PREFIX=("long_term_memories","user")
+
+
+class CountingStore(InMemoryStore):
+    """InMemoryStore recording every abatch call, a get of the key "bad" fails the whole batch"""
+
+    def __init__(self):
+        super().__init__()
+        self.batches=[]
+
+    async def abatch(self, ops):
+        ops=list(ops)
+        self.batches.append(ops)
+        await asyncio.sleep(0)
+        if any(isinstance(op,GetOp) and op.key == "bad" for op in ops):
+            raise ValueError("bad key")
+        return await super().abatch(ops)
+
+
+def make_store():
+    inner=CountingStore()
+    return inner,CachedStore(inner,cache_size=32,cache_ttl_seconds=60,batch_window_seconds=0)
+
+
+def test_concurrent_ops_are_sent_as_one_batch():
+    async def main():
+        inner,store=make_store()
+        await asyncio.gather(*[store.aput(NAMESPACE,f"k{index}",{"v":index}) for index in range(5)])
+        assert len(inner.batches) == 1
+        assert len(inner.batches[0]) == 5
+        items=await asyncio.gather(*[store.aget(NAMESPACE,f"k{index}") for index in range(5)])
+        assert [item.value["v"] for item in items] == list(range(5))
+        assert len(inner.batches) == 2
+    asyncio.run(main())
+
+
+def test_repeated_reads_hit_the_cache():
+    async def main():
+        inner,store=make_store()
+        await store.aput(NAMESPACE,"k1",{"v":1})
+        calls=len(inner.batches)
+        first=await store.aget(NAMESPACE,"k1")
+        second=await store.aget(NAMESPACE,"k1")
+        assert first.value == second.value == {"v":1}
+        first_search=await store.asearch(PREFIX,limit=10)
+        second_search=await store.asearch(PREFIX,limit=10)
+        assert len(first_search) == len(second_search) == 1
+        assert len(inner.batches) == calls+2 # one get and one search reached the store
+    asyncio.run(main())
+
+
+def test_put_invalidates_get_and_search():
+    async def main():
+        inner,store=make_store()
+        await store.aput(NAMESPACE,"k1",{"v":1})
+        assert (await store.aget(NAMESPACE,"k1")).value == {"v":1}
+        assert len(await store.asearch(PREFIX,limit=10)) == 1
+        await store.aput(NAMESPACE,"k1",{"v":2})
+        await store.aput(NAMESPACE,"k2",{"v":3})
+        assert (await store.aget(NAMESPACE,"k1")).value == {"v":2}
+        assert len(await store.asearch(PREFIX,limit=10)) == 2
+        await store.adelete(NAMESPACE,"k1")
+        assert await store.aget(NAMESPACE,"k1") is None
+        assert len(await store.asearch(PREFIX,limit=10)) == 1
+    asyncio.run(main())
+
+
+def test_failing_op_only_fails_its_caller():
+    async def main():
+        inner,store=make_store()
+        await store.aput(NAMESPACE,"k1",{"v":1})
+        good,bad=await asyncio.gather(store.aget(NAMESPACE,"k1"),store.aget(NAMESPACE,"bad"),return_exceptions=True)
+        assert good.value == {"v":1}
+        assert isinstance(bad,ValueError)
+    asyncio.run(main())
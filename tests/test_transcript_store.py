@@ -0,0 +1,56 @@
+import os
+from langchain_core import messages
+from poc.agents.transcript_store import TranscriptStore
+
+
+def make_store(tmp_path, **kwargs) -> TranscriptStore:
+    store=TranscriptStore(os.path.join(tmp_path,"transcript.sqlite"),**kwargs)
+    store.setup()
+    return store
+
+
+def human(message_id:str) -> messages.HumanMessage:
+    return messages.HumanMessage(content=f"message {message_id}",id=message_id)
+
+
+def test_append_is_idempotent_by_message_id(tmp_path):
+    store=make_store(tmp_path)
+    try:
+        assert store.append("t1",[human("m1"),human("m2")]) == 2
+        # re-appending stored messages (retry, replayed node) is a no-op
+        assert store.append("t1",[human("m1"),human("m2")]) == 2
+        assert store.append("t1",[human("m2"),human("m3")]) == 3
+        assert [msg.id for msg in store.read("t1")] == ["m1","m2","m3"]
+        assert [msg.id for msg in store.read("t1",after_seq=1)] == ["m2","m3"]
+        assert store.seq_of("t1","m3") == 3
+        assert store.seq_of("t1","unknown") is None
+        assert store.last_message_id("t1") == "m3"
+        # threads are independent
+        assert store.append("t2",[human("m1")]) == 1
+    finally:
+        store.close()
+
+
+def test_evicted_threads_are_reloaded_from_sqlite(tmp_path):
+    store=make_store(tmp_path,max_threads=1)
+    try:
+        store.append("t1",[human("m1")])
+        store.append("t2",[human("m1")])
+        assert list(store.ids) == ["t2"] and list(store.last_seq) == ["t2"]
+        assert store.contains("t1","m1")
+        assert store.append("t1",[human("m1"),human("m2")]) == 2
+        assert [msg.id for msg in store.read("t1")] == ["m1","m2"]
+    finally:
+        store.close()
+
+
+def test_reopened_store_keeps_the_cursor(tmp_path):
+    store=make_store(tmp_path)
+    store.append("t1",[human("m1"),human("m2")])
+    store.close()
+    store=make_store(tmp_path)
+    try:
+        assert store.count("t1") == 2
+        assert store.append("t1",[human("m2"),human("m3")]) == 3
+    finally:
+        store.close()